@@ -0,0 +1,25 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+export async function GET(request: NextRequest, { params }: { params: { id: string } }) {
+  try {
+    const response = await fetch(`http://127.0.0.1:5000/api/jobs/${encodeURIComponent(params.id)}/events`, {
+      cache: 'no-store',
+    });
+
+    if (!response.ok || !response.body) {
+      const errorData = await response.json();
+      return NextResponse.json(errorData, { status: response.status });
+    }
+
+    // Relay the Server-Sent Events stream as-is
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        Connection: 'keep-alive',
+      },
+    });
+  } catch (error) {
+    return NextResponse.json({ error: error instanceof Error ? error.message : 'Could not stream job' }, { status: 500 });
+  }
+}
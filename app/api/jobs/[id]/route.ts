@@ -0,0 +1,23 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+async function forward(method: string, id: string) {
+  const response = await fetch(`http://127.0.0.1:5000/api/jobs/${encodeURIComponent(id)}`, { method });
+  const data = await response.json();
+  return NextResponse.json(data, { status: response.status });
+}
+
+export async function GET(request: NextRequest, { params }: { params: { id: string } }) {
+  try {
+    return await forward('GET', params.id);
+  } catch (error) {
+    return NextResponse.json({ error: error instanceof Error ? error.message : 'Could not load job' }, { status: 500 });
+  }
+}
+
+export async function DELETE(request: NextRequest, { params }: { params: { id: string } }) {
+  try {
+    return await forward('DELETE', params.id);
+  } catch (error) {
+    return NextResponse.json({ error: error instanceof Error ? error.message : 'Could not cancel job' }, { status: 500 });
+  }
+}
@@ -0,0 +1,26 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+export async function POST(request: NextRequest) {
+  try {
+    const body = await request.json();
+
+    if (!body?.url) {
+      return NextResponse.json({ error: 'URL is required' }, { status: 400 });
+    }
+
+    // Queue the scrape; the backend answers immediately with a job id
+    const response = await fetch('http://127.0.0.1:5000/api/jobs', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body),
+    });
+
+    const data = await response.json();
+    return NextResponse.json(data, { status: response.status });
+  } catch (error) {
+    console.error('Error creating scrape job:', error);
+    return NextResponse.json({ error: error instanceof Error ? error.message : 'Could not create job' }, { status: 500 });
+  }
+}
@@ -0,0 +1,36 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+export async function POST(request: NextRequest) {
+  try {
+    const { urls } = await request.json();
+
+    if (!Array.isArray(urls) || urls.length === 0) {
+      return NextResponse.json({ error: 'A non-empty list of URLs is required' }, { status: 400 });
+    }
+
+    // Forward the whole batch in one call; the backend handles concurrency and politeness
+    const response = await fetch('http://127.0.0.1:5000/api/scrape/batch', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ urls }),
+    });
+
+    if (!response.ok || !response.body) {
+      const errorData = await response.json();
+      return NextResponse.json(errorData, { status: response.status });
+    }
+
+    // Pass the NDJSON stream straight through so results arrive as each URL finishes
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': 'application/x-ndjson',
+        'Cache-Control': 'no-cache',
+      },
+    });
+  } catch (error) {
+    console.error('Error during batch scraping:', error);
+    return NextResponse.json({ error: error instanceof Error ? error.message : 'Batch scraping failed' }, { status: 500 });
+  }
+}
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from pymongo import MongoClient
 from bson import ObjectId
@@ -6,27 +6,48 @@ import os
 from datetime import datetime
 import json
 import requests
-from bs4 import BeautifulSoup
 import urllib.parse
 import logging
 import asyncio
 import time
 import random
-from playwright.sync_api import sync_playwright
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
+import re
+import atexit
+from browser_pool import get_browser_pool, browser_pool_stats, shutdown_browser_pool
+from http_client import get_fetch_client, fetch_client_stats, close_fetch_client, ContentTypeRejected
+from batch import get_batch_engine
+from extraction import make_soup, extract_page
+from strategy import get_strategy_table, domain_of
+from site_templates import get_template_registry
+from readiness import wait_for_page_ready, wait_for_driver_ready
+from history import (get_history_writer, history_writer_stats, close_history_writer, history_document,
+                     ensure_indexes as ensure_history_indexes, query_history)
+from snapshots import get_snapshot_writer, close_snapshot_writer, snapshot_store_stats
+from export import (FORMATS as EXPORT_FORMATS, parse_fields as parse_export_fields, parse_date, build_query as build_export_query,
+                    iter_documents as iter_export_documents, export_stream, parquet_available, to_json_safe)
+from metrics import (StageTimings, ENGINE_ATTEMPTS, FALLBACKS, BLOCKED_PAGES, FETCHED_BYTES, PAGE_VERDICTS,
+                     REGISTRY as METRICS, render_metrics)
+from page_classifier import PageClassifier, STATIC as STATIC_PAGE
+from crawl import get_crawl_manager, shutdown_crawl_manager, make_settings as make_crawl_settings, CrawlLimitReached
+from jobs import get_job_manager, job_manager_stats, shutdown_job_manager, job_to_json, QueueFull, JobCancelled, TERMINAL_STATUSES
+from interception import (get_profile as get_render_profile, install_interception, selenium_blocked_patterns,
+                          record_totals as record_interception_totals, interception_totals)
+from response_cache import get_response_cache, HIT as CACHE_HIT, MISS as CACHE_MISS, REVALIDATED as CACHE_REVALIDATED
+from drivers import resolve_chromedriver, reset_chromedriver
+from extraction_pool import (get_extraction_pool, extraction_pool_stats, shutdown_extraction_pool, ExtractionError,
+                             ExtractionTimeout)
+from monitor import (get_watch_manager, watch_manager_stats, shutdown_watch_manager, make_settings as make_watch_settings,
+                     UNCHANGED, OUTCOMES as WATCH_OUTCOMES)
+# Selenium and Playwright are imported where they are used, so workers that never
+# fall back to a browser do not pay for loading them
 import jwt  # PyJWT library
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
 import certifi
 import hashlib
-import json as json_lib
+import hmac
+from functools import wraps
 
 # Load environment variables from the same directory as this file
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -37,406 +58,1044 @@ CORS(app)  # Enable CORS for all routes
 
 # MongoDB setup
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
-try:
-    # Use certifi to ensure reliable SSL connections, especially for MongoDB Atlas
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, tlsCAFile=certifi.where())
-    client.server_info()  # Will throw an exception if not connected
-    db = client['scrapeflow_db']
-    scraping_jobs_collection = db['scraping_jobs']
-    logging.info("Connected to MongoDB successfully")
-except Exception as e:
-    logging.error(f"Could not connect to MongoDB: {e}")
-    client = None
-    db = None
-    scraping_jobs_collection = None
-
-# Custom JSON encoder to handle ObjectId
-from bson import json_util
+client = db = scraping_jobs_collection = None
 
-def create_json_response(data):
-    """Custom function to handle JSON serialization with ObjectId support"""
-    return json.loads(json_util.dumps(data))
+def connect_database():
+    """(Re)open the MongoDB connection; forked server workers call this for a client of their own"""
+    global client, db, scraping_jobs_collection
+    try:
+        # Use certifi to ensure reliable SSL connections, especially for MongoDB Atlas
+        # Bounded, since every server worker waits for this before serving
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=int(os.getenv('MONGO_TIMEOUT_MS', '5000')),
+                             tlsCAFile=certifi.where())
+        client.server_info()  # Will throw an exception if not connected
+        db = client['scrapeflow_db']
+        scraping_jobs_collection = db['scraping_jobs']
+        ensure_history_indexes(scraping_jobs_collection)
+        logging.info("Connected to MongoDB successfully")
+    except Exception as e:
+        logging.error(f"Could not connect to MongoDB: {e}")
+        client = None
+        db = None
+        scraping_jobs_collection = None
 
-@app.route('/', methods=['GET'])
-def health_check():
-    return jsonify({'status': 'ScrapeFlow backend is running', 'timestamp': datetime.utcnow().isoformat()})
+connect_database()
 
-@app.route('/api/scrape', methods=['POST'])
-def scrape_url():
-    try:
-        data = request.json
-        if not data or 'url' not in data:
-            return jsonify({'error': 'URL is required'}), 400
+def create_json_response(data):
+    """Convert ObjectIds and datetimes to strings so documents can go through jsonify"""
+    return to_json_safe(data)
+
+def render_with_playwright(url, user_agent, headers, profile):
+    """Render a page on a pooled, pre-warmed browser and return (html, title, interception stats)"""
+    def _render(context):
+        # Requests the profile does not need (media, fonts, trackers...) are aborted
+        interception = install_interception(context, url, profile)
+        page = context.new_page()
         
-        url = data['url']
+        # Enhanced stealth
+        page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        page.set_extra_http_headers(headers)
         
-        # Validate URL
-        parsed_url = urllib.parse.urlparse(url)
-        if not parsed_url.scheme or not parsed_url.netloc:
-            return jsonify({'error': 'Invalid URL format'}), 400
+        # Navigate, then wait only as long as the page actually needs: network idle,
+        # DOM quiescence, lazy-content scrolling and cookie banner share one budget
+        page.goto(url, wait_until="domcontentloaded", timeout=60000)
+        wait_for_page_ready(page)
+
+        content = page.content()
         
-        # Enhanced scraping logic with smart anti-bot detection
-        # Use hardcoded list for stability instead of fake_useragent which may fail
-        USER_AGENTS = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:121.0) Gecko/20100101 Firefox/121.0',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0'
-        ]
+        # Extract Data using Playwright (more reliable for Shadow DOM/SPAs)
+        # We'll use BS4 on the rendered content (Light DOM) which usually contains the hydrated elements
+        # But for Title, we prefer JS evaluation
+        title = page.title()
+        if not title or title == "YouTube":
+             title = page.evaluate("() => document.querySelector('meta[property=\"og:title\"]')?.content || document.title")
+        record_interception_totals(interception)
+        return content, title, interception.to_dict()
+
+    # Use Firefox for better stealth; each render gets its own isolated context
+    return get_browser_pool().run(_render, context_options={
+        'user_agent': user_agent,
+        'viewport': {'width': 1920, 'height': 1080},
+        'locale': 'en-US',
+        'timezone_id': 'America/New_York',
+        'java_script_enabled': True
+    })
+
+def render_with_selenium(url, user_agent, profile):
+    """Render a page in a throwaway headless Chrome and return (html, title)"""
+    from selenium import webdriver
+    from selenium.common.exceptions import SessionNotCreatedException
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument(f"user-agent={user_agent}")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"]) 
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    
+    # The driver path is resolved once and cached on disk; see drivers.py
+    try:
+        driver = webdriver.Chrome(service=Service(resolve_chromedriver()), options=chrome_options)
+    except SessionNotCreatedException:
+        # Usually a cached driver older than the installed Chrome: resolve a fresh one, once
+        reset_chromedriver()
+        driver = webdriver.Chrome(service=Service(resolve_chromedriver()), options=chrome_options)
+    try:
+        # Approximate the interception profile with Chrome's URL block list
+        patterns = selenium_blocked_patterns(profile)
+        if patterns:
+            try:
+                driver.execute_cdp_cmd('Network.enable', {})
+                driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+            except Exception as e:
+                logging.debug(f"Could not set Selenium URL blocking: {e}")
         
-        # Randomize headers for every request
-        user_agent = random.choice(USER_AGENTS)
-        headers = {
-            'User-Agent': user_agent,
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1',
-            'Cache-Control': 'max-age=0',
-        }
+        # Stealth script
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         
-        logging.info(f"Scraping {url} with User-Agent: {user_agent[:30]}...")
+        driver.get(url)
+        wait_for_driver_ready(driver)
         
+        return driver.page_source, driver.title
+    finally:
+        driver.quit()
+
+@app.route('/', methods=['GET'])
+@app.route('/healthz', methods=['GET'])
+def health_check():
+    return jsonify({'status': 'ScrapeFlow backend is running', 'timestamp': datetime.utcnow().isoformat()})
+
+@app.route('/readyz', methods=['GET'])
+def readiness_check():
+    """Whether this worker should receive traffic.
+
+    Not ready while shutting down, or when the database it connected to at
+    startup stops answering. The browser pool is reported but not required:
+    static scrapes still work without it.
+    """
+    ready = not shutting_down
+    checks = {'shuttingDown': shutting_down}
+    if client is None:
+        checks['database'] = 'unavailable'
+    else:
         try:
-            # Use a session to maintain cookies
-            session = requests.Session()
-            response = session.get(url, headers=headers, timeout=20)
-            
-            # Smart content check for blocking
-            # Even if status is 200, the content might be a CAPTCHA or blocking page
-            page_text_lower = response.text.lower()
-            blocking_keywords = [
-                'captcha', 'robot check', 'security check', 'access denied', 
-                'automated access', 'please verify you are a human', 'shield square',
-                'before you continue', 'accept all', 'reject all', 'cookie policy'
-            ]
-            is_blocked = any(keyword in page_text_lower for keyword in blocking_keywords)
-            
-            # Parse the HTML content from regular request
-            soup = BeautifulSoup(response.content, 'html.parser')
+            client.admin.command('ping')
+            checks['database'] = 'ok'
+        except Exception as e:
+            checks['database'] = f'error: {e}'
+            ready = False
+    pool = browser_pool_stats()
+    checks['browserPool'] = f"{pool['alive']}/{pool['size']} alive" if pool.get('started') else 'not started'
+    return jsonify({'ready': ready, 'checks': checks}), 200 if ready else 503
+
+# Enhanced scraping logic with smart anti-bot detection
+# Use hardcoded list for stability instead of fake_useragent which may fail
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0'
+]
+
+# Pages larger than this are truncated while streaming instead of held whole in memory
+FETCH_MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', str(10 * 1024 * 1024)))
+
+
+class ScrapeError(Exception):
+    """A scrape that failed in a way the client should see, with its HTTP status"""
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def describe_scrape_error(e):
+    """Map an exception raised while scraping to (error message, HTTP status)"""
+    if isinstance(e, ScrapeError):
+        return e.message, e.status_code
+    if isinstance(e, requests.exceptions.RequestException):
+        return f'Request error: {str(e)}', 500
+    return f'Scraping failed: {str(e)}', 500
+
+def validate_url(url):
+    """Return an error message for an unusable URL, or None"""
+    if not isinstance(url, str):
+        return 'Invalid URL format'
+    parsed_url = urllib.parse.urlparse(url)
+    if not parsed_url.scheme or not parsed_url.netloc:
+        return 'Invalid URL format'
+    return None
+
+def validate_max_age(max_age):
+    """Return an error message for an unusable max_age (seconds), or None"""
+    if max_age is not None and (not isinstance(max_age, int) or isinstance(max_age, bool) or max_age < 0):
+        return 'max_age must be a non-negative integer'
+    return None
+
+def request_user_id():
+    """Id of the user whose bearer token came with the request, or None"""
+    token = request.headers.get('Authorization', '')
+    if not token.startswith('Bearer '):
+        return None
+    try:
+        return jwt.decode(token.split(' ', 1)[1], SECRET_KEY, algorithms=['HS256']).get('user_id')
+    except jwt.InvalidTokenError:
+        return None
+
+# Shared secret for /api/admin/*; without one the admin API is switched off
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+def admin_required(view):
+    """Reject requests that do not carry ADMIN_TOKEN in an X-Admin-Token header"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin API is disabled; set ADMIN_TOKEN to enable it'}), 403
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode()):
+            return jsonify({'error': 'Admin token required'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def parse_and_extract(html, url, title, engine, timings):
+    """Parse a page and run the extractors, on the extraction pool when there is one"""
+    pool = get_extraction_pool()
+    if pool is None:
+        with timings.stage('parse', engine):
+            soup = make_soup(html)
+        with timings.stage('extract', engine):
+            return extract_page(soup, url, title, html)
+    try:
+        extraction, parse_seconds, extract_seconds = pool.extract(html, url, title)
+    except ExtractionTimeout as e:
+        timings.finish(engine, 'timeout')
+        raise ScrapeError(f'{e}; the page is too large or complex to extract', 504)
+    except ExtractionError as e:
+        timings.finish(engine, 'failed')
+        raise ScrapeError(f'Extraction failed: {e}', 500)
+    timings.add('parse', parse_seconds, engine)
+    timings.add('extract', extract_seconds, engine)
+    return extraction
+
+def record_history(result, url, user):
+    """Give result an id of its own and queue its history document; returns result.
+
+    Cached results are copied and recorded again on every hit or revalidation,
+    so each request gets an id that points at its own history entry.
+    """
+    # Store in MongoDB for history if available; the write happens off the request path
+    history = get_history_writer(scraping_jobs_collection)
+    if history is not None:
+        doc = history_document(result, user)
+        result['id'] = str(doc['_id'])
+        history.add(doc)
+    else:
+        # Generate a simple ID if no database is available
+        result['id'] = str(url.__hash__())
+    return result
+
+def scrape_page(url, max_age=None, render_profile=None, progress=None, user=None, timings=None, discovered=None,
+                change_detector=None):
+    """Fetch, render if needed and extract one URL; raises ScrapeError on failure.
+
+    Returns (result, cache_status). A cached result is reused while fresh
+    (max_age, in seconds, can only shorten that); a stale one is revalidated
+    with a conditional GET and reused on 304 without rendering or extraction.
+    render_profile names the interception profile for browser renders.
+    progress(stage, **info), when given, is called as each stage starts
+    (fetch, render, extract, store) and may raise to abort the scrape.
+    Every result, cached ones included, is saved to history in the background
+    under an id of its own, tagged with user; watch checks (change_detector)
+    skip that for cached and revalidated pages, which did not change.
+    Stage durations go to the metrics registry and, when given, to timings.
+    A discovered list, when given, receives every absolute link on a freshly
+    extracted page (result['links'] is capped); crawls use it.
+    A change_detector (see monitor.py) is asked about the page before it is
+    parsed and again before it is stored; when it reports no change the
+    scrape stops there and returns (cached result or None, UNCHANGED).
+    """
+    report = progress or (lambda stage, **info: None)
+    timings = timings if timings is not None else StageTimings()
+
+    def served_from_cache(result):
+        # Watch checks only store pages that changed, and a cached page did not
+        if change_detector is not None:
+            return dict(result)
+        return record_history(dict(result), url, user)
+
+    profile = get_render_profile(render_profile)
+    cache = get_response_cache()
+    with timings.stage('cache'):
+        cached = cache.get(url)
+    if cached is not None and cached.is_fresh(max_age):
+        cache.record(CACHE_HIT)
+        timings.finish('cache', 'hit')
+        return served_from_cache(cached.result), CACHE_HIT
+    
+    # Randomize headers for every request
+    user_agent = random.choice(USER_AGENTS)
+    headers = {
+        'User-Agent': user_agent,
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'none',
+        'Sec-Fetch-User': '?1',
+        'Cache-Control': 'max-age=0',
+    }
+    
+    logging.info(f"Scraping {url} with User-Agent: {user_agent[:30]}...")
+    
+    # Engines this domain is known to need, cheapest first; see strategy.py
+    domain = domain_of(url)
+    strategy = get_strategy_table()
+    plan = strategy.plan(domain)
+    engines = plan['order']
+    # A conditional GET can save the whole render, so keep it while we hold validators
+    if cached is not None and cached.conditional_headers() and 'static' not in engines:
+        engines = ['static'] + engines
+    if plan['reason'] == 'learned':
+        logging.info(f"Strategy table for {domain}: going straight to {engines[0]}")
+    
+    def unchanged(engine, started=None):
+        # The watch already holds this page; nothing to parse, extract or store
+        if started is not None:
+            strategy.record(domain, engine, True, (time.monotonic() - started) * 1000)
+            ENGINE_ATTEMPTS.inc(engine=engine, outcome='ok')
+        timings.finish(engine, 'unchanged')
+        return (cached.result if cached is not None else None), UNCHANGED
+    
+    is_blocked = False
+    response = None
+    extraction = None
+    render_stats = None
+    page_html = page_title = None
+    errors = {}
+    for engine in engines:
+        started = time.monotonic()
+        try:
+            if engine == 'static':
+                report('fetch')
+                # Shared client reuses per-host keep-alive connections across scrapes
+                fetch_headers = dict(headers, **cached.conditional_headers()) if cached is not None else headers
+                # Classifies the body as it streams in and cuts the download short for app shells
+                classifier = PageClassifier()
+                try:
+                    response = get_fetch_client().fetch_page(url, headers=fetch_headers, timeout=20, max_bytes=FETCH_MAX_BYTES,
+                                                             inspect=classifier.inspect)
+                except Exception:
+                    timings.add('connect', time.monotonic() - started, engine, 'error')
+                    raise
+                timings.add('connect', response.connect_seconds, engine)
+                timings.add('download', response.download_seconds, engine)
+                FETCHED_BYTES.inc(len(response.body))
+                
+                # Unchanged since we stored it: skip parsing, rendering and extraction entirely
+                if response.status_code == 304 and cached is not None:
+                    strategy.record(domain, engine, True, (time.monotonic() - started) * 1000)
+                    ENGINE_ATTEMPTS.inc(engine=engine, outcome='ok')
+                    cache.record(CACHE_REVALIDATED)
+                    timings.finish(engine, 'revalidated')
+                    return served_from_cache(cache.refresh(cached, response.headers).result), CACHE_REVALIDATED
+                
+                # Smart content check for blocking and JS-heavy pages, on the raw bytes
+                # Even if status is 200, the content might be a CAPTCHA or blocking page,
+                # and pages headed for a browser should not be parsed here at all
+                with timings.stage('classify', engine):
+                    page_class = classifier.classify(response.body)
+                is_blocked = page_class.blocked
+                if is_blocked:
+                    BLOCKED_PAGES.inc()
+                PAGE_VERDICTS.inc(verdict=page_class.verdict)
+                if page_class.verdict != STATIC_PAGE:
+                    logging.info(f"Standard request returned a page to render ({page_class.reason}). Switching to advanced scraping...")
+                    raise Exception(f"Page needs rendering: {page_class.reason}")
+                page_text = response.text
+                if change_detector is not None and change_detector.body_unchanged(page_text):
+                    return unchanged(engine, started)
+                
+                # Parse the HTML content from regular request and extract in a single pass;
+                # the body is decoded once and the same text is handed to the parser
+                report('extract', engine=engine)
+                extraction = parse_and_extract(page_text, url, None, engine, timings)
+                page_html, page_title = page_text, None
+                
+                # The parser can disagree with the byte-level count on broken markup,
+                # so very little extracted content (likely a JS wrapper or skeleton) still forces advanced scraping
+                if extraction.anchor_count < 5 or extraction.image_count < 2:
+                     logging.info("Standard request returned low content (likely SPA/JS-heavy). Switching to advanced scraping...")
+                     raise Exception("Low content detected")
             
-            # Initial extraction to check quality
-            temp_links = soup.find_all('a', href=True)
-            temp_images = soup.find_all('img')
+            elif engine == 'playwright':
+                # Method 1: Playwright (most effective for JavaScript-heavy sites)
+                logging.info("Attempting Playwright scraping...")
+                report('render', engine=engine)
+                with timings.stage('render', engine):
+                    content, title, render_stats = render_with_playwright(url, user_agent, headers, profile)
+                if change_detector is not None and change_detector.body_unchanged(content):
+                    return unchanged(engine, started)
+                report('extract', engine=engine)
+                extraction = parse_and_extract(content, url, title, engine, timings)
+                page_html, page_title = content, title
+                
+                # Validate the Playwright result too
+                if extraction.anchor_count < 5:
+                     logging.warning("Playwright also returned low content.")
             
-            # If we got very little content (likely a JS wrapper or skeleton), force advanced scraping
-            # YouTube/SPA detection: High text count (scripts) but low link/image count
-            if len(temp_links) < 5 or len(temp_images) < 2:
-                 logging.info("Standard request returned low content (likely SPA/JS-heavy). Switching to advanced scraping...")
-                 raise Exception("Low content detected")
-
+            else:
+                # Method 2: Selenium as the last resort
+                logging.info("Attempting Selenium scraping...")
+                report('render', engine=engine)
+                with timings.stage('render', engine):
+                    content, title = render_with_selenium(url, user_agent, profile)
+                if change_detector is not None and change_detector.body_unchanged(content):
+                    return unchanged(engine, started)
+                report('extract', engine=engine)
+                extraction = parse_and_extract(content, url, title, engine, timings)
+                page_html, page_title = content, title
+        
+        except ContentTypeRejected as e:
+            # Images, PDFs and other downloads will not turn into pages in a browser either
+            timings.finish(engine, 'rejected')
+            raise ScrapeError(f'{e} (only web pages can be scraped)', 415)
+        except (JobCancelled, ScrapeError):
+            raise
         except Exception as e:
-            # Fallback block - Catches both Request errors and our custom "Low content" exception
+            strategy.record(domain, engine, False, (time.monotonic() - started) * 1000)
+            ENGINE_ATTEMPTS.inc(engine=engine, outcome='failed')
+            if engine != engines[-1]:
+                FALLBACKS.inc(engine=engine)
+            errors[engine] = e
+            extraction = None
             if isinstance(e, requests.exceptions.Timeout):
                 error_msg = 'Request timed out'
             elif isinstance(e, requests.exceptions.ConnectionError):
                 error_msg = 'Connection error'
             else:
-                 error_msg = str(e)
-            
-            logging.info(f"Standard scraping failed/insufficient: {error_msg}. Starting Playwright...")
-
-            # Method 1: Try with Playwright (most effective for JavaScript-heavy sites)
-            try:
-                logging.info("Attempting Playwright scraping...")
-                with sync_playwright() as p:
-                    # Use Firefox for better stealth
-                    browser = p.firefox.launch(headless=True)
-                    context = browser.new_context(
-                        user_agent=user_agent,
-                        viewport={'width': 1920, 'height': 1080},
-                        locale='en-US',
-                        timezone_id='America/New_York',
-                        java_script_enabled=True
-                    )
-                    
-                    page = context.new_page()
-                    
-                    # Enhanced stealth
-                    page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-                    page.set_extra_http_headers(headers)
-                    
-                    # Navigate and Wait
-                    page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                    page.wait_for_timeout(3000) # Give JS time to hydrate
-                    
-                    # Scroll to load lazy content
-                    for _ in range(3):
-                        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                        page.wait_for_timeout(1000)
-                    
-                    # Cookie Handling
-                    try:
-                        page.click('button[aria-label*="Accept"], span:has-text("Accept all")', timeout=2000)
-                    except:
-                        pass
-
-                    content = page.content()
-                    
-                    # Extract Data using Playwright (more reliable for Shadow DOM/SPAs)
-                    # We'll use BS4 on the rendered content (Light DOM) which usually contains the hydrated elements
-                    # But for Title, we prefer JS evaluation
-                    title = page.title()
-                    if not title or title == "YouTube":
-                         title = page.evaluate("() => document.querySelector('meta[property=\"og:title\"]')?.content || document.title")
-                    
-                    browser.close()
-                    
-                    soup = BeautifulSoup(content, 'html.parser')
-                    
-                    # Validate the Playwright result too
-                    if len(soup.find_all('a', href=True)) < 5:
-                         logging.warning("Playwright also returned low content.")
-                    
-            except Exception as playwright_error:
-                logging.warning(f"Playwright failed: {playwright_error}")
-                # Method 2: Try Selenium as fallback
-                try:
-                    logging.info("Attempting Selenium scraping...")
-                    chrome_options = Options()
-                    chrome_options.add_argument("--headless")
-                    chrome_options.add_argument(f"user-agent={user_agent}")
-                    chrome_options.add_argument("--no-sandbox")
-                    chrome_options.add_argument("--disable-dev-shm-usage")
-                    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-                    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"]) 
-                    chrome_options.add_experimental_option('useAutomationExtension', False)
-                    
-                    # Use webdriver-manager
-                    service = Service(ChromeDriverManager().install())
-                    driver = webdriver.Chrome(service=service, options=chrome_options)
-                    
-                    # Stealth script
-                    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-                    
-                    driver.get(url)
-                    
-                    time.sleep(random.uniform(3, 6))
-                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                    time.sleep(2)
-                    
-                    content = driver.page_source
-                    title = driver.title
-                    driver.quit()
-                    
-                    soup = BeautifulSoup(content, 'html.parser')
-                    
-                except Exception as selenium_error:
-                    logging.error(f"All scraping methods failed. Playwright: {playwright_error}, Selenium: {selenium_error}")
-                    if is_blocked:
-                         return jsonify({'error': 'Access denied by website security. Try a different URL or wait a moment.'}), 403
-                    return jsonify({'error': 'Failed to retrieve content. The website may be protected.'}), 500
-
-        else:  # This else belongs to the main try block (line 106)
-            # This executes when the initial request succeeds without throwing an exception
-            # In this case, soup has already been defined on line 122
-            # So we don't need to re-parse, it's already done
-            pass  # soup is already defined from line 122
-
-        # The extraction code continues after this point
-        # Extract relevant information
-        # If title was already extracted via Playwright, use it; otherwise extract from soup
-        if 'title' not in locals() or not title or title == 'No title':
-            title_tag = soup.find('meta', property='og:title') or soup.find('meta', attrs={'name': 'twitter:title'}) or soup.title
-            title = title_tag['content'] if title_tag and hasattr(title_tag, 'content') else (title_tag.string if title_tag else 'No title')
-        
-        # Extract all text
-        text_content = soup.get_text(strip=True, separator=' ')
-        
-        # Extract all links
-        links = []
-        for link in soup.find_all('a', href=True):
-            link_url = link['href']
-            # Filter out empty or javascript links
-            if not link_url or link_url.startswith('javascript:') or link_url == '#':
-                continue
-                
-            if link_url.startswith('/'):
-                # Convert relative URLs to absolute
-                link_url = urllib.parse.urljoin(url, link_url)
-            
-            link_text = link.get_text(strip=True)
-            # Fallback for image-only links
-            if not link_text:
-                img = link.find('img')
-                if img:
-                    link_text = img.get('alt') or 'Image Link'
-            
-            if link_text:
-                links.append({
-                    'text': link_text[:100], # Trucate long text
-                    'url': link_url
-                })
-        
-        # Extract all images - Enhanced
-        images = []
-        # Check for standard img tags
-        for img in soup.find_all('img'):
-            img_src = img.get('src') or img.get('data-src') or img.get('data-original')
-            if img_src and not img_src.startswith('data:'): # Skip base64
-                if img_src.startswith('/'):
-                    img_src = urllib.parse.urljoin(url, img_src)
-                if img_src.startswith('http'):
-                    images.append({
-                        'src': img_src,
-                        'alt': img.get('alt', ''),
-                        'title': img.get('title', '')
-                    })
-        
-        # Check for meta og:image if few images found
-        if len(images) < 5:
-            og_img = soup.find('meta', property='og:image')
-            if og_img and og_img.get('content'):
-                images.insert(0, {'src': og_img['content'], 'alt': 'Social Share Image', 'title': 'Main Image'})
-        
-        # Extract product information (for e-commerce sites)
-        product_info = {}
-        
-        # Try to find product name
-        product_name = None
-        for selector in ['h1.product-title', 'h1.title', '.product-name', '.product-title', '[data-testid="product-title"]', '[data-product-title]']:
-            element = soup.select_one(selector)
-            if element:
-                product_name = element.get_text(strip=True)
-                break
-        product_info['name'] = product_name
-        
-        # Try to find price
-        price = None
-        for selector in ['.price', '.product-price', '.current-price', '.sale-price', '[data-price]', '.money', '.cost']:
-            element = soup.select_one(selector)
-            if element:
-                price = element.get_text(strip=True)
-                break
-        product_info['price'] = price
-        
-        # Try to find product description
-        description = None
-        for selector in ['.description', '.product-description', '.product-details', 'meta[name="description"]', 'meta[property="og:description"]']:
-            element = soup.select_one(selector)
-            if element:
-                description = element.get('content', element.get_text(strip=True))
-                break
-        product_info['description'] = description
-        
-        # Try to find product category
-        category = None
-        for selector in ['.breadcrumb', '.category', '.product-category', '.nav-breadcrumb']:
-            element = soup.select_one(selector)
-            if element:
-                category = element.get_text(strip=True)
-                break
-        product_info['category'] = category
-        
-        # Extract meta tags
-        meta_tags = {}
-        for meta in soup.find_all('meta'):
-            name = meta.get('name') or meta.get('property')
-            content = meta.get('content')
-            if name and content:
-                meta_tags[name] = content
-        
-        # Extract schema.org structured data
-        schema_data = []
-        for script in soup.find_all('script', type='application/ld+json'):
-            try:
-                schema_content = json_lib.loads(script.string)
-                schema_data.append(schema_content)
-            except:
-                pass
+                error_msg = str(e)
+            logging.warning(f"{engine.capitalize()} scraping failed/insufficient: {error_msg}")
+            continue
         
-        # Extract headers (h1, h2, h3, etc.)
-        headers = []
-        for tag in ['h1', 'h2', 'h3']:
-            for element in soup.find_all(tag):
-                headers.append({
-                    'tag': tag,
-                    'text': element.get_text(strip=True)
-                })
+        strategy.record(domain, engine, True, (time.monotonic() - started) * 1000)
+        ENGINE_ATTEMPTS.inc(engine=engine, outcome='ok')
+        break
+    
+    if extraction is None:
+        failures = ', '.join(f'{engine.capitalize()}: {error}' for engine, error in errors.items())
+        logging.error(f"All scraping methods failed. {failures}")
+        timings.finish('none', 'blocked' if is_blocked else 'failed')
+        if is_blocked:
+             raise ScrapeError('Access denied by website security. Try a different URL or wait a moment.', 403)
+        raise ScrapeError('Failed to retrieve content. The website may be protected.', 500)
+
+    if discovered is not None:
+        discovered.extend(urllib.parse.urljoin(url, href) for href in extraction.hrefs)
+    
+    # Create the scraping result
+    result = {
+        'url': url,
+        **extraction.fields,
+        'scrapedAt': datetime.utcnow().isoformat()
+    }
+    if render_stats is not None:
+        result['renderStats'] = render_stats
+    if change_detector is not None and change_detector.result_unchanged(result):
+        return unchanged(engine)
+    
+    report('store')
+    persist_started = time.monotonic()
+    
+    record_history(result, url, user)
+    
+    # Keep the raw page next to its result so extraction changes can be backfilled
+    # Compressing and writing the page happens off the request path too
+    snapshots = get_snapshot_writer(db)
+    if snapshots is not None:
+        snapshots.add(url, domain, page_html, result, page_title, engine)
+    
+    # Validators only make sense when the static fetch itself succeeded
+    cache.record(CACHE_MISS)
+    cache.put(url, result, response.headers if response is not None and response.status_code == 200 else None)
+    timings.add('persist', time.monotonic() - persist_started, engine)
+    timings.finish(engine, 'ok')
+    return result, CACHE_MISS
+
+@app.route('/api/scrape', methods=['POST'])
+def scrape_url():
+    try:
+        data = request.json
+        if not data or 'url' not in data:
+            return jsonify({'error': 'URL is required'}), 400
         
-        # Extract product features or specifications
-        features = []
-        for selector in ['.features', '.specifications', '.specs', '.product-features']:
-            element = soup.select_one(selector)
-            if element:
-                for item in element.find_all(['li', 'div', 'span']):
-                    feature_text = item.get_text(strip=True)
-                    if feature_text:
-                        features.append(feature_text)
-                break
+        url = data['url']
         
-        # Extract product reviews (if available)
-        reviews = []
-        for selector in ['.reviews', '.review', '.customer-reviews']:
-            review_elements = soup.select(selector)
-            for review in review_elements[:5]:  # Limit to first 5 reviews
-                review_text = review.get_text(strip=True)
-                if review_text:
-                    reviews.append(review_text[:200])  # Limit length
-            if reviews:
-                break
+        # Validate URL
+        error = validate_url(url)
+        if error:
+            return jsonify({'error': error}), 400
         
-        # Create the scraping result
-        result = {
-            'url': url,
-            'title': title,
-            'textContent': text_content[:1000] + ('...' if len(text_content) > 1000 else ''),  # Limit text length
-            'links': links[:50],  # Limit to first 50 links
-            'images': images[:20],  # Limit to first 20 images
-            'productInfo': product_info,
-            'metaTags': meta_tags,
-            'schemaData': schema_data,
-            'headers': headers[:30],  # Limit to first 30 headers
-            'features': features[:10],  # Limit to first 10 features
-            'reviews': reviews[:5],  # Limit to first 5 reviews
-            'scrapedAt': datetime.utcnow().isoformat(),
-            'wordCount': len(text_content.split())
-        }
+        # Optional per-request cap on how old a cached result may be
+        max_age = data.get('max_age')
+        error = validate_max_age(max_age)
+        if error:
+            return jsonify({'error': error}), 400
         
-        # Store in MongoDB for history if available
-        # Force disable DB write temporarily to debug "Collection" error
-        if False and scraping_jobs_collection:
+        # Optional interception profile for browser renders
+        render_profile = data.get('render_profile')
+        if render_profile is not None:
             try:
-                result_db = scraping_jobs_collection.insert_one({
-                    'url': url,
-                    'title': title,
-                    'result': result,
-                    'createdAt': datetime.utcnow()
-                })
-                result['id'] = str(result_db.inserted_id)
-            except Exception as e:
-                logging.error(f"Could not save to MongoDB: {e}")
-                result['id'] = str(url.__hash__())  # Use a hash of the URL as ID if DB fails
-        else:
-            # Generate a simple ID if no database is available
-            result['id'] = str(url.__hash__())
+                get_render_profile(render_profile)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
         
-        return jsonify(result)
-    except requests.exceptions.RequestException as e:
-        return jsonify({'error': f'Request error: {str(e)}'}), 500
+        timings = StageTimings()
+        try:
+            result, cache_status = scrape_page(url, max_age=max_age, render_profile=render_profile,
+                                               user=request_user_id(), timings=timings)
+        except Exception as e:
+            message, status_code = describe_scrape_error(e)
+            return jsonify({'error': message}), status_code, {'Server-Timing': timings.server_timing()}
+        response = jsonify(result)
+        response.headers['X-Cache'] = cache_status
+        response.headers['Server-Timing'] = timings.server_timing()
+        return response
     except Exception as e:
-        return jsonify({'error': f'Scraping failed: {str(e)}'}), 500
+        message, status_code = describe_scrape_error(e)
+        return jsonify({'error': message}), status_code
+
+BATCH_MAX_URLS = int(os.getenv('BATCH_MAX_URLS', '1000'))
+
+@app.route('/api/scrape/batch', methods=['POST'])
+def scrape_batch():
+    """Scrape many URLs concurrently, streaming one NDJSON line per URL as it finishes"""
+    data = request.json
+    urls = data.get('urls') if isinstance(data, dict) else None
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'error': 'A non-empty list of URLs is required'}), 400
+    if len(urls) > BATCH_MAX_URLS:
+        return jsonify({'error': f'At most {BATCH_MAX_URLS} URLs per batch'}), 400
+
+    valid, invalid = [], []
+    for index, url in enumerate(urls):
+        error = validate_url(url)
+        if error:
+            invalid.append({'index': index, 'url': url, 'status': 'error', 'error': error, 'statusCode': 400})
+        else:
+            valid.append((index, url))
+
+    user = request_user_id()
+    engine = get_batch_engine(lambda url, **options: scrape_page(url, **options)[0], describe_scrape_error)
+
+    def generate():
+        started = time.monotonic()
+        succeeded = 0
+        for item in invalid:
+            yield json.dumps(item) + '\n'
+        for item in engine.run(valid, scrape_kwargs={'user': user}):
+            if item['status'] == 'ok':
+                succeeded += 1
+            yield json.dumps(item, default=str) + '\n'
+        yield json.dumps({
+            'done': True,
+            'total': len(urls),
+            'succeeded': succeeded,
+            'failed': len(urls) - succeeded,
+            'elapsedMs': round((time.monotonic() - started) * 1000)
+        }) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+def job_manager():
+    jobs_collection = db['jobs'] if db is not None else None
+    return get_job_manager(jobs_collection, scrape_page, describe_scrape_error)
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Queue a scrape and return its id immediately; poll or stream it for progress"""
+    data = request.json
+    if not data or 'url' not in data:
+        return jsonify({'error': 'URL is required'}), 400
+    
+    url = data['url']
+    error = validate_url(url)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    priority = data.get('priority', 0)
+    if not isinstance(priority, int) or isinstance(priority, bool) or not -10 <= priority <= 10:
+        return jsonify({'error': 'priority must be an integer between -10 and 10'}), 400
+    
+    options = {}
+    if data.get('max_age') is not None:
+        error = validate_max_age(data['max_age'])
+        if error:
+            return jsonify({'error': error}), 400
+        options['max_age'] = data['max_age']
+    if data.get('render_profile') is not None:
+        try:
+            get_render_profile(data['render_profile'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        options['render_profile'] = data['render_profile']
+    user = request_user_id()
+    if user is not None:
+        options['user'] = user
+    
+    try:
+        job = job_manager().submit(url, options, priority)
+    except QueueFull as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    return jsonify({'id': job['id'], 'status': job['status']}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager().store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_to_json(job))
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    status = job_manager().cancel(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'id': job_id, 'status': status})
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """Server-Sent Events: one event per stage, then the result or error"""
+    store = job_manager().store
+    if store.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        sent = 0
+        idle = 0.0
+        while True:
+            found = store.events_since(job_id, sent)
+            if found is None:
+                return
+            job, events = found
+            for event in events:
+                yield f"event: {event['stage']}\ndata: {json.dumps(event, default=str)}\n\n"
+            sent += len(events)
+            if job['status'] in TERMINAL_STATUSES:
+                final = {key: job.get(key) for key in ('id', 'status', 'result', 'error', 'statusCode')}
+                yield f"event: result\ndata: {json.dumps(final, default=str)}\n\n"
+                return
+            idle = 0.0 if events else idle + 0.5
+            if idle >= 15:
+                # Comment line keeps proxies from closing a quiet stream
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            time.sleep(0.5)
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+HISTORY_MAX_LIMIT = 100
+
+def crawl_manager():
+    return get_crawl_manager(lambda url, found, **options: scrape_page(url, discovered=found, **options),
+                             describe_scrape_error)
+
+@app.route('/api/crawls', methods=['POST'])
+def create_crawl():
+    """Start a crawl from seed URLs; it follows links by depth and scope in the background"""
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({'error': 'A JSON body is required'}), 400
+    seeds = data.get('seeds')
+    if isinstance(seeds, list):
+        for seed in seeds:
+            error = validate_url(seed)
+            if error:
+                return jsonify({'error': f'{seed}: {error}'}), 400
+    
+    scrape_options = {}
+    if data.get('render_profile') is not None:
+        try:
+            get_render_profile(data['render_profile'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        scrape_options['render_profile'] = data['render_profile']
+    user = request_user_id()
+    if user is not None:
+        scrape_options['user'] = user
+    
+    try:
+        settings = make_crawl_settings(
+            seeds,
+            max_depth=data.get('max_depth', 2),
+            max_pages=data.get('max_pages', 1000),
+            scope=data.get('scope', 'domain'),
+            concurrency=data.get('concurrency', 4),
+            delay=data.get('delay', 1.0),
+            respect_robots=data.get('respect_robots', True),
+            scrape_options=scrape_options,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        crawl = crawl_manager().create(settings)
+    except CrawlLimitReached as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+    return jsonify(crawl.summary()), 202
+
+@app.route('/api/crawls', methods=['GET'])
+def list_crawls():
+    return jsonify(crawl_manager().list())
+
+@app.route('/api/crawls/<crawl_id>', methods=['GET'])
+def get_crawl(crawl_id):
+    crawl = crawl_manager().get(crawl_id)
+    if crawl is None:
+        return jsonify({'error': 'Crawl not found'}), 404
+    return jsonify(crawl.summary())
+
+@app.route('/api/crawls/<crawl_id>/pause', methods=['POST'])
+def pause_crawl(crawl_id):
+    crawl = crawl_manager().get(crawl_id)
+    if crawl is None:
+        return jsonify({'error': 'Crawl not found'}), 404
+    if not crawl.pause():
+        return jsonify({'error': f'Crawl is {crawl.status}'}), 409
+    return jsonify(crawl.summary())
+
+@app.route('/api/crawls/<crawl_id>/resume', methods=['POST'])
+def resume_crawl(crawl_id):
+    try:
+        resumed = crawl_manager().resume(crawl_id)
+    except CrawlLimitReached as e:
+        return jsonify({'error': str(e)}), 503
+    crawl = crawl_manager().get(crawl_id)
+    if crawl is None:
+        return jsonify({'error': 'Crawl not found'}), 404
+    if not resumed:
+        return jsonify({'error': f'Crawl is {crawl.status}'}), 409
+    return jsonify(crawl.summary())
+
+@app.route('/api/crawls/<crawl_id>', methods=['DELETE'])
+def delete_crawl(crawl_id):
+    """Cancel a crawl and discard its saved frontier and page log"""
+    if not crawl_manager().delete(crawl_id):
+        return jsonify({'error': 'Crawl not found'}), 404
+    return jsonify({'message': 'Crawl deleted'})
+
+@app.route('/api/crawls/<crawl_id>/pages', methods=['GET'])
+def get_crawl_pages(crawl_id):
+    """Pages visited so far as NDJSON, starting at ?offset= (a line number)"""
+    crawl = crawl_manager().get(crawl_id)
+    if crawl is None:
+        return jsonify({'error': 'Crawl not found'}), 404
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    if offset is None or offset < 0 or (limit is not None and limit < 1):
+        return jsonify({'error': 'offset and limit must be non-negative integers'}), 400
+    
+    def generate():
+        try:
+            with open(crawl.pages_path) as f:
+                for number, line in enumerate(f):
+                    if number < offset:
+                        continue
+                    if limit is not None and number >= offset + limit:
+                        break
+                    yield line
+        except FileNotFoundError:
+            return
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+def watch_manager():
+    # max_age=0 skips the fresh-cache shortcut, so every check at least revalidates
+    return get_watch_manager(lambda url, detector, **options: scrape_page(url, max_age=0, change_detector=detector, **options),
+                             describe_scrape_error)
+
+@app.route('/api/watches', methods=['POST'])
+def create_watch():
+    """Watch a URL: rescrape it every interval seconds (+/- jitter) and record field-level changes.
+
+    Body: {"url": "...", "interval": 3600, "jitter": 0.1, "render_profile": null, "webhook": null}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'A JSON body is required'}), 400
+    error = validate_url(data.get('url'))
+    if error:
+        return jsonify({'error': error}), 400
+    if data.get('render_profile') is not None:
+        try:
+            get_render_profile(data['render_profile'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    manager = watch_manager()
+    try:
+        settings = make_watch_settings(
+            data['url'],
+            interval=data.get('interval', 3600),
+            jitter=data.get('jitter', 0.1),
+            render_profile=data.get('render_profile'),
+            webhook=data.get('webhook'),
+            min_interval=manager.min_interval,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(manager.create(settings, request_user_id())), 201
+
+def find_watch(watch_id):
+    """The requesting user's watch, or None if it does not exist or belongs to someone else"""
+    try:
+        watch = watch_manager().get(watch_id)
+    except ValueError:
+        return None
+    if watch is None or watch.get('user') != request_user_id():
+        return None
+    return watch
+
+@app.route('/api/watches', methods=['GET'])
+def list_watches():
+    return jsonify({'watches': watch_manager().list(request_user_id()), **watch_manager_stats()})
+
+@app.route('/api/watches/<watch_id>', methods=['GET'])
+def get_watch(watch_id):
+    """A watch with its counters and the field values it last stored"""
+    watch = find_watch(watch_id)
+    if watch is None:
+        return jsonify({'error': 'Watch not found'}), 404
+    return jsonify(watch)
+
+@app.route('/api/watches/<watch_id>', methods=['DELETE'])
+def delete_watch(watch_id):
+    if find_watch(watch_id) is None or not watch_manager().delete(watch_id):
+        return jsonify({'error': 'Watch not found'}), 404
+    return jsonify({'message': 'Watch deleted'})
+
+@app.route('/api/watches/<watch_id>/check', methods=['POST'])
+def check_watch(watch_id):
+    """Check a watch now instead of waiting for its next scheduled run"""
+    if find_watch(watch_id) is None or not watch_manager().check_now(watch_id):
+        return jsonify({'error': 'Watch not found'}), 404
+    return jsonify({'message': 'Check queued'}), 202
+
+@app.route('/api/watches/<watch_id>/changes', methods=['GET'])
+def get_watch_changes(watch_id):
+    """Change events of a watch, newest first: {at, changes: [{field, old, new}], textDistance, historyId}"""
+    limit = request.args.get('limit', 50, type=int)
+    if limit is None or not 1 <= limit <= 1000:
+        return jsonify({'error': 'limit must be between 1 and 1000'}), 400
+    if find_watch(watch_id) is None:
+        return jsonify({'error': 'Watch not found'}), 404
+    return jsonify({'changes': watch_manager().changes(watch_id, limit)})
 
 @app.route('/api/history', methods=['GET'])
 def get_scraping_history():
+    """Newest scrapes first, as summaries; pass nextCursor back as ?cursor= for the next page.
+
+    Signed-in users only see their own history, anonymous callers only anonymous scrapes.
+    """
     try:
-        if scraping_jobs_collection is not None:
-            # Get the most recent scraping jobs
-            jobs = list(scraping_jobs_collection.find({}).sort('createdAt', -1).limit(10))
-            
-            return jsonify(create_json_response(jobs))
-        else:
-            # Return empty list if no database is available
-            return jsonify([])
+        limit = request.args.get('limit', 10, type=int)
+        if limit is None or not 1 <= limit <= HISTORY_MAX_LIMIT:
+            return jsonify({'error': f'limit must be between 1 and {HISTORY_MAX_LIMIT}'}), 400
+        if scraping_jobs_collection is None:
+            # Return an empty page if no database is available
+            return jsonify({'items': [], 'nextCursor': None})
+        try:
+            items, next_cursor = query_history(scraping_jobs_collection, limit=limit,
+                                               cursor=request.args.get('cursor'),
+                                               url=request.args.get('url'), user=request_user_id())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'items': create_json_response(items), 'nextCursor': next_cursor})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/history/<history_id>', methods=['GET'])
+def get_history_item(history_id):
+    """The full stored result of one scrape"""
+    if scraping_jobs_collection is None:
+        return jsonify({'error': 'Database not available'}), 503
+    if not ObjectId.is_valid(history_id):
+        return jsonify({'error': 'Not found'}), 404
+    doc = scraping_jobs_collection.find_one({'_id': ObjectId(history_id), 'user': request_user_id()})
+    if doc is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(create_json_response(doc))
+
+@app.route('/api/export', methods=['GET'])
+def export_history():
+    """Stream stored results as NDJSON, CSV or Parquet, oldest first.
+
+    ?fields= picks columns (comma separated), ?since= / ?until= bound createdAt
+    (ISO 8601) and ?url= limits the export to one page. Documents are read from
+    a batched cursor and written out as they arrive, so memory use does not grow
+    with the size of the export. Signed-in users only export their own history,
+    anonymous callers only anonymous scrapes.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        fields = parse_export_fields(request.args.get('fields'))
+        since = parse_date(request.args.get('since'), 'since')
+        until = parse_date(request.args.get('until'), 'until')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({'error': 'Parquet export requires pyarrow to be installed'}), 501
+    if scraping_jobs_collection is None:
+        return jsonify({'error': 'Database not available'}), 503
+
+    query = build_export_query(since, until, request.args.get('url'), request_user_id())
+    docs = iter_export_documents(scraping_jobs_collection, fields, query)
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"scrapeflow-export-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.{extension}"
+    return Response(stream_with_context(export_stream(fmt, docs, fields)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/pool/stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify({
+        'browserPool': browser_pool_stats(),
+        'httpClient': fetch_client_stats(),
+        'responseCache': get_response_cache().stats(),
+        'interception': interception_totals(),
+        'history': history_writer_stats(),
+        'snapshots': snapshot_store_stats(),
+        'extractionPool': extraction_pool_stats()
+    })
+
+@METRICS.collector
+def collect_component_metrics():
+    """Gauges and counters derived from the stats each component already keeps"""
+    families = []
+    
+    def family(name, metric_type, help, samples):
+        families.append((name, metric_type, help, samples))
+    
+    cache = get_response_cache().stats()
+    family('scrape_cache_lookups_total', 'counter', 'Response cache lookups by result',
+           [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses']),
+            ({'result': 'revalidated'}, cache['revalidated'])])
+    family('scrape_cache_bytes', 'gauge', 'Bytes held by the response cache',
+           [({'tier': 'memory'}, cache['memoryBytes']), ({'tier': 'disk'}, cache['diskBytes'])])
+    family('scrape_cache_evictions_total', 'counter', 'Response cache evictions', [({}, cache['evictions'])])
+    
+    pool = browser_pool_stats()
+    if pool.get('started'):
+        family('browser_pool_browsers', 'gauge', 'Browsers in the render pool by state',
+               [({'state': 'alive'}, pool['alive']), ({'state': 'busy'}, pool['busy']), ({'state': 'configured'}, pool['size'])])
+        family('browser_pool_queued', 'gauge', 'Renders waiting for a browser', [({}, pool['queued'])])
+        family('browser_pool_tasks_total', 'counter', 'Renders run on the pool by outcome',
+               [({'outcome': 'completed'}, pool['tasksCompleted']), ({'outcome': 'failed'}, pool['tasksFailed']),
+                ({'outcome': 'rejected'}, pool['rejected']), ({'outcome': 'queue_timeout'}, pool['queueTimeouts'])])
+        family('browser_pool_launches_total', 'counter', 'Browser launches, including recycles', [({}, pool['launches'])])
+    
+    client = fetch_client_stats()
+    if client.get('started'):
+        family('http_client_requests_total', 'counter', 'HTTP requests sent by static fetches', [({}, client['requests'])])
+        family('http_client_retries_total', 'counter', 'HTTP request retries', [({}, client['retries'])])
+        family('http_client_errors_total', 'counter', 'HTTP requests that failed after all retries', [({}, client['errors'])])
+    
+    history = history_writer_stats()
+    if history.get('started'):
+        family('history_buffered', 'gauge', 'History documents waiting to be written', [({}, history['buffered'])])
+        family('history_documents_total', 'counter', 'History documents by fate',
+               [({'result': 'written'}, history['written']), ({'result': 'dropped'}, history['dropped'])])
+    
+    jobs = job_manager_stats()
+    if jobs.get('started'):
+        family('jobs_running', 'gauge', 'Scrape jobs running on worker processes', [({}, jobs['running'])])
+        family('jobs_queued', 'gauge', 'Scrape jobs waiting for a worker', [({}, jobs['queued'])])
+    
+    extractors = extraction_pool_stats()
+    if extractors.get('started'):
+        family('extraction_pool_workers', 'gauge', 'Extraction worker processes by state',
+               [({'state': 'alive'}, extractors['alive']), ({'state': 'busy'}, extractors['busy']),
+                ({'state': 'configured'}, extractors['size'])])
+        family('extraction_pool_waiting', 'gauge', 'Pages waiting for an extraction worker', [({}, extractors['waiting'])])
+        family('extraction_pool_tasks_total', 'counter', 'Pages sent to the extraction pool by outcome',
+               [({'outcome': 'completed'}, extractors['tasks'] - extractors['failed'] - extractors['timeouts']),
+                ({'outcome': 'failed'}, extractors['failed']), ({'outcome': 'timeout'}, extractors['timeouts'])])
+        family('extraction_pool_launches_total', 'counter', 'Extraction worker launches, including recycles',
+               [({}, extractors['launches'])])
+    
+    watches = watch_manager_stats()
+    if watches.get('started') and watches['scheduler']:
+        family('watches', 'gauge', 'URLs watched by this process\'s scheduler', [({}, watches['watches'])])
+        family('watch_checks_total', 'counter', 'Watch checks by outcome',
+               [({'outcome': outcome}, watches[outcome]) for outcome in WATCH_OUTCOMES])
+    return families
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of this process's metrics"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/strategies', methods=['GET'])
+@admin_required
+def get_strategies():
+    """Per-domain engine statistics and the plan each domain currently gets"""
+    return jsonify(get_strategy_table().snapshot())
+
+@app.route('/api/admin/strategies/<domain>', methods=['DELETE'])
+@admin_required
+def reset_strategy(domain):
+    if not get_strategy_table().reset(domain.lower()):
+        return jsonify({'error': 'Unknown domain'}), 404
+    return jsonify({'message': f'Strategy for {domain} reset'})
+
+@app.route('/api/admin/templates', methods=['GET'])
+@admin_required
+def list_templates():
+    """Registered site templates with how often each was used"""
+    registry = get_template_registry()
+    return jsonify({'templates': registry.list(), **registry.stats()})
+
+@app.route('/api/admin/templates', methods=['POST'])
+@admin_required
+def put_template():
+    """Register a site template, or replace the one with the same id.
+
+    Body: {"id": "example-shop", "domains": ["shop.example.com"], "urlPattern": "/p/*",
+           "fields": {"price": [{"jsonld": "offers.price", "type": "Product"}, ".pdp-price"],
+                      "sku": {"xpath": "//span[@itemprop='sku']"}},
+           "fallback": true}
+    """
+    spec = request.get_json(silent=True)
+    try:
+        template = get_template_registry().put(spec)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(template.to_dict()), 201
+
+@app.route('/api/admin/templates/<template_id>', methods=['GET'])
+@admin_required
+def get_template(template_id):
+    template = get_template_registry().get(template_id)
+    if template is None:
+        return jsonify({'error': 'Template not found'}), 404
+    return jsonify(template.to_dict())
+
+@app.route('/api/admin/templates/<template_id>', methods=['DELETE'])
+@admin_required
+def delete_template(template_id):
+    if not get_template_registry().delete(template_id):
+        return jsonify({'error': 'Template not found'}), 404
+    return jsonify({'message': f'Template {template_id} deleted'})
+
 # Authentication routes
 SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
 
@@ -545,6 +1204,36 @@ def profile():
     except Exception as e:
         return jsonify({'message': 'Profile access failed', 'error': str(e)}), 500
 
+shutting_down = False
+
+def start_worker():
+    """Per-process startup of the serving process (the dev server, or the gunicorn worker)"""
+    # Pre-warm the render browsers so the first JS-heavy page only pays navigation time
+    if os.getenv('BROWSER_POOL_PREWARM', 'True').lower() in ('true', '1', 't'):
+        get_browser_pool()
+    # Every process serves the watch API; the one that gets the scheduler lock runs the checks
+    watch_manager()
+
+def shutdown_services():
+    """Stop watches, crawls and jobs, flush buffered writes, then close worker processes, browsers and connections.
+
+    Watches and crawls go first since they still feed history; every step
+    runs even if an earlier one fails.
+    """
+    global shutting_down
+    shutting_down = True
+    for step in (shutdown_watch_manager, shutdown_crawl_manager, close_history_writer, close_snapshot_writer, shutdown_job_manager,
+                 lambda: get_strategy_table().save(), shutdown_extraction_pool, close_fetch_client, shutdown_browser_pool):
+        try:
+            step()
+        except Exception as e:
+            logging.warning(f"Error during shutdown: {e}")
+
 if __name__ == '__main__':
+    # Development server; production runs gunicorn -c gunicorn.conf.py (see wsgi.py)
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() in ('true', '1', 't')
+    # With the debug reloader only the child process serves requests
+    if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_worker()
+    atexit.register(shutdown_services)
     app.run(debug=debug_mode, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,185 @@
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def try_take(self):
+        """Take a token if one is available; otherwise return seconds until the next one"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.rate <= 0:
+            return 1.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class HostLimiter:
+    """Per-host concurrency cap plus a token-bucket request rate, shared by all batches"""
+
+    def __init__(self, max_per_host=2, rate=1.0, burst=2):
+        self.max_per_host = max(1, max_per_host)
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._buckets = {}
+
+    def try_acquire(self, host):
+        """Return 0.0 when a request to host may start now, else a hint in seconds to retry"""
+        with self._lock:
+            if self._in_flight.get(host, 0) >= self.max_per_host:
+                return 0.05
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            wait = bucket.try_take()
+            if wait:
+                return wait
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+            return 0.0
+
+    def release(self, host, refund=False):
+        with self._lock:
+            remaining = self._in_flight.get(host, 1) - 1
+            if remaining > 0:
+                self._in_flight[host] = remaining
+            else:
+                self._in_flight.pop(host, None)
+            if refund and host in self._buckets:
+                self._buckets[host].refund()
+
+
+def host_of(url):
+    return urllib.parse.urlparse(url).netloc.lower()
+
+
+class BatchEngine:
+    """Runs many scrapes concurrently and yields results as each one finishes.
+
+    A process-wide thread pool bounds total concurrency across every running
+    batch; HostLimiter keeps each site to a few parallel requests at a polite
+    rate. Hosts are served round-robin so one large site cannot starve the rest.
+    """
+
+    def __init__(self, scrape_fn, describe_error=None, max_concurrency=16, per_host_concurrency=2,
+                 per_host_rate=1.0, per_host_burst=2):
+        self.scrape_fn = scrape_fn
+        self.describe_error = describe_error or (lambda e: (str(e), 500))
+        self.max_concurrency = max(1, max_concurrency)
+        self.limiter = HostLimiter(per_host_concurrency, per_host_rate, per_host_burst)
+        self._slots = threading.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='batch-scrape')
+
+    def run(self, items, scrape_kwargs=None):
+        """Scrape (index, url) pairs, yielding one result dict per URL in completion order.
+
+        scrape_kwargs go to every scrape_fn call of this batch only (e.g. the
+        requesting user), since the engine itself is shared by all batches.
+        """
+        scrape_kwargs = scrape_kwargs or {}
+        pending = OrderedDict()
+        for index, url in items:
+            pending.setdefault(host_of(url), deque()).append((index, url))
+
+        done = queue.Queue()
+        in_flight = 0
+        while pending or in_flight:
+            wait = self._dispatch(pending, done, scrape_kwargs)
+            in_flight += wait[0]
+            try:
+                item = done.get(timeout=wait[1] if pending else None)
+            except queue.Empty:
+                continue
+            in_flight -= 1
+            yield item
+            # Drain whatever else finished meanwhile before dispatching again
+            while True:
+                try:
+                    item = done.get_nowait()
+                except queue.Empty:
+                    break
+                in_flight -= 1
+                yield item
+
+    def _dispatch(self, pending, done, scrape_kwargs):
+        """Start as many pending URLs as limits allow; returns (started, seconds to wait)"""
+        started = 0
+        next_wait = 0.5
+        progressed = True
+        while pending and progressed:
+            progressed = False
+            for host in list(pending):
+                wait = self.limiter.try_acquire(host)
+                if wait:
+                    next_wait = min(next_wait, wait)
+                    continue
+                if not self._slots.acquire(blocking=False):
+                    self.limiter.release(host, refund=True)
+                    return started, 0.05
+                index, url = pending[host].popleft()
+                if not pending[host]:
+                    del pending[host]
+                else:
+                    # Round-robin: this host goes to the back of the line
+                    pending.move_to_end(host)
+                self._executor.submit(self._scrape, index, url, host, done, scrape_kwargs)
+                started += 1
+                progressed = True
+        return started, next_wait
+
+    def _scrape(self, index, url, host, done, scrape_kwargs):
+        started = time.monotonic()
+        try:
+            item = {'index': index, 'url': url, 'status': 'ok', 'result': self.scrape_fn(url, **scrape_kwargs)}
+        except Exception as e:
+            message, status_code = self.describe_error(e)
+            logging.info(f"Batch scrape of {url} failed: {message}")
+            item = {'index': index, 'url': url, 'status': 'error', 'error': message, 'statusCode': status_code}
+        finally:
+            self.limiter.release(host)
+            self._slots.release()
+        item['elapsedMs'] = round((time.monotonic() - started) * 1000)
+        done.put(item)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_batch_engine(scrape_fn, describe_error=None):
+    """Return the process-wide batch engine, configured from the environment"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = BatchEngine(
+                scrape_fn,
+                describe_error,
+                max_concurrency=int(os.getenv('BATCH_MAX_CONCURRENCY', '16')),
+                per_host_concurrency=int(os.getenv('BATCH_PER_HOST_CONCURRENCY', '2')),
+                per_host_rate=float(os.getenv('BATCH_PER_HOST_RATE', '1.0')),
+                per_host_burst=float(os.getenv('BATCH_PER_HOST_BURST', '2')),
+            )
+        return _engine
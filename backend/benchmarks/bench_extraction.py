@@ -0,0 +1,199 @@
+"""Compare the single-pass extractor against the previous multi-walk extraction.
+
+Usage (from backend/):
+    python benchmarks/bench_extraction.py [--size-mb 3] [--repeat 3]
+
+Builds a synthetic e-commerce page, checks both implementations return the
+same fields, then reports parse and extraction timings for each parser.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from extraction import extract_page  # noqa: E402
+
+URL = 'https://shop.example.com/products/widget'
+
+
+def build_product_page(size_mb=3, seed=7):
+    """Synthetic e-commerce listing padded with product cards to roughly size_mb"""
+    rng = random.Random(seed)
+    words = ['widget', 'premium', 'steel', 'blue', 'fast', 'shipping', 'sale', 'deluxe', 'compact', 'eco']
+    head = [
+        '<!DOCTYPE html><html><head><title>Widget Store</title>',
+        '<meta name="description" content="The best widgets">',
+        '<meta property="og:title" content="Deluxe Widget">',
+        '<meta property="og:image" content="https://cdn.example.com/og.png">',
+        '<script type="application/ld+json">',
+        json.dumps({'@context': 'https://schema.org', '@type': 'Product', 'name': 'Deluxe Widget',
+                    'offers': {'@type': 'Offer', 'price': '19.99', 'priceCurrency': 'USD'}}),
+        '</script><style>.card{color:red}</style></head><body>',
+        '<nav class="breadcrumb"><a href="/">Home</a> &gt; <a href="/widgets">Widgets</a></nav>',
+        '<h1 class="product-title">Deluxe Widget</h1><span class="price">$19.99</span>',
+        '<div class="product-description">A very fine widget.</div>',
+        '<ul class="features"><li>Steel</li><li>Blue</li><li>Compact</li></ul>',
+    ]
+    body = []
+    size = 0
+    card = 0
+    target = int(size_mb * 1024 * 1024)
+    while size < target:
+        text = ' '.join(rng.choice(words) for _ in range(40))
+        chunk = (
+            f'<div class="card" data-sku="{card}"><h2>Item {card}</h2><h3>{rng.choice(words)}</h3>'
+            f'<a href="/products/{card}"><img src="/img/{card}.jpg" alt="Item {card}"></a>'
+            f'<p>{text}</p><span class="money">${rng.randint(1, 999)}.99</span>'
+            f'<div class="review">Great {rng.choice(words)} product</div>'
+            f'<a href="https://partner.example.org/ref/{card}">Partner {card}</a></div>'
+        )
+        body.append(chunk)
+        size += len(chunk)
+        card += 1
+    return ''.join(head + body + ['</body></html>']).encode('utf-8')
+
+
+def legacy_extract(soup, url, title=None):
+    """The extraction code as it was before the single-pass engine"""
+    if not title or title == 'No title':
+        title_tag = soup.find('meta', property='og:title') or soup.find('meta', attrs={'name': 'twitter:title'}) or soup.title
+        title = title_tag['content'] if title_tag and title_tag.name == 'meta' else (title_tag.string if title_tag else 'No title')
+    text_content = soup.get_text(strip=True, separator=' ')
+    links = []
+    for link in soup.find_all('a', href=True):
+        link_url = link['href']
+        if not link_url or link_url.startswith('javascript:') or link_url == '#':
+            continue
+        if link_url.startswith('/'):
+            link_url = urllib.parse.urljoin(url, link_url)
+        link_text = link.get_text(strip=True)
+        if not link_text:
+            img = link.find('img')
+            if img:
+                link_text = img.get('alt') or 'Image Link'
+        if link_text:
+            links.append({'text': link_text[:100], 'url': link_url})
+    images = []
+    for img in soup.find_all('img'):
+        img_src = img.get('src') or img.get('data-src') or img.get('data-original')
+        if img_src and not img_src.startswith('data:'):
+            if img_src.startswith('/'):
+                img_src = urllib.parse.urljoin(url, img_src)
+            if img_src.startswith('http'):
+                images.append({'src': img_src, 'alt': img.get('alt', ''), 'title': img.get('title', '')})
+    if len(images) < 5:
+        og_img = soup.find('meta', property='og:image')
+        if og_img and og_img.get('content'):
+            images.insert(0, {'src': og_img['content'], 'alt': 'Social Share Image', 'title': 'Main Image'})
+    product_info = {}
+    for field, selectors in [
+        ('name', ['h1.product-title', 'h1.title', '.product-name', '.product-title', '[data-testid="product-title"]', '[data-product-title]']),
+        ('price', ['.price', '.product-price', '.current-price', '.sale-price', '[data-price]', '.money', '.cost']),
+        ('description', ['.description', '.product-description', '.product-details', 'meta[name="description"]', 'meta[property="og:description"]']),
+        ('category', ['.breadcrumb', '.category', '.product-category', '.nav-breadcrumb']),
+    ]:
+        value = None
+        for selector in selectors:
+            element = soup.select_one(selector)
+            if element:
+                value = element.get('content', element.get_text(strip=True)) if field == 'description' else element.get_text(strip=True)
+                break
+        product_info[field] = value
+    meta_tags = {}
+    for meta in soup.find_all('meta'):
+        name = meta.get('name') or meta.get('property')
+        content = meta.get('content')
+        if name and content:
+            meta_tags[name] = content
+    schema_data = []
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            schema_data.append(json.loads(script.string))
+        except Exception:
+            pass
+    headers = []
+    for tag in ['h1', 'h2', 'h3']:
+        for element in soup.find_all(tag):
+            headers.append({'tag': tag, 'text': element.get_text(strip=True)})
+    features = []
+    for selector in ['.features', '.specifications', '.specs', '.product-features']:
+        element = soup.select_one(selector)
+        if element:
+            for item in element.find_all(['li', 'div', 'span']):
+                feature_text = item.get_text(strip=True)
+                if feature_text:
+                    features.append(feature_text)
+            break
+    reviews = []
+    for selector in ['.reviews', '.review', '.customer-reviews']:
+        for review in soup.select(selector)[:5]:
+            review_text = review.get_text(strip=True)
+            if review_text:
+                reviews.append(review_text[:200])
+        if reviews:
+            break
+    return {
+        'title': str(title),
+        'textContent': text_content[:1000] + ('...' if len(text_content) > 1000 else ''),
+        'links': links[:50],
+        'images': images[:20],
+        'productInfo': product_info,
+        'metaTags': meta_tags,
+        'schemaData': schema_data,
+        'headers': headers[:30],
+        'features': features[:10],
+        'reviews': reviews[:5],
+        'wordCount': len(text_content.split()),
+    }
+
+
+def best_of(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    html = build_product_page(args.size_mb)
+    print(f"Page size: {len(html) / 1024 / 1024:.2f} MB")
+
+    parsers = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        parsers.append('lxml')
+    except ImportError:
+        print("lxml not installed, skipping lxml runs")
+
+    for parser_name in parsers:
+        parse_time, soup = best_of(lambda: BeautifulSoup(html, parser_name), args.repeat)
+        legacy_time, legacy = best_of(lambda: legacy_extract(soup, URL), args.repeat)
+        single_time, extraction = best_of(lambda: extract_page(soup, URL), args.repeat)
+
+        if legacy != extraction.fields:
+            mismatched = [key for key in legacy if legacy[key] != extraction.fields.get(key)]
+            print(f"  WARNING: outputs differ on {mismatched}")
+
+        print(f"[{parser_name}] parse {parse_time * 1000:8.1f} ms")
+        print(f"[{parser_name}] legacy extraction {legacy_time * 1000:8.1f} ms")
+        print(f"[{parser_name}] single-pass extraction {single_time * 1000:8.1f} ms "
+              f"({legacy_time / single_time:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""End-to-end benchmark of /api/scrape against the local fixture site.
+
+Usage (from backend/):
+    python benchmarks/bench_scrape.py [--scenarios small,shop,spa,slow,blocked]
+                                      [--requests 20] [--concurrency 4] [--profile-runs 3]
+                                      [--baseline benchmarks/baseline.json] [--save-baseline]
+
+For each scenario the fixture server (benchmarks/fixture_server.py) serves
+fresh URLs. The Flask app is driven in-process to measure latency percentiles
+and throughput. A sequential pass then records wall time, CPU time and peak
+Python memory of each scrape stage; parsing and extraction on the extraction
+pool's workers count towards the CPU time of the stage that waited for them. Results are compared with the stored
+baseline; the exit code is 1 when a metric regressed beyond --tolerance.
+The spa, slow and blocked scenarios go through the browser engines, so their
+numbers depend on Playwright/Selenium being installed.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fixture_server import FixtureServer  # noqa: E402
+
+SCENARIOS = ('small', 'shop', 'spa', 'slow', 'blocked')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+_counter = itertools.count()
+
+
+def isolate_state():
+    """Keep caches, snapshots and learned strategies of the run out of the real ones"""
+    state_dir = tempfile.mkdtemp(prefix='scrape-bench-')
+    os.environ['CACHE_DIR'] = os.path.join(state_dir, 'cache')
+    os.environ['SNAPSHOT_DIR'] = os.path.join(state_dir, 'snapshots')
+    os.environ['STRATEGY_FILE'] = os.path.join(state_dir, 'strategies.json')
+    # An unreachable database keeps history, snapshots and jobs in memory and out of the real one
+    os.environ['MONGO_URI'] = 'mongodb://127.0.0.1:9/'
+    os.environ['MONGO_TIMEOUT_MS'] = '200'
+    # Learning would let one scenario change the engine order of the next
+    os.environ['STRATEGY_MIN_SAMPLES'] = str(10 ** 9)
+    return state_dir
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def run_load(app, fixtures, scenario, requests, concurrency):
+    """Fire requests at /api/scrape with the given concurrency; returns latency and throughput"""
+    def one(_):
+        url = fixtures.url(scenario, f'page-{next(_counter)}')
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post('/api/scrape', json={'url': url})
+        return (time.perf_counter() - started) * 1000, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _ in samples]
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'p50Ms': round(percentile(latencies, 50), 1),
+        'p90Ms': round(percentile(latencies, 90), 1),
+        'p99Ms': round(percentile(latencies, 99), 1),
+        'maxMs': round(max(latencies), 1),
+        'throughputRps': round(requests / elapsed, 2),
+        'statuses': statuses,
+    }
+
+
+class StageRecorder:
+    """progress callback for scrape_page that closes a stage each time the next one starts.
+
+    thread_time() only sees the scraping thread. When pooled, parsing and
+    extraction run on pool workers instead, so the parse and extract times
+    they report back (through timings) are added to the stage's CPU time.
+    """
+
+    # Time spent in these stages runs on a worker process when the extraction pool is used
+    POOL_STAGES = ('parse', 'extract')
+
+    def __init__(self, timings, pooled, track_memory=False):
+        self.timings = timings
+        self.pooled = pooled
+        self.track_memory = track_memory
+        self.stages = []
+        self._current = None
+
+    def __call__(self, stage, **info):
+        self.close()
+        name = f"{stage}:{info['engine']}" if 'engine' in info else stage
+        memory = 0
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            memory = tracemalloc.get_traced_memory()[0]
+        self._current = (name, time.perf_counter(), time.thread_time(), memory, len(self.timings.entries))
+
+    def close(self):
+        if self._current is None:
+            return
+        name, wall, cpu, memory, entries = self._current
+        sample = {'stage': name}
+        if self.track_memory:
+            sample['peakKb'] = max(0, tracemalloc.get_traced_memory()[1] - memory) / 1024
+        else:
+            sample['wallMs'] = (time.perf_counter() - wall) * 1000
+            sample['cpuMs'] = (time.thread_time() - cpu) * 1000
+            if self.pooled:
+                # Worker-side durations: parsing and extraction are CPU-bound, so wall time is CPU time
+                sample['cpuMs'] += sum(seconds for stage, _, seconds in self.timings.entries[entries:]
+                                       if stage in self.POOL_STAGES) * 1000
+        self.stages.append(sample)
+        self._current = None
+
+
+def _record_scrape(scrape_app, url, track_memory):
+    timings = scrape_app.StageTimings()
+    recorder = StageRecorder(timings, scrape_app.get_extraction_pool() is not None, track_memory)
+    recorder('setup')
+    try:
+        scrape_app.scrape_page(url, progress=recorder, timings=timings)
+    except Exception:
+        # Failing scenarios (blocked pages) are still worth profiling
+        pass
+    recorder.close()
+    return recorder.stages
+
+
+def profile_stages(scrape_app, fixtures, scenario, runs):
+    """Median wall and CPU time per stage over sequential scrapes, plus peak allocations.
+
+    Memory is traced in one extra scrape of its own because tracemalloc
+    slows Python code down several times over.
+    """
+    per_stage = {}
+    for _ in range(runs):
+        for sample in _record_scrape(scrape_app, fixtures.url(scenario, f'profile-{next(_counter)}'), False):
+            per_stage.setdefault(sample['stage'], []).append(sample)
+    summary = {
+        stage: {
+            'wallMs': round(statistics.median(s['wallMs'] for s in samples), 2),
+            'cpuMs': round(statistics.median(s['cpuMs'] for s in samples), 2),
+            'peakKb': None,
+        }
+        for stage, samples in per_stage.items()
+    }
+    tracemalloc.start()
+    try:
+        for sample in _record_scrape(scrape_app, fixtures.url(scenario, f'profile-{next(_counter)}'), True):
+            summary.setdefault(sample['stage'], {'wallMs': None, 'cpuMs': None})['peakKb'] = round(sample['peakKb'], 1)
+    finally:
+        tracemalloc.stop()
+    return summary
+
+
+def compare(results, baseline, tolerance):
+    """Print each metric next to its baseline; returns the list of regressions"""
+    regressions = []
+    for scenario, current in results.items():
+        previous = baseline.get(scenario)
+        if not previous:
+            continue
+        for metric in ('p50Ms', 'p90Ms', 'p99Ms', 'throughputRps'):
+            old, new = previous['load'].get(metric), current['load'].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if metric == 'throughputRps' else change > tolerance
+            marker = '  REGRESSION' if worse else ''
+            print(f"  {scenario:8} {metric:14} {old:10.1f} -> {new:10.1f} ({change * 100:+6.1f}%){marker}")
+            if worse:
+                regressions.append((scenario, metric, old, new))
+    return regressions
+
+
+def _fmt(value):
+    return f'{value:10.1f}' if value is not None else f"{'-':>10}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=20, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--profile-runs', type=int, default=3)
+    parser.add_argument('--shop-mb', type=float, default=5)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative change before flagging')
+    parser.add_argument('--json', help='also write the full results to this file')
+    parser.add_argument('--verbose', action='store_true', help='show the app\'s log output')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    isolate_state()
+    if not args.verbose:
+        # Expected engine failures would otherwise drown the report
+        logging.disable(logging.CRITICAL)
+    import app as scrape_app  # noqa: E402 - after the environment is set up
+
+    results = {}
+    with FixtureServer(shop_mb=args.shop_mb) as fixtures:
+        for scenario in scenarios:
+            print(f"[{scenario}] {args.requests} requests, concurrency {args.concurrency}...")
+            load = run_load(scrape_app.app, fixtures, scenario, args.requests, args.concurrency)
+            stages = profile_stages(scrape_app, fixtures, scenario, args.profile_runs)
+            results[scenario] = {'load': load, 'stages': stages}
+
+            print(f"  p50 {load['p50Ms']} ms  p90 {load['p90Ms']} ms  p99 {load['p99Ms']} ms  "
+                  f"{load['throughputRps']} req/s  statuses {load['statuses']}")
+            for stage, numbers in stages.items():
+                print(f"    {stage:20} wall {_fmt(numbers['wallMs'])} ms  cpu {_fmt(numbers['cpuMs'])} ms  "
+                      f"peak {_fmt(numbers['peakKb'])} KB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.baseline} (tolerance {args.tolerance:.0%}):")
+        regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    scrape_app.shutdown_browser_pool()
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Local HTTP server with generated pages for every scrape path.
+
+Usage (from backend/):
+    python benchmarks/fixture_server.py [--port 8765]
+
+Routes, each taking any suffix so every request can use a fresh URL:
+    /small/...     small static page that passes the content check
+    /shop/...      ~5 MB e-commerce page with JSON-LD (size via ?mb=)
+    /spa/...       JS shell that trips the low-content heuristic
+    /slow/...      page answered after ?delay_ms= (default 800) with lazy-loaded images
+    /blocked/...   CAPTCHA interstitial with blocking keywords
+"""
+import argparse
+import http.server
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_extraction import build_product_page  # noqa: E402
+
+
+def small_page(path):
+    links = ''.join(f'<li><a href="/small/{i}">Article {i}</a></li>' for i in range(12))
+    images = ''.join(f'<img src="/img/{i}.png" alt="Figure {i}">' for i in range(4))
+    return (
+        f'<!DOCTYPE html><html><head><title>Small page {path}</title>'
+        '<meta name="description" content="A small static page"></head><body>'
+        f'<h1>Small page</h1><p>{"Plain server-rendered text. " * 40}</p>'
+        f'<ul>{links}</ul>{images}</body></html>'
+    ).encode('utf-8')
+
+
+def spa_page(path):
+    return (
+        f'<!DOCTYPE html><html><head><title>App {path}</title>'
+        '<script src="/static/js/main.0f3a9c.js" defer></script></head>'
+        '<body><noscript>You need to enable JavaScript to run this app.</noscript>'
+        '<div id="root"></div>'
+        '<script>window.__INITIAL_STATE__ = {"route": "/", "items": []};</script>'
+        '</body></html>'
+    ).encode('utf-8')
+
+
+def lazy_page(path):
+    cards = ''.join(
+        f'<div class="card"><a href="/slow/item/{i}">Item {i}</a>'
+        f'<img data-src="/img/lazy/{i}.jpg" alt="Item {i}" loading="lazy"></div>'
+        for i in range(20)
+    )
+    return (
+        f'<!DOCTYPE html><html><head><title>Lazy page {path}</title></head><body>'
+        f'<h1>Lazy loaded listing</h1><div id="list">{cards}</div>'
+        '<script>setTimeout(() => document.querySelectorAll("img[data-src]")'
+        '.forEach(img => { img.src = img.dataset.src; }), 500);</script>'
+        '</body></html>'
+    ).encode('utf-8')
+
+
+def blocked_page(path):
+    return (
+        '<!DOCTYPE html><html><head><title>Attention Required</title></head><body>'
+        '<h1>Please verify you are a human</h1>'
+        '<p>Access denied. Complete the CAPTCHA below to continue.</p>'
+        '<div class="g-recaptcha" data-sitekey="fixture"></div>'
+        '</body></html>'
+    ).encode('utf-8')
+
+
+class FixtureServer:
+    """Threaded fixture site on 127.0.0.1; use as a context manager"""
+
+    def __init__(self, port=0, shop_mb=5):
+        self.shop_mb = shop_mb
+        self._shop_pages = {}
+        self._shop_lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def url(self, kind, name):
+        return f'{self.base_url}/{kind}/{name}'
+
+    def shop_page(self, mb):
+        with self._shop_lock:
+            if mb not in self._shop_pages:
+                self._shop_pages[mb] = build_product_page(mb)
+            return self._shop_pages[mb]
+
+    def start(self):
+        # Generate the big page up front so the first request does not pay for it
+        self.shop_page(self.shop_mb)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fixture-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _render(self, path, query):
+        kind = path.strip('/').split('/', 1)[0]
+        if kind == 'small':
+            return 200, small_page(path)
+        if kind == 'shop':
+            return 200, self.shop_page(float(query.get('mb', [self.shop_mb])[0]))
+        if kind == 'spa':
+            return 200, spa_page(path)
+        if kind == 'slow':
+            time.sleep(int(query.get('delay_ms', ['800'])[0]) / 1000)
+            return 200, lazy_page(path)
+        if kind == 'blocked':
+            return 200, blocked_page(path)
+        return 404, b'<html><body>Not found</body></html>'
+
+    def _handler(self):
+        fixture = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                status, body = fixture._render(parsed.path, urllib.parse.parse_qs(parsed.query))
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                # Every request must reach the full scrape path, never the response cache
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(body)
+                fixture.requests += 1
+                fixture.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--shop-mb', type=float, default=5)
+    args = parser.parse_args()
+
+    server = FixtureServer(args.port, args.shop_mb).start()
+    print(f"Serving fixtures on {server.base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+
+class PoolExhausted(Exception):
+    """Raised when the render queue is full or a task waited too long for a browser"""
+
+
+class _RenderTask:
+    """A unit of work waiting for a pooled browser"""
+
+    def __init__(self, fn, context_options):
+        self.fn = fn
+        self.context_options = context_options or {}
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self._state = 'queued'
+        self._lock = threading.Lock()
+
+    def claim(self):
+        # Called by a worker; fails if the caller already gave up waiting
+        with self._lock:
+            if self._state != 'queued':
+                return False
+            self._state = 'running'
+            return True
+
+    def abandon(self):
+        # Called by the submitter; fails if a worker already picked the task up
+        with self._lock:
+            if self._state != 'queued':
+                return False
+            self._state = 'abandoned'
+            return True
+
+
+_STOP = object()
+
+
+class BrowserPool:
+    """Long-lived headless browsers shared by the render fallback.
+
+    Each slot is a dedicated thread owning one Playwright driver and one browser,
+    because the sync API is bound to the thread that started it. Callers hand over
+    a function that receives a fresh, isolated browser context; the context is
+    closed when the function returns, the browser stays warm for the next task.
+    """
+
+    def __init__(self, size=2, max_pages_per_browser=50, queue_size=32, queue_timeout=30,
+                 browser_type='firefox', launch_options=None):
+        self.size = max(1, size)
+        self.max_pages_per_browser = max(1, max_pages_per_browser)
+        self.queue_size = max(1, queue_size)
+        self.queue_timeout = queue_timeout
+        self.browser_type = browser_type
+        self.launch_options = launch_options or {'headless': True}
+
+        self._tasks = queue.Queue(maxsize=self.queue_size)
+        self._threads = []
+        # Slot threads still running; when none are left nothing consumes the queue
+        self._live = 0
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._slots = {}
+        self._counters = {
+            'launches': 0,
+            'launchFailures': 0,
+            'recycles': 0,
+            'unhealthyRestarts': 0,
+            'tasksCompleted': 0,
+            'tasksFailed': 0,
+            'rejected': 0,
+            'queueTimeouts': 0,
+        }
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_count = 0
+
+    def start(self):
+        """Spawn the browser threads; each one launches its browser straight away"""
+        with self._stats_lock:
+            self._live = self.size
+        for slot in range(self.size):
+            self._slots[slot] = {'alive': False, 'busy': False, 'pages': 0}
+            thread = threading.Thread(target=self._worker, args=(slot,), name=f'browser-pool-{slot}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"Browser pool started with {self.size} {self.browser_type} browser(s)")
+        return self
+
+    def run(self, fn, context_options=None, timeout=90):
+        """Run fn(context) on a pooled browser and return its result.
+
+        Raises PoolExhausted when the wait queue is full, every browser thread
+        has died, or no browser frees up within queue_timeout seconds; timeout
+        bounds the task once it started.
+        """
+        if self._closed:
+            raise PoolExhausted('Browser pool is shut down')
+        if not self._live:
+            raise PoolExhausted('No browser is running')
+
+        task = _RenderTask(fn, context_options)
+        try:
+            self._tasks.put_nowait(task)
+        except queue.Full:
+            self._bump('rejected')
+            raise PoolExhausted('Render queue is full')
+        # The last slot may have died (and drained the queue) just before the put
+        if not self._live and task.abandon():
+            raise PoolExhausted('No browser is running')
+
+        if not task.done.wait(self.queue_timeout):
+            if task.abandon():
+                self._bump('queueTimeouts')
+                raise PoolExhausted(f'No browser available after {self.queue_timeout}s')
+            # A worker picked it up at the last moment; give it the render budget
+            if not task.done.wait(timeout):
+                raise TimeoutError(f'Render did not finish within {timeout}s')
+
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def stats(self):
+        with self._stats_lock:
+            slots = [dict(slot, id=key) for key, slot in sorted(self._slots.items())]
+            return {
+                'size': self.size,
+                'browserType': self.browser_type,
+                'threads': self._live,
+                'alive': sum(1 for slot in slots if slot['alive']),
+                'busy': sum(1 for slot in slots if slot['busy']),
+                'maxPagesPerBrowser': self.max_pages_per_browser,
+                'queued': self._tasks.qsize(),
+                'queueCapacity': self.queue_size,
+                'queueTimeoutSeconds': self.queue_timeout,
+                'queueWaitAvgMs': round(self._wait_total / self._wait_count * 1000, 1) if self._wait_count else 0.0,
+                'queueWaitMaxMs': round(self._wait_max * 1000, 1),
+                'slots': slots,
+                **self._counters,
+            }
+
+    def shutdown(self, timeout=10):
+        """Stop accepting work and close every browser"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            try:
+                self._tasks.put(_STOP, timeout=1)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout)
+        logging.info("Browser pool shut down")
+
+    def _bump(self, counter, amount=1):
+        with self._stats_lock:
+            self._counters[counter] += amount
+
+    def _set_slot(self, slot, **values):
+        with self._stats_lock:
+            self._slots[slot].update(values)
+
+    def _record_wait(self, seconds):
+        with self._stats_lock:
+            self._wait_total += seconds
+            self._wait_count += 1
+            self._wait_max = max(self._wait_max, seconds)
+
+    def _launch(self, playwright):
+        try:
+            browser = getattr(playwright, self.browser_type).launch(**self.launch_options)
+        except Exception:
+            self._bump('launchFailures')
+            raise
+        self._bump('launches')
+        return browser
+
+    def _close_browser(self, browser):
+        try:
+            browser.close()
+        except Exception as e:
+            logging.debug(f"Ignoring error while closing pooled browser: {e}")
+
+    def _worker(self, slot):
+        from playwright.sync_api import sync_playwright
+
+        playwright = None
+        browser = None
+        pages = 0
+        try:
+            playwright = sync_playwright().start()
+            try:
+                browser = self._launch(playwright)
+                self._set_slot(slot, alive=True, pages=0)
+            except Exception as e:
+                logging.warning(f"Browser pool slot {slot} could not pre-warm: {e}")
+
+            while True:
+                try:
+                    task = self._tasks.get(timeout=1)
+                except queue.Empty:
+                    if self._closed:
+                        break
+                    continue
+                if task is _STOP:
+                    break
+                if not task.claim():
+                    continue
+                self._record_wait(time.monotonic() - task.enqueued_at)
+                self._set_slot(slot, busy=True)
+
+                context = None
+                try:
+                    # Health check and recycling happen before handing out a context
+                    if browser is not None and not browser.is_connected():
+                        logging.warning(f"Browser pool slot {slot} lost its browser, relaunching")
+                        self._bump('unhealthyRestarts')
+                        browser = None
+                    elif browser is not None and pages >= self.max_pages_per_browser:
+                        self._close_browser(browser)
+                        self._bump('recycles')
+                        browser = None
+                    if browser is None:
+                        browser = self._launch(playwright)
+                        pages = 0
+                        self._set_slot(slot, alive=True, pages=0)
+
+                    context = browser.new_context(**task.context_options)
+                    task.result = task.fn(context)
+                    self._bump('tasksCompleted')
+                except Exception as e:
+                    task.error = e
+                    self._bump('tasksFailed')
+                finally:
+                    if context is not None:
+                        try:
+                            context.close()
+                        except Exception as e:
+                            logging.debug(f"Ignoring error while closing browser context: {e}")
+                        pages += 1
+                    self._set_slot(slot, busy=False, pages=pages, alive=browser is not None)
+                    task.done.set()
+        except Exception as e:
+            logging.error(f"Browser pool slot {slot} crashed: {e}")
+        finally:
+            if browser is not None:
+                self._close_browser(browser)
+            if playwright is not None:
+                try:
+                    playwright.stop()
+                except Exception:
+                    pass
+            self._set_slot(slot, alive=False, busy=False)
+            with self._stats_lock:
+                self._live -= 1
+                last = self._live == 0
+            if last and not self._closed:
+                logging.error("Every browser pool slot has stopped; renders fail until the pool is restarted")
+                self._fail_queued(PoolExhausted('No browser is running'))
+
+    def _fail_queued(self, error):
+        """Hand error to every task still waiting, instead of letting each one sit out queue_timeout"""
+        while True:
+            try:
+                task = self._tasks.get_nowait()
+            except queue.Empty:
+                return
+            if task is not _STOP and task.claim():
+                task.error = error
+                task.done.set()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """Return this worker process's browser pool, creating it on first use"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A forked worker must not reuse browser threads inherited from its parent
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = BrowserPool(
+                size=int(os.getenv('BROWSER_POOL_SIZE', '2')),
+                max_pages_per_browser=int(os.getenv('BROWSER_POOL_MAX_PAGES', '50')),
+                queue_size=int(os.getenv('BROWSER_POOL_QUEUE_SIZE', '32')),
+                queue_timeout=float(os.getenv('BROWSER_POOL_QUEUE_TIMEOUT', '30')),
+                browser_type=os.getenv('BROWSER_POOL_ENGINE', 'firefox'),
+            ).start()
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def browser_pool_stats():
+    """Stats for the current pool without forcing one to start"""
+    if _pool is None or _pool_pid != os.getpid():
+        return {'size': 0, 'started': False}
+    return dict(_pool.stats(), started=True)
+
+
+def shutdown_browser_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
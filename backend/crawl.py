@@ -0,0 +1,657 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+import urllib.robotparser
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from response_cache import normalize_url
+
+SCOPES = ('host', 'domain', 'any')
+
+# Links to files that will never turn into a page; skipped without a request
+SKIPPED_EXTENSIONS = frozenset((
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico', '.bmp', '.avif', '.pdf', '.zip', '.gz',
+    '.tar', '.rar', '.7z', '.exe', '.dmg', '.mp3', '.mp4', '.webm', '.avi', '.mov', '.woff', '.woff2',
+    '.ttf', '.css', '.js', '.json', '.xml', '.rss', '.csv', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+))
+
+ACTIVE_STATUSES = ('running', 'pausing')
+
+
+class BloomFilter:
+    """Fixed-size probabilistic set: no false negatives, about error_rate false positives.
+
+    Ten million URLs at a 0.1% error rate fit in roughly 18 MB, where a set
+    of the strings themselves would need gigabytes.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001, _state=None):
+        if _state is not None:
+            self.size, self.hashes, self.count, self.bits = _state
+            return
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item):
+        """Add item; returns False when it was (probably) present already"""
+        added = False
+        for p in self._positions(item):
+            mask = 1 << (p & 7)
+            if not self.bits[p >> 3] & mask:
+                self.bits[p >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def to_bytes(self):
+        header = json.dumps({'size': self.size, 'hashes': self.hashes, 'count': self.count}).encode()
+        return len(header).to_bytes(4, 'big') + header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        length = int.from_bytes(data[:4], 'big')
+        header = json.loads(data[4:4 + length])
+        return cls(_state=(header['size'], header['hashes'], header['count'], bytearray(data[4 + length:])))
+
+
+class RobotsCache:
+    """robots.txt rules and crawl-delay per origin, fetched once and kept for ttl seconds.
+
+    A missing robots.txt (4xx) allows everything; 401/403 and server or
+    network errors disallow the host for a short while, as crawlers usually do.
+    """
+
+    def __init__(self, fetch, user_agent='*', ttl=24 * 3600, error_ttl=300, max_entries=10000):
+        self.fetch = fetch
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._origin_locks = {}
+
+    def allowed(self, url):
+        parser, _ = self._rules(url)
+        return parser is True or (parser is not False and parser.can_fetch(self.user_agent, url))
+
+    def crawl_delay(self, url):
+        parser, _ = self._rules(url)
+        if parser in (True, False):
+            return None
+        delay = parser.crawl_delay(self.user_agent)
+        if delay is None:
+            rate = parser.request_rate(self.user_agent)
+            if rate and rate.requests:
+                delay = rate.seconds / rate.requests
+        return float(delay) if delay is not None else None
+
+    def _rules(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        origin = f'{parsed.scheme}://{parsed.netloc}'.lower()
+        with self._lock:
+            entry = self._entries.get(origin)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(origin)
+                return entry
+            origin_lock = self._origin_locks.setdefault(origin, threading.Lock())
+        # One fetch per origin even when several workers ask at once
+        with origin_lock:
+            with self._lock:
+                entry = self._entries.get(origin)
+                if entry is not None and entry[1] > time.monotonic():
+                    return entry
+            entry = self._load(origin)
+            with self._lock:
+                self._entries[origin] = entry
+                self._entries.move_to_end(origin)
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._origin_locks.pop(evicted, None)
+            return entry
+
+    def _load(self, origin):
+        try:
+            status_code, text = self.fetch(f'{origin}/robots.txt')
+        except Exception as e:
+            logging.info(f"Could not fetch {origin}/robots.txt: {e}")
+            return False, time.monotonic() + self.error_ttl
+        if status_code in (401, 403) or status_code >= 500:
+            return False, time.monotonic() + self.error_ttl
+        if status_code >= 400:
+            return True, time.monotonic() + self.ttl
+        parser = urllib.robotparser.RobotFileParser()
+        parser.parse(text.splitlines())
+        return parser, time.monotonic() + self.ttl
+
+
+class Frontier:
+    """URLs waiting to be crawled, one queue per host.
+
+    Hosts take turns in round-robin order and each host is only handed out
+    again once its politeness delay has passed and its previous page is done.
+    """
+
+    def __init__(self, default_delay=1.0, max_size=1_000_000):
+        self.default_delay = default_delay
+        self.max_size = max_size
+        self._queues = OrderedDict()
+        self._delays = {}
+        self._next_at = {}
+        self._busy = set()
+        self._size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, url, depth):
+        if self._size >= self.max_size:
+            self.dropped += 1
+            return False
+        host = urllib.parse.urlsplit(url).netloc
+        self._queues.setdefault(host, deque()).append((url, depth))
+        self._size += 1
+        return True
+
+    def pop(self):
+        """Return (url, depth) ready to fetch now, or (None, seconds until one may be)"""
+        now = time.monotonic()
+        wait = None
+        for host in list(self._queues):
+            if host in self._busy:
+                continue
+            ready_at = self._next_at.get(host, 0)
+            if ready_at > now:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                continue
+            queue = self._queues[host]
+            url, depth = queue.popleft()
+            self._size -= 1
+            if queue:
+                self._queues.move_to_end(host)
+            else:
+                del self._queues[host]
+            self._busy.add(host)
+            return (url, depth), None
+        return None, wait
+
+    def set_delay(self, host, delay):
+        self._delays[host] = max(self.default_delay, delay or 0)
+
+    def done(self, host):
+        self._busy.discard(host)
+        self._next_at[host] = time.monotonic() + self._delays.get(host, self.default_delay)
+
+    def items(self):
+        for queue in self._queues.values():
+            yield from queue
+
+
+def host_in_scope(host, scope, seed_hosts):
+    if scope == 'any':
+        return True
+    if scope == 'host':
+        return host in seed_hosts
+    for seed in seed_hosts:
+        domain = seed[4:] if seed.startswith('www.') else seed
+        if host == domain or host.endswith('.' + domain):
+            return True
+    return False
+
+
+class Crawl:
+    """One crawl: its settings, frontier, seen set and a scheduler thread.
+
+    State lives in its own directory so a paused (or interrupted) crawl can
+    be resumed later, after a restart too.
+    """
+
+    SAVE_INTERVAL = 30
+
+    def __init__(self, crawl_id, directory, settings, scrape_fn, describe_error, robots):
+        self.id = crawl_id
+        self.directory = directory
+        self.settings = settings
+        self.scrape_fn = scrape_fn
+        self.describe_error = describe_error
+        self.robots = robots
+        self.status = 'created'
+        self.counters = {'dispatched': 0, 'succeeded': 0, 'failed': 0, 'robotsDisallowed': 0,
+                         'outOfScope': 0, 'duplicates': 0}
+        self.created_at = datetime.utcnow().isoformat()
+        self.finished_at = None
+        self.seed_hosts = {(urllib.parse.urlsplit(url).hostname or '').lower() for url in settings['seeds']}
+        self.frontier = Frontier(settings['delay'], settings['maxFrontier'])
+        self.seen = BloomFilter(settings['seenCapacity'])
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._final_status = None
+        self._last_save = time.monotonic()
+        self._save_lock = threading.Lock()
+        self._snapshots = 0
+        self._saved = 0
+        self._deleted = False
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def pages_path(self):
+        return os.path.join(self.directory, 'pages.ndjson')
+
+    def seed(self):
+        for url in self.settings['seeds']:
+            normalized = normalize_url(url)
+            if self.seen.add(normalized):
+                self.frontier.push(normalized, 0)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'status': self.status,
+                'settings': self.settings,
+                'counters': dict(self.counters),
+                'frontier': len(self.frontier),
+                'frontierDropped': self.frontier.dropped,
+                'inFlight': len(self._in_flight),
+                'seen': self.seen.count,
+                'createdAt': self.created_at,
+                'finishedAt': self.finished_at,
+            }
+
+    def start(self):
+        with self._lock:
+            if self.status in ACTIVE_STATUSES or self.status in ('completed', 'cancelled'):
+                return False
+            self.status = 'running'
+        self._thread = threading.Thread(target=self._run, name=f'crawl-{self.id[:8]}', daemon=True)
+        self._thread.start()
+        return True
+
+    def pause(self, wait=False):
+        return self._stop('paused', wait)
+
+    def cancel(self, wait=False):
+        return self._stop('cancelled', wait)
+
+    def delete(self):
+        """Cancel the crawl and remove its saved state without waiting for it.
+
+        A running crawl is only told to stop; its thread removes the directory
+        on the way out, once the pages in flight have finished.
+        """
+        with self._lock:
+            self._deleted = True
+            if self.status in ACTIVE_STATUSES:
+                self.status = 'pausing'
+                self._final_status = 'cancelled'
+                self._wakeup.notify_all()
+                return
+        self._remove()
+
+    def _stop(self, final_status, wait):
+        with self._lock:
+            if self.status not in ACTIVE_STATUSES:
+                if self.status in ('created', 'paused') and final_status == 'cancelled':
+                    self.status = 'cancelled'
+                    self.finished_at = datetime.utcnow().isoformat()
+                    snapshot = self._snapshot_locked()
+                else:
+                    return False
+            else:
+                snapshot = None
+                self.status = 'pausing'
+                self._final_status = final_status
+                self._wakeup.notify_all()
+        if snapshot is not None:
+            self._save(snapshot)
+            return True
+        if wait and self._thread is not None:
+            self._thread.join()
+        return True
+
+    def _run(self):
+        executor = ThreadPoolExecutor(max_workers=self.settings['concurrency'], thread_name_prefix=f'crawl-{self.id[:8]}')
+        try:
+            while True:
+                # The lock is held for one scheduling step; saves are written after it is released
+                with self._lock:
+                    if self.status == 'pausing':
+                        if not self._in_flight:
+                            self.status = self._final_status
+                            if self.status == 'cancelled':
+                                self.finished_at = datetime.utcnow().isoformat()
+                            break
+                        self._wakeup.wait(1)
+                        continue
+                    if self._limit_reached() or (not len(self.frontier) and not self._in_flight):
+                        if not self._in_flight:
+                            self.status = 'completed'
+                            self.finished_at = datetime.utcnow().isoformat()
+                            break
+                        self._wakeup.wait(1)
+                        continue
+                    if len(self._in_flight) >= self.settings['concurrency']:
+                        self._wakeup.wait(1)
+                        continue
+                    item, wait = self.frontier.pop()
+                    if item is None:
+                        self._wakeup.wait(wait if wait is not None else 1)
+                        continue
+                    url, depth = item
+                    self._in_flight[url] = depth
+                    self.counters['dispatched'] += 1
+                    executor.submit(self._visit, url, depth)
+                    if time.monotonic() - self._last_save < self.SAVE_INTERVAL:
+                        continue
+                    snapshot = self._snapshot_locked()
+                self._save(snapshot)
+            with self._lock:
+                snapshot = self._snapshot_locked()
+            self._save(snapshot)
+        except Exception as e:
+            logging.error(f"Crawl {self.id} stopped unexpectedly: {e}")
+            with self._lock:
+                self.status = 'paused'
+                snapshot = self._snapshot_locked()
+            self._save(snapshot)
+        finally:
+            executor.shutdown(wait=False)
+            if self._deleted:
+                self._remove()
+
+    def _limit_reached(self):
+        max_pages = self.settings['maxPages']
+        return max_pages is not None and self.counters['dispatched'] >= max_pages
+
+    def _visit(self, url, depth):
+        host = urllib.parse.urlsplit(url).netloc
+        started = time.monotonic()
+        entry = {'url': url, 'depth': depth}
+        found = []
+        try:
+            if self.settings['respectRobots']:
+                if not self.robots.allowed(url):
+                    entry['status'] = 'disallowed'
+                    return
+                delay = self.robots.crawl_delay(url)
+                with self._lock:
+                    self.frontier.set_delay(host, delay)
+            result, _ = self.scrape_fn(url, found, **self.settings['scrapeOptions'])
+            entry.update(status='ok', title=result.get('title'), id=result.get('id'))
+            if not found:
+                # Results served from the response cache only keep their first links
+                found = [link['url'] for link in result.get('links', [])]
+        except Exception as e:
+            message, status_code = self.describe_error(e)
+            entry.update(status='error', error=message, statusCode=status_code)
+        finally:
+            entry['elapsedMs'] = round((time.monotonic() - started) * 1000)
+            with self._lock:
+                if entry.get('status') == 'ok':
+                    self.counters['succeeded'] += 1
+                    if depth < self.settings['maxDepth']:
+                        entry['linksQueued'] = self._enqueue(url, found, depth + 1)
+                elif entry.get('status') == 'disallowed':
+                    self.counters['robotsDisallowed'] += 1
+                else:
+                    self.counters['failed'] += 1
+                self._in_flight.pop(url, None)
+                self.frontier.done(host)
+                self._append_page(entry)
+                self._wakeup.notify_all()
+
+    def _enqueue(self, base_url, links, depth):
+        # Caller holds the lock
+        queued = 0
+        for link in links:
+            absolute = urllib.parse.urljoin(base_url, link.strip())
+            parsed = urllib.parse.urlsplit(absolute)
+            if parsed.scheme not in ('http', 'https'):
+                continue
+            if os.path.splitext(parsed.path)[1].lower() in SKIPPED_EXTENSIONS:
+                continue
+            if not host_in_scope((parsed.hostname or '').lower(), self.settings['scope'], self.seed_hosts):
+                self.counters['outOfScope'] += 1
+                continue
+            normalized = normalize_url(absolute)
+            if not self.seen.add(normalized):
+                self.counters['duplicates'] += 1
+                continue
+            if self.frontier.push(normalized, depth):
+                queued += 1
+        return queued
+
+    def _append_page(self, entry):
+        # Caller holds the lock
+        if self._deleted:
+            return
+        with open(self.pages_path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def _snapshot_locked(self):
+        """Copy what _save persists; caller holds the lock, which _save does not need"""
+        # Pages being fetched right now go back to the front so a resume redoes them
+        pending = list(self._in_flight.items())
+        pending.extend(self.frontier.items())
+        state = {
+            'id': self.id,
+            'status': self.status,
+            'settings': self.settings,
+            'counters': dict(self.counters),
+            'createdAt': self.created_at,
+            'finishedAt': self.finished_at,
+            'frontierDropped': self.frontier.dropped,
+        }
+        self._snapshots += 1
+        self._last_save = time.monotonic()
+        return self._snapshots, state, pending, self.seen.to_bytes()
+
+    def _save(self, snapshot):
+        """Persist settings, counters, frontier and seen set from a snapshot, unless a newer one was saved"""
+        number, state, pending, seen = snapshot
+        with self._save_lock:
+            if number <= self._saved or self._deleted:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._write(os.path.join(self.directory, 'frontier.ndjson'),
+                        ''.join(json.dumps([url, depth]) + '\n' for url, depth in pending).encode('utf-8'))
+            self._write(os.path.join(self.directory, 'seen.bloom'), seen)
+            self._write(os.path.join(self.directory, 'state.json'), json.dumps(state).encode('utf-8'))
+            self._saved = number
+
+    def _remove(self):
+        with self._save_lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory, scrape_fn, describe_error, robots):
+        with open(os.path.join(directory, 'state.json')) as f:
+            state = json.load(f)
+        crawl = cls(state['id'], directory, state['settings'], scrape_fn, describe_error, robots)
+        crawl.counters.update(state['counters'])
+        crawl.created_at = state['createdAt']
+        crawl.finished_at = state.get('finishedAt')
+        # A crawl that was running when the process died resumes from its last save
+        crawl.status = 'paused' if state['status'] in ACTIVE_STATUSES else state['status']
+        crawl.frontier.dropped = state.get('frontierDropped', 0)
+        with open(os.path.join(directory, 'seen.bloom'), 'rb') as f:
+            crawl.seen = BloomFilter.from_bytes(f.read())
+        with open(os.path.join(directory, 'frontier.ndjson')) as f:
+            for line in f:
+                if line.strip():
+                    url, depth = json.loads(line)
+                    crawl.frontier.push(url, depth)
+        return crawl
+
+
+class CrawlManager:
+    """Creates crawls and keeps track of them, including ones persisted by earlier runs"""
+
+    def __init__(self, directory, scrape_fn, describe_error, robots, max_active=4):
+        self.directory = directory
+        self.scrape_fn = scrape_fn
+        self.describe_error = describe_error
+        self.robots = robots
+        self.max_active = max_active
+        self._crawls = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.exists(os.path.join(path, 'state.json')):
+                continue
+            try:
+                crawl = Crawl.load(path, scrape_fn, describe_error, robots)
+                self._crawls[crawl.id] = crawl
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Ignoring unreadable crawl state in {path}: {e}")
+
+    def create(self, settings):
+        with self._lock:
+            self._check_capacity()
+            crawl_id = uuid.uuid4().hex
+            crawl = Crawl(crawl_id, os.path.join(self.directory, crawl_id), settings,
+                          self.scrape_fn, self.describe_error, self.robots)
+            crawl.seed()
+            self._crawls[crawl_id] = crawl
+        crawl.start()
+        return crawl
+
+    def get(self, crawl_id):
+        return self._crawls.get(crawl_id)
+
+    def list(self):
+        return [crawl.summary() for crawl in sorted(self._crawls.values(), key=lambda c: c.created_at, reverse=True)]
+
+    def resume(self, crawl_id):
+        crawl = self._crawls.get(crawl_id)
+        if crawl is None:
+            return None
+        with self._lock:
+            if crawl.status == 'paused':
+                self._check_capacity()
+        return crawl.start()
+
+    def delete(self, crawl_id):
+        """Cancel a crawl and remove its saved state; a running crawl finishes that in the background"""
+        crawl = self._crawls.pop(crawl_id, None)
+        if crawl is None:
+            return False
+        crawl.delete()
+        return True
+
+    def shutdown(self):
+        for crawl in list(self._crawls.values()):
+            crawl.pause(wait=True)
+
+    def _check_capacity(self):
+        active = sum(1 for crawl in self._crawls.values() if crawl.status in ACTIVE_STATUSES)
+        if active >= self.max_active:
+            raise CrawlLimitReached(f'At most {self.max_active} crawls can run at once')
+
+
+class CrawlLimitReached(Exception):
+    """Raised when starting another crawl would exceed CRAWL_MAX_ACTIVE"""
+
+
+def make_settings(seeds, max_depth=2, max_pages=1000, scope='domain', concurrency=4, delay=1.0,
+                  respect_robots=True, max_frontier=None, scrape_options=None):
+    """Validated crawl settings; raises ValueError with a user-facing message"""
+    if not isinstance(seeds, list) or not seeds:
+        raise ValueError('seeds must be a non-empty list of URLs')
+    if scope not in SCOPES:
+        raise ValueError(f"scope must be one of {', '.join(SCOPES)}")
+    for name, value, low, high in (('max_depth', max_depth, 0, 50), ('concurrency', concurrency, 1, 32)):
+        if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+            raise ValueError(f'{name} must be an integer between {low} and {high}')
+    if max_pages is not None and (not isinstance(max_pages, int) or isinstance(max_pages, bool) or max_pages < 1):
+        raise ValueError('max_pages must be a positive integer')
+    if not isinstance(delay, (int, float)) or isinstance(delay, bool) or delay < 0:
+        raise ValueError('delay must be a non-negative number of seconds')
+    return {
+        'seeds': seeds,
+        'maxDepth': max_depth,
+        'maxPages': max_pages,
+        'scope': scope,
+        'concurrency': concurrency,
+        'delay': float(delay),
+        'respectRobots': bool(respect_robots),
+        'maxFrontier': max_frontier or int(os.getenv('CRAWL_MAX_FRONTIER', '1000000')),
+        'seenCapacity': int(os.getenv('CRAWL_SEEN_CAPACITY', '5000000')),
+        'scrapeOptions': scrape_options or {},
+    }
+
+
+def fetch_robots(url):
+    from http_client import get_fetch_client, ContentTypeRejected
+    try:
+        page = get_fetch_client().fetch_page(url, headers={'User-Agent': os.getenv('CRAWL_USER_AGENT', 'Mozilla/5.0')},
+                                             timeout=10, max_bytes=512 * 1024)
+    except ContentTypeRejected:
+        return 404, ''
+    return page.status_code, page.text
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_crawl_manager(scrape_fn, describe_error):
+    """Return the process-wide crawl manager, reloading crawls saved by earlier runs"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            basedir = os.path.abspath(os.path.dirname(__file__))
+            robots = RobotsCache(
+                fetch_robots,
+                user_agent=os.getenv('CRAWL_ROBOTS_AGENT', '*'),
+                ttl=float(os.getenv('CRAWL_ROBOTS_TTL', str(24 * 3600))),
+            )
+            _manager = CrawlManager(
+                os.getenv('CRAWL_DIR', os.path.join(basedir, '.scrape_state', 'crawls')),
+                scrape_fn,
+                describe_error,
+                robots,
+                max_active=int(os.getenv('CRAWL_MAX_ACTIVE', '4')),
+            )
+        return _manager
+
+
+def shutdown_crawl_manager():
+    """Pause every running crawl and save it so it can be resumed after a restart"""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.shutdown()
+        _manager = None
@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+_driver_path = None
+_failed_at = None
+_driver_lock = threading.Lock()
+
+
+def _cache_file():
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    return os.getenv('CHROMEDRIVER_CACHE_FILE', os.path.join(basedir, '.scrape_state', 'chromedriver.json'))
+
+
+def _read_cached():
+    try:
+        with open(_cache_file()) as f:
+            path = json.load(f).get('path')
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable chromedriver cache: {e}")
+        return None
+    return path if path and os.access(path, os.X_OK) else None
+
+
+def _write_cached(path):
+    cache_file = _cache_file()
+    tmp_path = f'{cache_file}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump({'path': path}, f)
+        os.replace(tmp_path, cache_file)
+    except OSError as e:
+        logging.warning(f"Could not cache chromedriver path: {e}")
+
+
+def resolve_chromedriver():
+    """Path of the chromedriver binary, resolved once per process.
+
+    CHROMEDRIVER_PATH wins, then the path cached on disk by an earlier run,
+    then a chromedriver on PATH. Only when none of those exist is
+    webdriver-manager asked to download one, and its answer is cached so
+    later runs (and offline hosts) skip the network check it does on every
+    install() call. A failed download is not retried for
+    CHROMEDRIVER_RETRY_AFTER seconds, so an offline host fails fast.
+    """
+    global _driver_path, _failed_at
+    with _driver_lock:
+        if _driver_path is not None and os.access(_driver_path, os.X_OK):
+            return _driver_path
+
+        path = os.getenv('CHROMEDRIVER_PATH') or _read_cached() or shutil.which('chromedriver')
+        if path is None:
+            retry_after = float(os.getenv('CHROMEDRIVER_RETRY_AFTER', '300'))
+            if _failed_at is not None and time.monotonic() - _failed_at < retry_after:
+                raise RuntimeError('No chromedriver available (download failed recently)')
+            from webdriver_manager.chrome import ChromeDriverManager
+            try:
+                path = ChromeDriverManager().install()
+            except Exception:
+                _failed_at = time.monotonic()
+                raise
+            logging.info(f"Downloaded chromedriver to {path}")
+            _write_cached(path)
+        _driver_path = path
+        _failed_at = None
+        return path
+
+
+def reset_chromedriver():
+    """Forget the resolved driver, e.g. after Chrome was upgraded past it"""
+    global _driver_path, _failed_at
+    with _driver_lock:
+        _driver_path = _failed_at = None
+        try:
+            os.remove(_cache_file())
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,272 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Stored at the top level of a history document; everything else lives under 'result'
+DOCUMENT_FIELDS = ('id', 'url', 'title', 'user', 'createdAt')
+RESULT_FIELDS = ('textContent', 'links', 'images', 'productInfo', 'metaTags', 'schemaData', 'headers',
+                 'features', 'reviews', 'wordCount', 'scrapedAt', 'renderStats')
+DEFAULT_FIELDS = DOCUMENT_FIELDS + RESULT_FIELDS
+
+# Lists of objects and objects that CSV spreads over one column per key
+FLAT_KEYS = {
+    'productInfo': ('name', 'price', 'description', 'category'),
+    'links': ('text', 'url'),
+    'images': ('src', 'alt', 'title'),
+    'headers': ('tag', 'text'),
+}
+LIST_SEPARATOR = ' | '
+
+BATCH_SIZE = 500
+ROW_GROUP_SIZE = 2000
+
+
+def parse_fields(value):
+    """Requested export fields in a stable order; raises ValueError on unknown names"""
+    if not value:
+        return list(DEFAULT_FIELDS)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in DEFAULT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(DEFAULT_FIELDS)}")
+    return list(dict.fromkeys(fields))
+
+
+def parse_date(value, name):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 date or timestamp')
+    # createdAt is stored as naive UTC
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def build_query(since=None, until=None, url=None, user=None):
+    """Export filter; like history listing, user=None selects the anonymous scrapes"""
+    query = {'user': user}
+    if since or until:
+        query['createdAt'] = {}
+        if since:
+            query['createdAt']['$gte'] = since
+        if until:
+            query['createdAt']['$lt'] = until
+    if url:
+        query['url'] = url
+    return query
+
+
+def projection_for(fields):
+    projection = {'_id': 1}
+    for field in fields:
+        if field == 'id':
+            continue
+        projection[field if field in DOCUMENT_FIELDS else f'result.{field}'] = 1
+    return projection
+
+
+def iter_documents(collection, fields, query):
+    """History documents oldest first, fetched in batches so memory stays flat"""
+    cursor = collection.find(query, projection_for(fields)).sort('createdAt', 1).batch_size(BATCH_SIZE)
+    try:
+        for doc in cursor:
+            yield doc
+    finally:
+        cursor.close()
+
+
+def to_json_safe(value):
+    """ObjectIds and datetimes as strings, recursively, without a dumps/loads round trip"""
+    if isinstance(value, dict):
+        return {key: to_json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_safe(item) for item in value]
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def to_record(doc, fields):
+    """One export row as a dict of the selected fields"""
+    result = doc.get('result') or {}
+    record = {}
+    for field in fields:
+        if field == 'id':
+            record['id'] = str(doc['_id'])
+        elif field in DOCUMENT_FIELDS:
+            record[field] = doc.get(field)
+        else:
+            record[field] = result.get(field)
+    return record
+
+
+def ndjson_rows(docs, fields):
+    for doc in docs:
+        yield json.dumps(to_json_safe(to_record(doc, fields))) + '\n'
+
+
+def csv_columns(fields):
+    columns = []
+    for field in fields:
+        if field in FLAT_KEYS:
+            columns.extend(f'{field}.{key}' for key in FLAT_KEYS[field])
+        else:
+            columns.append(field)
+    return columns
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        if isinstance(value, list) and all(isinstance(item, str) for item in value):
+            return LIST_SEPARATOR.join(value)
+        return json.dumps(to_json_safe(value))
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def flatten_for_csv(record, fields):
+    row = []
+    for field in fields:
+        value = record.get(field)
+        if field not in FLAT_KEYS:
+            row.append(_csv_cell(value))
+        elif isinstance(value, dict):
+            row.extend(_csv_cell(value.get(key)) for key in FLAT_KEYS[field])
+        else:
+            items = value if isinstance(value, list) else []
+            row.extend(LIST_SEPARATOR.join(_csv_cell(item.get(key)) for item in items if isinstance(item, dict))
+                       for key in FLAT_KEYS[field])
+    return row
+
+
+def csv_rows(docs, fields, rows_per_chunk=200):
+    """CSV text in chunks of rows_per_chunk lines, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(csv_columns(fields))
+    pending = 0
+    for doc in docs:
+        writer.writerow(flatten_for_csv(to_record(doc, fields), fields))
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def parquet_schema(fields):
+    import pyarrow as pa
+    string_struct = lambda keys: pa.struct([(key, pa.string()) for key in keys])  # noqa: E731
+    types = {
+        'id': pa.string(),
+        'url': pa.string(),
+        'title': pa.string(),
+        'user': pa.string(),
+        'createdAt': pa.timestamp('ms'),
+        'textContent': pa.string(),
+        'links': pa.list_(string_struct(FLAT_KEYS['links'])),
+        'images': pa.list_(string_struct(FLAT_KEYS['images'])),
+        'productInfo': string_struct(FLAT_KEYS['productInfo']),
+        'headers': pa.list_(string_struct(FLAT_KEYS['headers'])),
+        'features': pa.list_(pa.string()),
+        'reviews': pa.list_(pa.string()),
+        'wordCount': pa.int64(),
+        'scrapedAt': pa.string(),
+        # Free-form objects are kept as JSON text
+        'metaTags': pa.string(),
+        'schemaData': pa.string(),
+        'renderStats': pa.string(),
+    }
+    return pa.schema([(field, types[field]) for field in fields])
+
+
+_JSON_COLUMNS = ('metaTags', 'schemaData', 'renderStats')
+
+
+def _parquet_record(record):
+    for field in _JSON_COLUMNS:
+        if field in record and record[field] is not None:
+            record[field] = json.dumps(to_json_safe(record[field]))
+    return record
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands each written chunk to the generator streaming it"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def parquet_chunks(docs, fields, row_group_size=ROW_GROUP_SIZE):
+    """Parquet file bytes, one row group at a time; only a row group is ever held in memory"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(fields)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        rows = []
+        for doc in docs:
+            rows.append(_parquet_record(to_record(doc, fields)))
+            if len(rows) >= row_group_size:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                rows = []
+                yield sink.drain()
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_stream(fmt, docs, fields):
+    if fmt == 'ndjson':
+        return ndjson_rows(docs, fields)
+    if fmt == 'csv':
+        return csv_rows(docs, fields)
+    return parquet_chunks(docs, fields)
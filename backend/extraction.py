@@ -0,0 +1,427 @@
+import json
+import os
+import re
+import urllib.parse
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+
+# Generic e-commerce selectors, tried in priority order per field
+PRODUCT_SELECTORS = {
+    'name': ['h1.product-title', 'h1.title', '.product-name', '.product-title', '[data-testid="product-title"]', '[data-product-title]'],
+    'price': ['.price', '.product-price', '.current-price', '.sale-price', '[data-price]', '.money', '.cost'],
+    'description': ['.description', '.product-description', '.product-details', 'meta[name="description"]', 'meta[property="og:description"]'],
+    'category': ['.breadcrumb', '.category', '.product-category', '.nav-breadcrumb'],
+}
+FEATURE_SELECTORS = ['.features', '.specifications', '.specs', '.product-features']
+REVIEW_SELECTORS = ['.reviews', '.review', '.customer-reviews']
+
+HEADING_TAGS = ('h1', 'h2', 'h3')
+
+# Output limits, matching what the API has always returned
+TEXT_LIMIT = 1000
+MAX_LINKS = 50
+MAX_IMAGES = 20
+MAX_HEADERS = 30
+MAX_FEATURES = 10
+MAX_REVIEWS = 5
+
+_SIMPLE_SELECTOR = re.compile(
+    r'^(?P<tag>[a-zA-Z][\w-]*)?'
+    r'(?P<classes>(?:\.[\w-]+)*)'
+    r'(?P<attrs>(?:\[[\w-]+(?:[*^$]?=(?:"[^"]*"|\'[^\']*\'|[\w-]+))?\])*)$'
+)
+_ATTR = re.compile(r'\[([\w-]+)(?:([*^$]?=)(?:"([^"]*)"|\'([^\']*)\'|([\w-]+)))?\]')
+
+
+def resolve_parser():
+    """Parser for BeautifulSoup: HTML_PARSER env, else lxml when installed, else html.parser"""
+    parser = os.getenv('HTML_PARSER', 'auto')
+    if parser != 'auto':
+        return parser
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+HTML_PARSER = resolve_parser()
+
+
+def make_soup(markup, parser=None):
+    return BeautifulSoup(markup, parser or HTML_PARSER)
+
+
+class CompiledSelector:
+    """A CSS selector reduced to a cheap per-element predicate.
+
+    Simple compound selectors (tag, classes, attribute tests) are matched
+    directly against element attributes; anything more complex falls back to
+    a precompiled soupsieve matcher. attr, when set, names the attribute that
+    holds the field's value instead of the element text.
+    """
+
+    def __init__(self, selector, attr=None):
+        self.selector = selector
+        self.attr = attr
+        self.tag = None
+        self.classes = ()
+        self.attrs = ()
+        self._fallback = None
+
+        match = _SIMPLE_SELECTOR.match(selector.strip())
+        if match:
+            self.tag = (match.group('tag') or '').lower() or None
+            self.classes = tuple(c for c in match.group('classes').split('.') if c)
+            attrs = []
+            for name, op, double_quoted, single_quoted, bare in _ATTR.findall(match.group('attrs')):
+                value = (double_quoted or single_quoted or bare) if op else None
+                attrs.append((name.lower(), op, value))
+            self.attrs = tuple(attrs)
+        else:
+            import soupsieve
+            self._fallback = soupsieve.compile(selector)
+
+    @property
+    def index_key(self):
+        """Most selective cheap key used to find candidate selectors for an element"""
+        if self._fallback is not None:
+            return None
+        if self.classes:
+            return ('class', self.classes[0])
+        if self.attrs:
+            return ('attr', self.attrs[0][0])
+        return ('tag', self.tag)
+
+    def matches(self, element):
+        if self._fallback is not None:
+            return self._fallback.match(element)
+        if self.tag and element.name != self.tag:
+            return False
+        if self.classes:
+            element_classes = element.get('class') or ()
+            if any(c not in element_classes for c in self.classes):
+                return False
+        for name, op, value in self.attrs:
+            actual = element.get(name)
+            if actual is None:
+                return False
+            if not op:
+                continue
+            if isinstance(actual, list):
+                actual = ' '.join(actual)
+            if op == '=' and actual != value:
+                return False
+            if op == '*=' and value not in actual:
+                return False
+            if op == '^=' and not actual.startswith(value):
+                return False
+            if op == '$=' and not actual.endswith(value):
+                return False
+        return True
+
+
+class SelectorIndex:
+    """Precompiled selector groups, indexed by class, attribute and tag name.
+
+    Groups may also hold rules that are not CSS (see site_templates); those
+    are kept in their priority slot but never matched against elements.
+    """
+
+    def __init__(self, groups):
+        # groups: {field: [selector or rule, ...]} in priority order
+        self.groups = {field: [CompiledSelector(s) if isinstance(s, str) else s for s in selectors]
+                       for field, selectors in groups.items()}
+        self._by_class = {}
+        self._by_attr = {}
+        self._by_tag = {}
+        self._unindexed = []
+        for field, compiled in self.groups.items():
+            for priority, selector in enumerate(compiled):
+                if not isinstance(selector, CompiledSelector):
+                    continue
+                entry = (field, priority, selector)
+                key = selector.index_key
+                if key is None:
+                    self._unindexed.append(entry)
+                elif key[0] == 'class':
+                    self._by_class.setdefault(key[1], []).append(entry)
+                elif key[0] == 'attr':
+                    self._by_attr.setdefault(key[1], []).append(entry)
+                else:
+                    self._by_tag.setdefault(key[1], []).append(entry)
+
+    def candidates(self, element):
+        found = self._by_tag.get(element.name, [])
+        classes = element.get('class')
+        if classes and self._by_class:
+            for name in classes:
+                entries = self._by_class.get(name)
+                if entries:
+                    found = found + entries
+        if self._by_attr:
+            for name in element.attrs:
+                entries = self._by_attr.get(name)
+                if entries:
+                    found = found + entries
+        if self._unindexed:
+            found = found + self._unindexed
+        return found
+
+
+class Extraction:
+    """Fields pulled from one page plus the raw tag counts the render heuristic needs.
+
+    hrefs holds every anchor target as written in the page, uncapped, for crawling.
+    """
+
+    def __init__(self, fields, anchor_count, image_count, hrefs=None):
+        self.fields = fields
+        self.anchor_count = anchor_count
+        self.image_count = image_count
+        self.hrefs = hrefs if hrefs is not None else []
+
+
+class PageContext:
+    """What rules evaluated after the walk get to see of a page"""
+
+    def __init__(self, soup, html, schema_data):
+        self.soup = soup
+        self.html = html
+        self.schema_data = schema_data
+        self._tree = None
+
+    @property
+    def tree(self):
+        """lxml tree of the page for XPath rules, parsed on first use"""
+        if self._tree is None:
+            import lxml.html
+            markup = self.html if self.html is not None else str(self.soup)
+            try:
+                self._tree = lxml.html.fromstring(markup)
+            except Exception:
+                # Empty or unparseable documents have nothing to select
+                return None
+        return self._tree
+
+
+class PageExtractor:
+    """Collects every output field in a single walk over the parsed tree.
+
+    product_selectors maps each productInfo field to its selectors (or rules)
+    in priority order; template names the site template the extractor was
+    compiled from and is reported in the result.
+    """
+
+    def __init__(self, product_selectors=None, feature_selectors=None, review_selectors=None, template=None):
+        product_selectors = PRODUCT_SELECTORS if product_selectors is None else product_selectors
+        self.product_fields = tuple(product_selectors)
+        self.template = template
+        self.index = SelectorIndex({
+            **product_selectors,
+            'features': FEATURE_SELECTORS if feature_selectors is None else feature_selectors,
+            'reviews': REVIEW_SELECTORS if review_selectors is None else review_selectors,
+        })
+
+    def extract(self, soup, url, title=None, html=None):
+        links = []
+        images = []
+        meta_tags = {}
+        schema_data = []
+        headings = {tag: [] for tag in HEADING_TAGS}
+        text_parts = []
+        text_length = 0
+        word_count = 0
+        anchor_count = 0
+        hrefs = []
+        image_count = 0
+        title_tag = None
+        og_title = twitter_title = og_image = None
+        # field -> {priority: first matching element}; reviews keep up to MAX_REVIEWS per selector
+        first_match = {field: {} for field in self.index.groups if field != 'reviews'}
+        review_matches = {}
+
+        for node in soup.descendants:
+            if not isinstance(node, Tag):
+                # Same strings get_text() would use: skips comments, scripts and styles
+                if type(node) is NavigableString or type(node) is CData:
+                    stripped = node.strip()
+                    if stripped:
+                        word_count += len(stripped.split())
+                        # Keep just enough text to fill the output and know it overflowed
+                        if text_length <= TEXT_LIMIT + 1:
+                            text_parts.append(stripped)
+                            text_length += len(stripped) + 1
+                continue
+
+            name = node.name
+            if name == 'a':
+                href = node.get('href')
+                if href is not None:
+                    anchor_count += 1
+                    hrefs.append(href)
+                    self._add_link(node, url, links)
+            elif name == 'img':
+                image_count += 1
+                self._add_image(node, url, images)
+            elif name == 'meta':
+                key = node.get('name') or node.get('property')
+                content = node.get('content')
+                if key and content:
+                    meta_tags[key] = content
+                prop = node.get('property')
+                if prop == 'og:title' and og_title is None:
+                    og_title = node
+                elif prop == 'og:image' and og_image is None:
+                    og_image = node
+                if node.get('name') == 'twitter:title' and twitter_title is None:
+                    twitter_title = node
+            elif name == 'script':
+                if node.get('type') == 'application/ld+json':
+                    try:
+                        schema_data.append(json.loads(node.string))
+                    except Exception:
+                        pass
+            elif name in headings:
+                headings[name].append({'tag': name, 'text': node.get_text(strip=True)})
+            elif name == 'title' and title_tag is None:
+                title_tag = node
+
+            for field, priority, selector in self.index.candidates(node):
+                if field == 'reviews':
+                    matched = review_matches.setdefault(priority, [])
+                    if len(matched) < MAX_REVIEWS and selector.matches(node):
+                        matched.append(node)
+                elif priority not in first_match[field] and selector.matches(node):
+                    first_match[field][priority] = node
+
+        if not title or title == 'No title':
+            title_source = og_title or twitter_title
+            if title_source is not None:
+                title = title_source.get('content') or 'No title'
+            elif title_tag is not None and title_tag.string:
+                title = title_tag.string
+            else:
+                title = 'No title'
+
+        if len(images) < 5 and og_image is not None and og_image.get('content'):
+            images.insert(0, {'src': og_image['content'], 'alt': 'Social Share Image', 'title': 'Main Image'})
+
+        page = PageContext(soup, html, schema_data)
+
+        product_info = {field: self._field_value(field, first_match.get(field, {}), page)
+                        for field in self.product_fields}
+
+        # The first selector (in priority order) that matched a container wins, even if it lists nothing
+        features = []
+        for priority, rule in enumerate(self.index.groups['features']):
+            if isinstance(rule, CompiledSelector):
+                features_root = first_match['features'].get(priority)
+                if features_root is None:
+                    continue
+                for item in features_root.find_all(['li', 'div', 'span']):
+                    feature_text = item.get_text(strip=True)
+                    if feature_text:
+                        features.append(feature_text)
+                        if len(features) >= MAX_FEATURES:
+                            break
+                break
+            features = rule.values(page)[:MAX_FEATURES]
+            if features:
+                break
+
+        reviews = []
+        for priority, rule in enumerate(self.index.groups['reviews']):
+            if isinstance(rule, CompiledSelector):
+                texts = [self._element_value(review, rule) for review in review_matches.get(priority, ())]
+            else:
+                texts = rule.values(page)
+            reviews = [text[:200] for text in texts if text][:MAX_REVIEWS]
+            if reviews:
+                break
+
+        headers = [entry for tag in HEADING_TAGS for entry in headings[tag]]
+        text_content = ' '.join(text_parts)
+
+        fields = {
+            'title': str(title),
+            'textContent': text_content[:TEXT_LIMIT] + ('...' if len(text_content) > TEXT_LIMIT else ''),
+            'links': links[:MAX_LINKS],
+            'images': images[:MAX_IMAGES],
+            'productInfo': product_info,
+            'metaTags': meta_tags,
+            'schemaData': schema_data,
+            'headers': headers[:MAX_HEADERS],
+            'features': features[:MAX_FEATURES],
+            'reviews': reviews[:MAX_REVIEWS],
+            'wordCount': word_count,
+        }
+        if self.template is not None:
+            fields['template'] = self.template
+        return Extraction(fields, anchor_count, image_count, hrefs)
+
+    def _field_value(self, field, matches, page):
+        # Lowest priority wins, like trying select_one() per selector in order;
+        # other rules count as found once they produce a value
+        for priority, rule in enumerate(self.index.groups[field]):
+            if isinstance(rule, CompiledSelector):
+                element = matches.get(priority)
+                if element is None:
+                    continue
+                if rule.attr is None and field == 'description':
+                    return element.get('content', element.get_text(strip=True))
+                return self._element_value(element, rule)
+            value = rule.value(page)
+            if value is not None:
+                return value
+        return None
+
+    @staticmethod
+    def _element_value(element, selector):
+        if selector.attr is None:
+            return element.get_text(strip=True)
+        value = element.get(selector.attr)
+        return ' '.join(value) if isinstance(value, list) else value
+
+    @staticmethod
+    def _add_link(link, url, links):
+        link_url = link['href']
+        # Filter out empty or javascript links
+        if not link_url or link_url.startswith('javascript:') or link_url == '#':
+            return
+        if link_url.startswith('/'):
+            # Convert relative URLs to absolute
+            link_url = urllib.parse.urljoin(url, link_url)
+
+        link_text = link.get_text(strip=True)
+        # Fallback for image-only links
+        if not link_text:
+            img = link.find('img')
+            if img:
+                link_text = img.get('alt') or 'Image Link'
+
+        if link_text:
+            links.append({'text': link_text[:100], 'url': link_url})
+
+    @staticmethod
+    def _add_image(img, url, images):
+        img_src = img.get('src') or img.get('data-src') or img.get('data-original')
+        if img_src and not img_src.startswith('data:'):  # Skip base64
+            if img_src.startswith('/'):
+                img_src = urllib.parse.urljoin(url, img_src)
+            if img_src.startswith('http'):
+                images.append({'src': img_src, 'alt': img.get('alt', ''), 'title': img.get('title', '')})
+
+
+_default_extractor = PageExtractor()
+
+
+def extract_page(soup, url, title=None, html=None):
+    """Extract the standard result fields from a parsed page in one traversal.
+
+    Pages matched by a registered site template use its compiled rules;
+    everything else gets the generic selectors. html is the markup the soup
+    was parsed from, passed along so XPath rules need not re-serialize it.
+    """
+    from site_templates import extractor_for  # site_templates builds on this module
+    return (extractor_for(url) or _default_extractor).extract(soup, url, title, html)
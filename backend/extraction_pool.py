@@ -0,0 +1,278 @@
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+
+class ExtractionError(Exception):
+    """A page could not be parsed and extracted by the pool"""
+
+
+class ExtractionTimeout(ExtractionError):
+    """Parsing and extraction took longer than the task timeout; the worker was killed"""
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        # Peak rather than current, but still a fair trigger for recycling
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _worker_main(conn, memory_limit, max_tasks, max_rss):
+    """Executed in a worker process: parse and extract pages until told to stop or recycled.
+
+    Each task is a (url, title) header followed by the page as UTF-8 bytes;
+    the reply is (status, payload, parse_seconds, extract_seconds, recycle).
+    """
+    # Ctrl-C and gunicorn's signals go to the whole process group; the parent decides when we stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if memory_limit:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    from extraction import make_soup, extract_page
+
+    tasks = 0
+    while True:
+        try:
+            header = conn.recv()
+            if header is None:
+                return
+            body = conn.recv_bytes()
+        except (EOFError, OSError):
+            return
+        url, title = header
+        parse_seconds = extract_seconds = 0.0
+        try:
+            started = time.perf_counter()
+            html = body.decode('utf-8')
+            del body
+            soup = make_soup(html)
+            parse_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            reply = ('ok', extract_page(soup, url, title, html))
+            extract_seconds = time.perf_counter() - started
+            del soup, html
+        except MemoryError:
+            reply = ('memory', 'Page exceeded the extraction memory limit')
+        except Exception as e:
+            reply = ('error', f'{type(e).__name__}: {e}')
+        tasks += 1
+        # Parser garbage is spread over many small objects the allocator rarely hands
+        # back, so a worker that grew past max_rss exits and is replaced by a fresh one
+        recycle = reply[0] == 'memory' or tasks >= max_tasks or (max_rss and _rss_bytes() > max_rss)
+        try:
+            conn.send(reply + (parse_seconds, extract_seconds, recycle))
+        except (EOFError, OSError):
+            return
+        if recycle:
+            return
+
+
+class _Worker:
+    def __init__(self, context, memory_limit, max_tasks, max_rss):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit, max_tasks, max_rss),
+                                       name='extraction-worker', daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, kill=False):
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(1 if not kill else 5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(5)
+        self.conn.close()
+
+
+class ExtractionPool:
+    """Parses and extracts pages on long-lived worker processes.
+
+    BeautifulSoup and the extractors are pure Python, so on request threads
+    they hold the GIL and concurrent scrapes in one server process take
+    turns. Fetching and rendering stay on those threads; only the page text
+    crosses to a worker, once, as bytes over a pipe, and the Extraction
+    comes back. A task that runs past task_timeout has its worker killed.
+    Workers run under an address-space limit of memory_limit bytes, and are
+    replaced after max_tasks pages or once their RSS exceeds max_rss.
+
+    Workers come from a forkserver rather than being forked from the server
+    itself, whose other threads may hold locks at the moment of the fork and
+    whose address space (browser threads, arenas) would eat the memory limit.
+    The forkserver imports the extraction modules once, so a replacement
+    worker starts in milliseconds; like any spawned process it still imports
+    the main module (gunicorn's, or app.py under the development server).
+    """
+
+    def __init__(self, workers=2, task_timeout=30.0, memory_limit=1024 << 20, max_tasks=500, max_rss=512 << 20):
+        self.size = max(1, workers)
+        self.task_timeout = task_timeout
+        self.memory_limit = memory_limit
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss
+        self._context = multiprocessing.get_context('forkserver')
+        self._context.set_forkserver_preload(['extraction', 'site_templates'])
+        self._idle = []
+        self._alive = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._counters = {'tasks': 0, 'failed': 0, 'timeouts': 0, 'recycled': 0, 'launches': 0}
+
+    def extract(self, html, url, title=None):
+        """Parse and extract one page on a worker; returns (Extraction, parse_seconds, extract_seconds).
+
+        Raises ExtractionTimeout when no worker frees up within task_timeout or
+        the page takes longer than that, and ExtractionError when it fails.
+        """
+        body = html.encode('utf-8', errors='surrogatepass') if isinstance(html, str) else html
+        worker = self._acquire(time.monotonic() + self.task_timeout)
+        deadline = time.monotonic() + self.task_timeout
+        reply = None
+        timed_out = False
+        try:
+            worker.conn.send((url, title))
+            worker.conn.send_bytes(body)
+            # poll() also returns when the worker dies, and recv() then raises EOFError
+            if worker.conn.poll(max(0.0, deadline - time.monotonic())):
+                reply = worker.conn.recv()
+            else:
+                timed_out = True
+        except (EOFError, OSError):
+            pass
+        finally:
+            self._release(worker, reply, timed_out)
+
+        if timed_out:
+            raise ExtractionTimeout(f'Extraction took longer than {self.task_timeout:g}s')
+        if reply is None:
+            raise ExtractionError(f'Extraction worker died (exit code {worker.process.exitcode})')
+        status, payload, parse_seconds, extract_seconds, _ = reply
+        if status != 'ok':
+            raise ExtractionError(payload)
+        return payload, parse_seconds, extract_seconds
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'alive': self._alive,
+                'busy': self._alive - len(self._idle),
+                'waiting': self._waiting,
+                **self._counters,
+            }
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._alive -= len(idle)
+            self._cond.notify_all()
+        for worker in idle:
+            worker.stop()
+
+    def _acquire(self, deadline):
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise ExtractionError('Extraction pool is shut down')
+                    if self._idle:
+                        return self._idle.pop()
+                    if self._alive < self.size:
+                        self._alive += 1
+                        self._counters['launches'] += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise ExtractionTimeout('No extraction worker became free in time')
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+        try:
+            return _Worker(self._context, self.memory_limit, self.max_tasks, self.max_rss)
+        except Exception:
+            with self._cond:
+                self._alive -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, worker, reply, timed_out):
+        keep = reply is not None and not reply[4]
+        if not keep:
+            # Timed out, crashed, or asked to be recycled: a fresh worker replaces it on demand
+            worker.stop(kill=reply is None)
+            if timed_out:
+                logging.warning(f"Killed extraction worker {worker.process.pid} after {self.task_timeout:g}s")
+        with self._cond:
+            self._counters['tasks'] += 1
+            if timed_out:
+                self._counters['timeouts'] += 1
+            elif reply is None or reply[0] != 'ok':
+                self._counters['failed'] += 1
+            if keep and not self._closed:
+                self._idle.append(worker)
+            else:
+                self._alive -= 1
+                if reply is not None and reply[4]:
+                    self._counters['recycled'] += 1
+            self._cond.notify()
+        if keep and self._closed:
+            worker.stop()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool():
+    """This process's extraction pool, or None to parse and extract in-process.
+
+    EXTRACT_WORKERS=0 turns the pool off. Job workers are processes of their
+    own already, so they (like any multiprocessing child) extract in-process.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            workers = int(os.getenv('EXTRACT_WORKERS', str(os.cpu_count() or 1)))
+            if workers < 1 or multiprocessing.parent_process() is not None:
+                return None
+            _pool = ExtractionPool(
+                workers=workers,
+                task_timeout=float(os.getenv('EXTRACT_TASK_TIMEOUT', '30')),
+                memory_limit=int(os.getenv('EXTRACT_MEMORY_LIMIT_MB', '1024')) << 20,
+                max_tasks=int(os.getenv('EXTRACT_MAX_TASKS', '500')),
+                max_rss=int(os.getenv('EXTRACT_RECYCLE_RSS_MB', '512')) << 20,
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def extraction_pool_stats():
+    if _pool is None or _pool_pid != os.getpid():
+        return {'started': False}
+    return dict(_pool.stats(), started=True)
+
+
+def shutdown_extraction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
@@ -0,0 +1,38 @@
+import logging
+import os
+
+wsgi_app = 'wsgi:app'
+bind = os.getenv('BIND', '0.0.0.0:5000')
+# Exactly one worker is supported. Crawls, the job queue and its cancellations,
+# the in-memory job store, the strategy table and the /metrics counters are all
+# state of the serving process; a second worker would see none of it. Scrapes
+# mostly wait on the network and on browsers, so threads serve them well, and
+# the CPU-bound parsing and extraction already spread over every core through
+# the extraction pool (EXTRACT_WORKERS, one per core by default).
+workers = 1
+if int(os.getenv('WEB_CONCURRENCY', '1')) != 1:
+    logging.warning('gunicorn.conf.py: WEB_CONCURRENCY is ignored, the scraper runs a single worker process')
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# A render may take a minute; give in-flight scrapes that long to finish on shutdown
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '60'))
+# Load the app once in the master so a recycled worker starts without re-importing it
+preload_app = True
+# Recycling is opt-in: with a single worker every recycle is an outage that fails
+# running jobs, drops an in-memory job queue and pauses active crawls. Browsers
+# are recycled by the browser pool and parsers by the extraction pool already.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+
+def post_fork(server, worker):
+    import app as scrape_app
+    # Connections made by the preloading master must not be shared across processes
+    scrape_app.connect_database()
+    scrape_app.start_worker()
+
+
+def worker_exit(server, worker):
+    import app as scrape_app
+    scrape_app.shutdown_services()
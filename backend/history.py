@@ -0,0 +1,197 @@
+import base64
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+# Fields returned when listing history; full results are fetched one at a time
+LIST_PROJECTION = {'url': 1, 'title': 1, 'user': 1, 'createdAt': 1}
+
+HISTORY_INDEXES = (
+    [('createdAt', DESCENDING), ('_id', DESCENDING)],
+    [('url', ASCENDING), ('createdAt', DESCENDING)],
+    [('user', ASCENDING), ('createdAt', DESCENDING)],
+)
+
+
+def history_document(result, user=None):
+    """Document stored for one scrape; the id is assigned here so callers know it up front"""
+    return {
+        '_id': ObjectId(),
+        'url': result['url'],
+        'title': result.get('title'),
+        'user': user,
+        'result': result,
+        'createdAt': datetime.utcnow(),
+    }
+
+
+def ensure_indexes(collection):
+    for keys in HISTORY_INDEXES:
+        collection.create_index(keys)
+
+
+class HistoryWriter:
+    """Write-behind buffer that saves scrape results with batched insert_many.
+
+    add() only appends to an in-memory buffer, so persisting history never
+    adds a database round trip to a scrape. A background thread flushes once
+    batch_size documents are waiting or flush_interval seconds have passed.
+    When the buffer holds max_buffered documents new ones are dropped (and
+    counted) rather than letting a slow database grow memory without bound.
+    """
+
+    def __init__(self, collection, batch_size=50, flush_interval=1.0, max_buffered=5000):
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._counters = {'written': 0, 'dropped': 0, 'batches': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+
+    def add(self, doc):
+        with self._cond:
+            if self._closed or len(self._buffer) >= self.max_buffered:
+                self._counters['dropped'] += 1
+                return False
+            self._buffer.append(doc)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+            return True
+
+    def flush(self):
+        """Write everything buffered so far; safe to call from any thread"""
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                if not batch:
+                    return
+                self._write(batch)
+
+    def close(self, timeout=10):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters, buffered=len(self._buffer), maxBuffered=self.max_buffered,
+                        batchSize=self.batch_size)
+
+    def _write(self, batch):
+        try:
+            self.collection.insert_many(batch, ordered=False)
+            written = len(batch)
+        except Exception as e:
+            # A BulkWriteError still reports how many documents made it in
+            written = (getattr(e, 'details', None) or {}).get('nInserted', 0)
+            logging.error(f"Could not save {len(batch) - written} history document(s): {e}")
+            with self._cond:
+                self._counters['errors'] += 1
+                self._counters['dropped'] += len(batch) - written
+        with self._cond:
+            self._counters['written'] += written
+            self._counters['batches'] += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+
+def encode_cursor(doc):
+    raw = f"{doc['createdAt'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, doc_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), ObjectId(doc_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def query_history(collection, limit=10, cursor=None, url=None, user=None):
+    """One page of history, newest first, using keyset pagination on (createdAt, _id).
+
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    Only scrapes made by user are listed; user=None lists anonymous ones.
+    """
+    query = {'user': user}
+    if url:
+        query['url'] = url
+    if cursor:
+        created_at, doc_id = decode_cursor(cursor)
+        query['$or'] = [
+            {'createdAt': {'$lt': created_at}},
+            {'createdAt': created_at, '_id': {'$lt': doc_id}},
+        ]
+    docs = list(collection.find(query, LIST_PROJECTION)
+                .sort([('createdAt', DESCENDING), ('_id', DESCENDING)])
+                .limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_history_writer(collection):
+    """Return this process's history writer, or None without a database"""
+    global _writer, _writer_pid
+    if collection is None:
+        return None
+    with _writer_lock:
+        # The flush thread does not survive a fork, so worker processes get their own
+        if _writer is None or _writer_pid != os.getpid():
+            _writer = HistoryWriter(
+                collection,
+                batch_size=int(os.getenv('HISTORY_BATCH_SIZE', '50')),
+                flush_interval=float(os.getenv('HISTORY_FLUSH_INTERVAL', '1.0')),
+                max_buffered=int(os.getenv('HISTORY_MAX_BUFFERED', '5000')),
+            )
+            _writer_pid = os.getpid()
+            if multiprocessing.parent_process() is not None:
+                # Pool workers leave through os._exit, which skips atexit
+                multiprocessing.util.Finalize(None, _writer.close, exitpriority=10)
+        return _writer
+
+
+def history_writer_stats():
+    if _writer is None or _writer_pid != os.getpid():
+        return {'started': False}
+    return dict(_writer.stats(), started=True)
+
+
+def close_history_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is not None and _writer_pid == os.getpid():
+            _writer.close()
+        _writer = None
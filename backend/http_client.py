@@ -0,0 +1,309 @@
+import codecs
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Transient statuses worth another attempt before falling back to a browser
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Content types we are willing to download and parse as a page
+PAGE_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'text/xml', 'application/xml', 'text/plain')
+
+_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?\s*([\w-]+)', re.IGNORECASE)
+
+
+class ContentTypeRejected(requests.exceptions.RequestException):
+    """The server answered with something that is not a web page"""
+
+    def __init__(self, content_type):
+        super().__init__(f'Unsupported content type: {content_type}')
+        self.content_type = content_type
+
+
+def _codec(name):
+    try:
+        return codecs.lookup(name).name
+    except (LookupError, TypeError):
+        return None
+
+
+def sniff_encoding(content_type, body):
+    """Charset from the Content-Type header, a BOM or a <meta> tag near the top"""
+    if 'charset=' in content_type:
+        encoding = _codec(content_type.split('charset=', 1)[1].split(';')[0].strip(' "\''))
+        if encoding:
+            return encoding
+    if body.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if body.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    match = _CHARSET.search(body[:4096])
+    if match:
+        encoding = _codec(match.group(1).decode('ascii', 'ignore'))
+        if encoding:
+            return encoding
+    return None
+
+
+class FetchedPage:
+    """A fully read (possibly truncated) page body, decoded at most once"""
+
+    def __init__(self, status_code, headers, url, body, truncated=False, connect_seconds=0.0, download_seconds=0.0,
+                 stopped=False):
+        self.status_code = status_code
+        self.headers = headers
+        self.url = url
+        self.body = body
+        self.truncated = truncated
+        # The inspect callback ended the download before the body was complete
+        self.stopped = stopped
+        # Until the response headers arrived (DNS, connect, TLS, server time, retries), then the body
+        self.connect_seconds = connect_seconds
+        self.download_seconds = download_seconds
+        self._text = None
+
+    @property
+    def encoding(self):
+        return sniff_encoding(self.headers.get('Content-Type', ''), self.body)
+
+    @property
+    def text(self):
+        if self._text is None:
+            encoding = self.encoding
+            if encoding is None:
+                # Undeclared pages are nearly always UTF-8; cp1252 is the usual exception
+                try:
+                    self._text = self.body.decode('utf-8')
+                except UnicodeDecodeError:
+                    self._text = self.body.decode('cp1252', errors='replace')
+            else:
+                self._text = self.body.decode(encoding, errors='replace')
+        return self._text
+
+
+class _Http2Response:
+    """Minimal requests.Response look-alike around an httpx response"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.encoding = response.encoding
+        self.http_version = response.http_version
+        self._content = None
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = self._response.read()
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def iter_content(self, chunk_size=65536):
+        if self._content is not None:
+            for start in range(0, len(self._content), chunk_size):
+                yield self._content[start:start + chunk_size]
+            return
+        yield from self._response.iter_bytes(chunk_size)
+
+    def close(self):
+        self._response.close()
+
+
+class FetchClient:
+    """Process-wide HTTP client that keeps connections alive per host.
+
+    One requests.Session backs every fetch so repeat scrapes of a site reuse
+    DNS, TCP and TLS work; urllib3 keeps a separate connection pool per host.
+    Every call gets a cookie jar of its own: cookies set along a redirect
+    chain reach the next hop, then are dropped so scrapes stay independent.
+    When HTTP/2 is enabled and httpx[http2] is installed it is used instead.
+    """
+
+    def __init__(self, pool_connections=64, pool_maxsize=10, retries=2, backoff_factor=0.3,
+                 backoff_jitter=0.3, http2=False, timeout=20):
+        self.retries = max(0, retries)
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.timeout = timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._stats_lock = threading.Lock()
+        self._counters = {'requests': 0, 'retries': 0, 'errors': 0}
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        self._http2 = None
+        if http2:
+            try:
+                import httpx
+                self._http2 = httpx.HTTPTransport(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=pool_connections * pool_maxsize,
+                                        max_keepalive_connections=pool_connections),
+                )
+                self._httpx = httpx
+            except ImportError:
+                logging.warning("HTTP/2 requested but httpx[http2] is not installed, using HTTP/1.1")
+
+    @property
+    def protocol(self):
+        return 'HTTP/2' if self._http2 is not None else 'HTTP/1.1'
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        """GET url with retry/backoff on connect failures and transient statuses.
+
+        Read timeouts are not retried: the server accepted the request and
+        asking again would just wait out the timeout once more.
+
+        With stream=True the body is not read; iterate response.iter_content()
+        and close the response when done.
+        """
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            self._bump('requests')
+            try:
+                response = self._send(url, headers, timeout, stream)
+            except requests.exceptions.ConnectionError:
+                # Includes ConnectTimeout but not ReadTimeout
+                if attempt >= self.retries:
+                    self._bump('errors')
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                response.close()
+
+            attempt += 1
+            self._bump('retries')
+            time.sleep(self.backoff_factor * (2 ** (attempt - 1)) + random.uniform(0, self.backoff_jitter))
+
+    def fetch_page(self, url, headers=None, timeout=None, max_bytes=10 * 1024 * 1024, inspect=None):
+        """Stream a page into memory, stopping at max_bytes of decoded body.
+
+        Successful responses that are not HTML-like are abandoned before the
+        body is read and raise ContentTypeRejected. inspect, if given, is
+        called with the body read so far after every chunk; returning True
+        stops the download there.
+        """
+        started = time.perf_counter()
+        response = self.get(url, headers=headers, timeout=timeout, stream=True)
+        headers_at = time.perf_counter()
+        try:
+            content_type = response.headers.get('Content-Type', '')
+            media_type = content_type.split(';')[0].strip().lower()
+            if response.status_code == 200 and media_type and media_type not in PAGE_CONTENT_TYPES:
+                raise ContentTypeRejected(media_type)
+
+            body = bytearray()
+            truncated = stopped = False
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if len(body) + len(chunk) > max_bytes:
+                    body += chunk[:max_bytes - len(body)]
+                    truncated = True
+                    break
+                body += chunk
+                if inspect is not None and inspect(body):
+                    stopped = True
+                    break
+            if truncated:
+                logging.info(f"Truncated {url} at {max_bytes} bytes")
+            return FetchedPage(response.status_code, response.headers, str(response.url), bytes(body), truncated,
+                               connect_seconds=headers_at - started,
+                               download_seconds=time.perf_counter() - headers_at, stopped=stopped)
+        finally:
+            response.close()
+
+    def _send(self, url, headers, timeout, stream):
+        if self._http2 is None:
+            # A throwaway session holds this call's cookies; the pooled adapters are shared
+            session = requests.Session()
+            session.adapters = self._session.adapters
+            return session.get(url, headers=headers, timeout=timeout, stream=stream)
+
+        # Map httpx failures onto the requests exceptions callers already handle
+        client = self._httpx.Client(transport=self._http2, follow_redirects=True)
+        try:
+            request = client.build_request('GET', url, headers=headers, timeout=timeout)
+            response = client.send(request, stream=True)
+        except self._httpx.ConnectTimeout as e:
+            raise requests.exceptions.ConnectTimeout(str(e))
+        except self._httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(str(e))
+        except self._httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        wrapped = _Http2Response(response)
+        if not stream:
+            wrapped.content
+            response.close()
+        return wrapped
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'protocol': self.protocol,
+                'poolConnections': self.pool_connections,
+                'poolMaxsize': self.pool_maxsize,
+                'maxRetries': self.retries,
+                **self._counters,
+            }
+
+    def close(self):
+        self._session.close()
+        if self._http2 is not None:
+            self._http2.close()
+
+    def _bump(self, counter):
+        with self._stats_lock:
+            self._counters[counter] += 1
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_fetch_client():
+    """Return the shared fetch client for this worker process"""
+    global _client, _client_pid
+    with _client_lock:
+        # Sockets must not be shared with a parent process after fork
+        if _client is None or _client_pid != os.getpid():
+            _client = FetchClient(
+                pool_connections=int(os.getenv('HTTP_POOL_CONNECTIONS', '64')),
+                pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', '10')),
+                retries=int(os.getenv('HTTP_RETRIES', '2')),
+                backoff_factor=float(os.getenv('HTTP_BACKOFF_FACTOR', '0.3')),
+                backoff_jitter=float(os.getenv('HTTP_BACKOFF_JITTER', '0.3')),
+                http2=os.getenv('HTTP_CLIENT_HTTP2', 'False').lower() in ('true', '1', 't'),
+            )
+            _client_pid = os.getpid()
+        return _client
+
+
+def fetch_client_stats():
+    if _client is None or _client_pid != os.getpid():
+        return {'started': False}
+    return dict(_client.stats(), started=True)
+
+
+def close_fetch_client():
+    global _client
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
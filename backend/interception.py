@@ -0,0 +1,161 @@
+import os
+import threading
+import urllib.parse
+
+# Ad, analytics and tracking hosts that never contribute to the DOM we read
+DEFAULT_BLOCKED_DOMAINS = (
+    'doubleclick.net', 'googlesyndication.com', 'googleadservices.com', 'google-analytics.com',
+    'googletagmanager.com', 'googletagservices.com', 'adservice.google.com', 'amazon-adsystem.com',
+    'adnxs.com', 'criteo.com', 'criteo.net', 'taboola.com', 'outbrain.com', 'scorecardresearch.com',
+    'quantserve.com', 'facebook.net', 'connect.facebook.net', 'hotjar.com', 'segment.io', 'segment.com',
+    'mixpanel.com', 'nr-data.net', 'newrelic.com', 'optimizely.com', 'moatads.com', 'pubmatic.com',
+    'rubiconproject.com', 'openx.net', 'adsrvr.org', 'bat.bing.com', 'clarity.ms', 'analytics.tiktok.com',
+)
+
+# File suffixes Selenium can block by URL pattern, per Playwright resource type
+_SUFFIXES = {
+    'image': ('*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico'),
+    'media': ('*.mp4', '*.webm', '*.m3u8', '*.mp3', '*.ogg'),
+    'font': ('*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'),
+    'stylesheet': ('*.css',),
+}
+
+
+class InterceptionProfile:
+    """Which requests a headless render may make"""
+
+    def __init__(self, name, blocked_types, block_domains=True):
+        self.name = name
+        self.blocked_types = frozenset(blocked_types)
+        self.block_domains = block_domains
+
+    @property
+    def blocks_anything(self):
+        return bool(self.blocked_types) or self.block_domains
+
+
+PROFILES = {
+    # Only the document, scripts and XHR: enough for page.content() on most SPAs
+    'dom-only': InterceptionProfile('dom-only', {'image', 'media', 'font', 'stylesheet', 'texttrack', 'eventsource', 'websocket', 'manifest'}),
+    # Keep stylesheets so layout-dependent lazy loading still triggers
+    'dom+css': InterceptionProfile('dom+css', {'image', 'media', 'font', 'texttrack', 'manifest'}),
+    # Everything, like a normal browser
+    'full': InterceptionProfile('full', set(), block_domains=False),
+}
+
+DEFAULT_PROFILE = os.getenv('RENDER_PROFILE', 'dom+css')
+
+
+def blocked_domains():
+    """Default block list plus any extra hosts from INTERCEPT_BLOCKED_DOMAINS"""
+    extra = [d.strip().lower() for d in os.getenv('INTERCEPT_BLOCKED_DOMAINS', '').split(',') if d.strip()]
+    return frozenset(DEFAULT_BLOCKED_DOMAINS) | frozenset(extra)
+
+
+BLOCKED_DOMAINS = blocked_domains()
+
+
+def get_profile(name=None):
+    """Look up a profile by name; raises ValueError for unknown names"""
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown render profile '{name}', expected one of {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+def host_is_blocked(host, domains):
+    # Match the host and every parent domain against the block list
+    labels = host.lower().split('.')
+    return any('.'.join(labels[i:]) in domains for i in range(len(labels) - 1))
+
+
+class InterceptionStats:
+    """Per-render counters; only touched from the browser thread doing the render"""
+
+    def __init__(self, profile):
+        self.profile = profile.name
+        self.requests_allowed = 0
+        self.requests_blocked = 0
+        self.blocked_by_type = {}
+        self.blocked_by_domain = 0
+        self.bytes_received = 0
+
+    def to_dict(self):
+        return {
+            'profile': self.profile,
+            'requestsAllowed': self.requests_allowed,
+            'requestsBlocked': self.requests_blocked,
+            'blockedByType': dict(self.blocked_by_type),
+            'blockedByDomain': self.blocked_by_domain,
+            'bytesReceived': self.bytes_received,
+        }
+
+
+_totals_lock = threading.Lock()
+_totals = {'renders': 0, 'requestsAllowed': 0, 'requestsBlocked': 0, 'bytesReceived': 0}
+
+
+def record_totals(stats):
+    with _totals_lock:
+        _totals['renders'] += 1
+        _totals['requestsAllowed'] += stats.requests_allowed
+        _totals['requestsBlocked'] += stats.requests_blocked
+        _totals['bytesReceived'] += stats.bytes_received
+
+
+def interception_totals():
+    with _totals_lock:
+        return dict(_totals)
+
+
+def install_interception(context, page_url, profile, domains=None):
+    """Route every request of a Playwright context through the profile's rules.
+
+    The page's own host is never blocked. Returns the InterceptionStats that
+    fill in as the page loads.
+    """
+    domains = BLOCKED_DOMAINS if domains is None else domains
+    own_host = (urllib.parse.urlparse(page_url).hostname or '').lower()
+    stats = InterceptionStats(profile)
+
+    def on_response(response):
+        length = response.headers.get('content-length')
+        if length and length.isdigit():
+            stats.bytes_received += int(length)
+
+    context.on('response', on_response)
+    if not profile.blocks_anything:
+        return stats
+
+    def handle(route):
+        request = route.request
+        resource_type = request.resource_type
+        if resource_type in profile.blocked_types:
+            stats.requests_blocked += 1
+            stats.blocked_by_type[resource_type] = stats.blocked_by_type.get(resource_type, 0) + 1
+            route.abort()
+            return
+        if profile.block_domains:
+            host = urllib.parse.urlparse(request.url).hostname or ''
+            if host and host != own_host and host_is_blocked(host, domains):
+                stats.requests_blocked += 1
+                stats.blocked_by_domain += 1
+                route.abort()
+                return
+        stats.requests_allowed += 1
+        route.continue_()
+
+    context.route('**/*', handle)
+    return stats
+
+
+def selenium_blocked_patterns(profile, domains=None):
+    """URL patterns for Chrome's Network.setBlockedURLs approximating a profile"""
+    domains = BLOCKED_DOMAINS if domains is None else domains
+    patterns = []
+    for resource_type in sorted(profile.blocked_types):
+        patterns.extend(_SUFFIXES.get(resource_type, ()))
+    if profile.block_domains:
+        patterns.extend(f'*://*.{domain}/*' for domain in sorted(domains))
+        patterns.extend(f'*://{domain}/*' for domain in sorted(domains))
+    return patterns
@@ -0,0 +1,409 @@
+import copy
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import partial
+
+TERMINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are already waiting"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job was cancelled mid-flight"""
+
+
+def new_job(url, options=None, priority=0):
+    return {
+        'id': uuid.uuid4().hex,
+        'url': url,
+        'options': options or {},
+        'priority': priority,
+        'status': 'queued',
+        'stage': 'queued',
+        'cancelRequested': False,
+        'events': [],
+        'result': None,
+        'error': None,
+        'createdAt': datetime.utcnow(),
+        'startedAt': None,
+        'finishedAt': None,
+    }
+
+
+def job_to_json(job, include_events=True):
+    """Job document as plain JSON-friendly data"""
+    data = {key: (value.isoformat() if isinstance(value, datetime) else value)
+            for key, value in job.items() if key != '_id'}
+    if not include_events:
+        data.pop('events', None)
+    return data
+
+
+class MemoryJobStore:
+    """In-process job store, used when MongoDB is unavailable and in tests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def insert(self, job):
+        with self._lock:
+            self._jobs[job['id']] = copy.deepcopy(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job is not None else None
+
+    def events_since(self, job_id, start):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {key: value for key, value in job.items() if key != 'events'}
+            return copy.deepcopy(snapshot), copy.deepcopy(job['events'][start:])
+
+    def count(self, status):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['status'] == status)
+
+    def claim_next(self):
+        """Atomically move the most urgent queued job to running and return it"""
+        with self._lock:
+            queued = [job for job in self._jobs.values() if job['status'] == 'queued']
+            if not queued:
+                return None
+            job = min(queued, key=lambda j: (-j['priority'], j['createdAt']))
+            job['status'] = 'running'
+            job['startedAt'] = datetime.utcnow()
+            return copy.deepcopy(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def append_event(self, job_id, event):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job['events'].append(event)
+                job['stage'] = event['stage']
+
+    def fail_interrupted(self, error):
+        """Fail every job left running by an earlier server process; returns how many"""
+        now = datetime.utcnow()
+        with self._lock:
+            interrupted = [job for job in self._jobs.values() if job['status'] == 'running']
+            for job in interrupted:
+                job.update(status='failed', stage='failed', error=error, statusCode=503, finishedAt=now)
+                job['events'].append({'stage': 'failed', 'at': now.isoformat()})
+            return len(interrupted)
+
+    def cancel_queued(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != 'queued':
+                return False
+            job.update(status='cancelled', stage='cancelled', finishedAt=datetime.utcnow())
+            return True
+
+
+class MongoJobStore:
+    """Jobs persisted in MongoDB so they survive restarts and are visible to every worker"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index([('status', 1), ('priority', -1), ('createdAt', 1)])
+
+    @staticmethod
+    def _from_doc(doc):
+        if doc is None:
+            return None
+        doc['id'] = doc.pop('_id')
+        return doc
+
+    def insert(self, job):
+        doc = dict(job)
+        doc['_id'] = doc.pop('id')
+        self.collection.insert_one(doc)
+
+    def get(self, job_id):
+        return self._from_doc(self.collection.find_one({'_id': job_id}))
+
+    def events_since(self, job_id, start):
+        doc = self.collection.find_one({'_id': job_id}, {'events': {'$slice': [start, 1000]}})
+        if doc is None:
+            return None
+        events = doc.pop('events', [])
+        return self._from_doc(doc), events
+
+    def count(self, status):
+        return self.collection.count_documents({'status': status})
+
+    def claim_next(self):
+        from pymongo import ReturnDocument
+        return self._from_doc(self.collection.find_one_and_update(
+            {'status': 'queued'},
+            {'$set': {'status': 'running', 'startedAt': datetime.utcnow()}},
+            sort=[('priority', -1), ('createdAt', 1)],
+            return_document=ReturnDocument.AFTER,
+        ))
+
+    def update(self, job_id, **fields):
+        self.collection.update_one({'_id': job_id}, {'$set': fields})
+
+    def append_event(self, job_id, event):
+        self.collection.update_one({'_id': job_id}, {'$push': {'events': event}, '$set': {'stage': event['stage']}})
+
+    def fail_interrupted(self, error):
+        now = datetime.utcnow()
+        updated = self.collection.update_many(
+            {'status': 'running'},
+            {'$set': {'status': 'failed', 'stage': 'failed', 'error': error, 'statusCode': 503, 'finishedAt': now},
+             '$push': {'events': {'stage': 'failed', 'at': now.isoformat()}}},
+        )
+        return updated.modified_count
+
+    def cancel_queued(self, job_id):
+        updated = self.collection.update_one(
+            {'_id': job_id, 'status': 'queued'},
+            {'$set': {'status': 'cancelled', 'stage': 'cancelled', 'finishedAt': datetime.utcnow()}},
+        )
+        return updated.modified_count == 1
+
+
+# State of a worker process, set up once by _init_worker
+_worker_events = None
+_worker_cancelled = None
+_worker_scrape = None
+_worker_describe_error = None
+
+
+def _init_worker(events, cancelled, scrape_fn, describe_error):
+    global _worker_events, _worker_cancelled, _worker_scrape, _worker_describe_error
+    _worker_events = events
+    _worker_cancelled = cancelled
+    _worker_scrape = scrape_fn
+    _worker_describe_error = describe_error
+
+
+def _run_job(job_id, url, options):
+    """Executed in a worker process: run the scrape pipeline and report each stage"""
+    def progress(stage, **info):
+        # Stage boundaries double as cancellation points
+        if job_id in _worker_cancelled:
+            raise JobCancelled()
+        _worker_events.put((job_id, dict(info, stage=stage, at=datetime.utcnow().isoformat())))
+
+    try:
+        result, cache_status = _worker_scrape(url, progress=progress, **options)
+        return {'status': 'succeeded', 'result': result, 'cache': cache_status}
+    except JobCancelled:
+        return {'status': 'cancelled'}
+    except Exception as e:
+        message, status_code = _worker_describe_error(e)
+        return {'status': 'failed', 'error': message, 'statusCode': status_code}
+
+
+class JobManager:
+    """Queues scrape jobs and runs them on a pool of worker processes.
+
+    A dispatcher thread claims queued jobs (highest priority first) whenever
+    a worker is free; workers send stage events back over a queue that a pump
+    thread appends to the job document. Submissions beyond max_queued are
+    rejected so an overloaded server fails fast instead of piling up work.
+    """
+
+    def __init__(self, store, scrape_fn, describe_error, workers=2, max_queued=100):
+        self.store = store
+        self.scrape_fn = scrape_fn
+        self.describe_error = describe_error
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self._running = 0
+        self._wakeup = threading.Condition()
+        self._closed = False
+        self._executor = None
+        self._mp_manager = None
+
+    def start(self):
+        # Only one server process runs jobs, so anything still running was cut off by a restart.
+        # Failing it (rather than requeueing) ends its event stream and cannot loop on a job
+        # that itself brought the server down.
+        interrupted = self.store.fail_interrupted('Interrupted by a server restart')
+        if interrupted:
+            logging.warning(f"Marked {interrupted} job(s) interrupted by a restart as failed")
+        # Workers come from a forkserver: forking the threaded server (browser, history and
+        # cache threads) could hand them locks held mid-operation by a thread that no longer exists
+        self._context = multiprocessing.get_context('forkserver')
+        self._mp_manager = self._context.Manager()
+        self._events = self._mp_manager.Queue()
+        self._cancelled = self._mp_manager.dict()
+        self._executor = self._new_executor()
+        threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True).start()
+        threading.Thread(target=self._pump_events, name='job-events', daemon=True).start()
+        logging.info(f"Job manager started with {self.workers} worker process(es)")
+        return self
+
+    def submit(self, url, options=None, priority=0):
+        if self.store.count('queued') >= self.max_queued:
+            raise QueueFull(f'Job queue is full ({self.max_queued} waiting)')
+        job = new_job(url, options, priority)
+        self.store.insert(job)
+        with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a job; returns its resulting status, or None if it does not exist"""
+        if self.store.cancel_queued(job_id):
+            return 'cancelled'
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if job['status'] == 'running':
+            # The worker notices at its next stage boundary
+            self._cancelled[job_id] = True
+            self.store.update(job_id, cancelRequested=True)
+            return 'cancelling'
+        return job['status']
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'running': self._running,
+            'queued': self.store.count('queued'),
+            'maxQueued': self.max_queued,
+        }
+
+    def shutdown(self):
+        self._closed = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._mp_manager is not None:
+            self._mp_manager.shutdown()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._events, self._cancelled, self.scrape_fn, self.describe_error),
+        )
+
+    def _dispatch_loop(self):
+        while not self._closed:
+            with self._wakeup:
+                if self._running >= self.workers:
+                    self._wakeup.wait(1)
+                    continue
+            try:
+                job = self.store.claim_next()
+            except Exception as e:
+                logging.error(f"Could not claim next job: {e}")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(1)
+                continue
+            with self._wakeup:
+                self._running += 1
+            self.store.append_event(job['id'], {'stage': 'started', 'at': datetime.utcnow().isoformat()})
+            try:
+                future = self._executor.submit(_run_job, job['id'], job['url'], job['options'])
+            except (BrokenProcessPool, RuntimeError) as e:
+                # A worker process died and took the pool with it (its own jobs fail in _finish).
+                # This job never started, so it goes back to the queue for a fresh pool.
+                with self._wakeup:
+                    self._running -= 1
+                self.store.update(job['id'], status='queued', startedAt=None)
+                self.store.append_event(job['id'], {'stage': 'queued', 'at': datetime.utcnow().isoformat()})
+                if self._closed:
+                    break
+                logging.warning(f"Job worker pool is broken ({e}); starting a new one")
+                self._executor.shutdown(wait=False)
+                self._executor = self._new_executor()
+                continue
+            future.add_done_callback(partial(self._finish, job['id']))
+
+    def _finish(self, job_id, future):
+        try:
+            try:
+                outcome = future.result()
+            except Exception as e:
+                # The worker process itself died
+                outcome = {'status': 'failed', 'error': f'Worker crashed: {e}', 'statusCode': 500}
+            now = datetime.utcnow()
+            if outcome['status'] == 'succeeded':
+                self.store.update(job_id, status='succeeded', result=outcome['result'], cache=outcome['cache'],
+                                  finishedAt=now)
+            else:
+                self.store.update(job_id, status=outcome['status'], error=outcome.get('error'),
+                                  statusCode=outcome.get('statusCode'), finishedAt=now)
+            self.store.append_event(job_id, {'stage': outcome['status'], 'at': now.isoformat()})
+            self._cancelled.pop(job_id, None)
+        except Exception as e:
+            logging.error(f"Could not record outcome of job {job_id}: {e}")
+        finally:
+            with self._wakeup:
+                self._running -= 1
+                self._wakeup.notify()
+
+    def _pump_events(self):
+        while not self._closed:
+            try:
+                job_id, event = self._events.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            try:
+                self.store.append_event(job_id, event)
+            except Exception as e:
+                logging.error(f"Could not record event for job {job_id}: {e}")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager(collection, scrape_fn, describe_error):
+    """Return this process's job manager, using MongoDB when a collection is given"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            store = MongoJobStore(collection) if collection is not None else MemoryJobStore()
+            _manager = JobManager(
+                store,
+                scrape_fn,
+                describe_error,
+                workers=int(os.getenv('JOB_WORKERS', '2')),
+                max_queued=int(os.getenv('JOB_MAX_QUEUED', '100')),
+            ).start()
+        return _manager
+
+
+def job_manager_stats():
+    if _manager is None:
+        return {'started': False}
+    return dict(_manager.stats(), started=True)
+
+
+def shutdown_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.shutdown()
+        _manager = None
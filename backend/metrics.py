@@ -0,0 +1,198 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; scrapes range from a cached millisecond to a minute-long render
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labels, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        names = self.labels + ('le',)
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), counts):
+                    cumulative += count
+                    samples.append((f'{self.name}_bucket', names, key + (_format_value(bound),), cumulative))
+                samples.append((f'{self.name}_sum', self.labels, key, total))
+                samples.append((f'{self.name}_count', self.labels, key, cumulative))
+        return samples
+
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text format.
+
+    Besides counters and histograms updated in place, collectors are callables
+    run at scrape time that turn existing stats() dicts into samples, so
+    components keep their own counters and need not know about Prometheus.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn):
+        """fn() returns [(name, type, help, [(labels dict, value), ...]), ...]"""
+        with self._lock:
+            self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, label_names, label_values, value in metric.samples():
+                lines.append(f'{name}{_format_labels(label_names, label_values)} {_format_value(value)}')
+        for collect in collectors:
+            try:
+                families = collect()
+            except Exception:
+                # A component failing to report must not take the endpoint down
+                continue
+            for name, metric_type, help, samples in families:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'scrape_stage_duration_seconds', 'Time spent in each stage of a scrape',
+    ('stage', 'engine', 'outcome'))
+SCRAPE_SECONDS = REGISTRY.histogram(
+    'scrape_duration_seconds', 'End-to-end scrape time by the engine that produced the result',
+    ('engine', 'outcome'))
+ENGINE_ATTEMPTS = REGISTRY.counter(
+    'scrape_engine_attempts_total', 'Scrape attempts per engine', ('engine', 'outcome'))
+FALLBACKS = REGISTRY.counter(
+    'scrape_fallbacks_total', 'Times an engine failed and the next engine was tried', ('engine',))
+BLOCKED_PAGES = REGISTRY.counter(
+    'scrape_blocked_pages_total', 'Fetched pages that matched the blocking keywords')
+FETCHED_BYTES = REGISTRY.counter(
+    'scrape_fetched_bytes_total', 'Page bytes downloaded by static fetches')
+PAGE_VERDICTS = REGISTRY.counter(
+    'scrape_page_verdicts_total', 'Static fetches by pre-parse classifier verdict', ('verdict',))
+
+
+class StageTimings:
+    """Stage durations of one scrape.
+
+    Each stage is observed in the stage histogram as it finishes and kept
+    so the request can report it in a Server-Timing header.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.entries = []
+
+    def add(self, stage, seconds, engine='', outcome='ok'):
+        self.entries.append((stage, engine, seconds))
+        STAGE_SECONDS.observe(seconds, stage=stage, engine=engine, outcome=outcome)
+
+    @contextmanager
+    def stage(self, stage, engine=''):
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            self.add(stage, time.perf_counter() - started, engine, outcome)
+
+    def finish(self, engine, outcome):
+        SCRAPE_SECONDS.observe(time.perf_counter() - self.started, engine=engine, outcome=outcome)
+
+    def server_timing(self):
+        """Value for a Server-Timing header, e.g. 'download;desc="static";dur=12.3'"""
+        parts = [f'{stage};desc="{engine}";dur={seconds * 1000:.1f}' if engine else f'{stage};dur={seconds * 1000:.1f}'
+                 for stage, engine, seconds in self.entries]
+        parts.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def render_metrics():
+    return REGISTRY.render()
@@ -0,0 +1,464 @@
+import fcntl
+import hashlib
+import heapq
+import html
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Cache status scrape_page reports when a change detector found nothing new
+UNCHANGED = 'UNCHANGED'
+
+OUTCOMES = ('baseline', 'not_modified', 'unchanged', 'noise', 'changed', 'error')
+
+SHINGLE_WORDS = 3
+
+_HIDDEN = re.compile(r'<!--.*?-->|<(script|style|noscript|template)\b([^>]*)>(.*?)</\1\s*>', re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r'<[^>]*>')
+_WORD = re.compile(r'\w+')
+
+
+def normalized_words(page_html):
+    """Visible words of a page, lowercased; JSON-LD is kept since prices often live there"""
+    def hidden(match):
+        if match.group(1) and match.group(1).lower() == 'script' and 'ld+json' in match.group(2).lower():
+            return f' {match.group(3)} '
+        return ' '
+    text = _TAG.sub(' ', _HIDDEN.sub(hidden, page_html))
+    return _WORD.findall(html.unescape(text).lower())
+
+
+def simhash(words, width=SHINGLE_WORDS):
+    """64-bit simhash over word shingles; near-identical texts differ in few bits.
+
+    Shingle hashes are tallied per byte position and value instead of per
+    bit, which keeps the Python-level work to eight additions per shingle.
+    """
+    if len(words) <= width:
+        shingles = Counter([' '.join(words)]) if words else Counter()
+    else:
+        shingles = Counter(' '.join(words[i:i + width]) for i in range(len(words) - width + 1))
+    tables = [[0] * 256 for _ in range(8)]
+    for shingle, weight in shingles.items():
+        digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+        for position, value in enumerate(digest):
+            tables[position][value] += weight
+    total = sum(shingles.values())
+    fingerprint = 0
+    for position, table in enumerate(tables):
+        for bit in range(8):
+            ones = sum(count for value, count in enumerate(table) if value >> bit & 1)
+            if ones * 2 > total:
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def field_values(result):
+    """The extracted fields a watch compares: title, every productInfo field, features and reviews"""
+    values = {'title': result.get('title')}
+    for name, value in (result.get('productInfo') or {}).items():
+        values[f'productInfo.{name}'] = value
+    values['features'] = result.get('features') or []
+    values['reviews'] = result.get('reviews') or []
+    return values
+
+
+def _digest(value):
+    return hashlib.blake2b(json.dumps(value, sort_keys=True, default=str).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def diff_fields(old, new):
+    """[{field, old, new}] for every field whose value differs"""
+    return [{'field': name, 'old': old.get(name), 'new': new.get(name)}
+            for name in sorted(set(old) | set(new))
+            if _digest(old.get(name)) != _digest(new.get(name))]
+
+
+class ChangeDetector:
+    """Tells scrape_page whether a page changed since the watch last stored it.
+
+    body_unchanged() runs on the raw page before any parse: an identical
+    normalized text means nothing to extract or store. result_unchanged()
+    runs after extraction, before storage: the page counts as unchanged when
+    every watched field hashes the same and the text simhash moved by at
+    most max_distance bits (rotating banners, timestamps and the like).
+    """
+
+    def __init__(self, baseline=None, max_distance=3):
+        self.baseline = baseline
+        self.max_distance = max_distance
+        self.content_hash = None
+        self.simhash = None
+        self.fields = None
+        self.field_hashes = None
+        self.distance = None
+
+    def body_unchanged(self, page):
+        if isinstance(page, bytes):
+            page = page.decode('utf-8', errors='replace')
+        words = normalized_words(page)
+        self.content_hash = hashlib.blake2b(' '.join(words).encode('utf-8'), digest_size=16).hexdigest()
+        self.simhash = simhash(words)
+        return self.baseline is not None and self.baseline.get('contentHash') == self.content_hash
+
+    def result_unchanged(self, result):
+        self.fields = field_values(result)
+        self.field_hashes = {name: _digest(value) for name, value in self.fields.items()}
+        if self.baseline is None:
+            return False
+        if self.simhash is not None and self.baseline.get('simhash') is not None:
+            self.distance = hamming(self.simhash, int(self.baseline['simhash'], 16))
+        return self.field_hashes == self.baseline.get('fieldHashes') and (self.distance or 0) <= self.max_distance
+
+    def fingerprint(self):
+        return {
+            'contentHash': self.content_hash,
+            'simhash': f'{self.simhash:016x}' if self.simhash is not None else None,
+            'fieldHashes': self.field_hashes,
+            'fields': self.fields,
+        }
+
+
+def make_settings(url, interval=3600, jitter=0.1, render_profile=None, webhook=None, min_interval=60):
+    """Validated watch settings; raises ValueError with a user-facing message"""
+    if not isinstance(interval, (int, float)) or isinstance(interval, bool) or interval < min_interval:
+        raise ValueError(f'interval must be at least {min_interval} seconds')
+    if not isinstance(jitter, (int, float)) or isinstance(jitter, bool) or not 0 <= jitter <= 0.5:
+        raise ValueError('jitter must be between 0 and 0.5')
+    if webhook is not None:
+        parsed = urllib.parse.urlparse(webhook) if isinstance(webhook, str) else None
+        if parsed is None or parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            raise ValueError('webhook must be an http(s) URL')
+    return {
+        'url': url,
+        'interval': float(interval),
+        'jitter': float(jitter),
+        'renderProfile': render_profile,
+        'webhook': webhook,
+    }
+
+
+class WatchManager:
+    """Rescrapes watched URLs on their interval and records what changed.
+
+    Each watch is a JSON file in directory, next to an NDJSON log of its
+    change events, so every server process can create, list and delete
+    watches. Only the process holding the scheduler lock runs checks; the
+    others retry the lock now and then and take over if its holder exits.
+    The scheduler rescans the directory to pick up watches created or
+    deleted elsewhere, and <id>.trigger files ask for an immediate check.
+    With scheduler=False the process only serves the API and never checks.
+    """
+
+    RESCAN_INTERVAL = 5
+
+    def __init__(self, directory, scrape_fn, describe_error, workers=4, max_distance=3, min_interval=60,
+                 scheduler=True):
+        self.directory = directory
+        self.scrape_fn = scrape_fn
+        self.describe_error = describe_error
+        self.max_distance = max_distance
+        self.min_interval = min_interval
+        self.counters = {outcome: 0 for outcome in OUTCOMES}
+        self._watches = {}
+        self._due = []
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._leader = None
+        self._last_rescan = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='watch')
+        self._thread = threading.Thread(target=self._run, name='watch-scheduler', daemon=True)
+        if scheduler:
+            self._thread.start()
+
+    def create(self, settings, user=None):
+        watch = dict(settings, id=uuid.uuid4().hex, user=user, createdAt=datetime.utcnow().isoformat(),
+                     lastCheckAt=None, lastChangeAt=None, lastOutcome=None, lastError=None,
+                     counters={outcome: 0 for outcome in OUTCOMES}, fingerprint=None)
+        self._write(watch)
+        with self._lock:
+            if self._leader is not None:
+                self._schedule_locked(watch, 0)
+        return self.summary(watch)
+
+    def get(self, watch_id):
+        watch = self._read(watch_id)
+        return self.summary(watch, fields=True) if watch is not None else None
+
+    def list(self, user=None):
+        """The user's watches, newest first; anonymous watches for user=None"""
+        watches = [self._read(name[:-5]) for name in os.listdir(self.directory) if name.endswith('.json')]
+        watches = [w for w in watches if w is not None and w.get('user') == user]
+        return [self.summary(w) for w in sorted(watches, key=lambda w: w['createdAt'], reverse=True)]
+
+    def delete(self, watch_id):
+        existed = False
+        for path in (self._path(watch_id), self._changes_path(watch_id), self._path(watch_id, '.trigger')):
+            try:
+                os.remove(path)
+                existed = existed or path.endswith('.json')
+            except (FileNotFoundError, ValueError):
+                pass
+        with self._lock:
+            self._watches.pop(watch_id, None)
+        return existed
+
+    def check_now(self, watch_id):
+        """Ask the scheduler (in whichever process runs it) to check a watch right away"""
+        if self._read(watch_id) is None:
+            return False
+        with open(self._path(watch_id, '.trigger'), 'w'):
+            pass
+        with self._lock:
+            self._wakeup.notify_all()
+        return True
+
+    def changes(self, watch_id, limit=50):
+        """The watch's latest change events, newest first"""
+        try:
+            with open(self._changes_path(watch_id)) as f:
+                lines = f.readlines()
+        except (FileNotFoundError, ValueError):
+            return []
+        return [json.loads(line) for line in reversed(lines[-limit:]) if line.strip()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'scheduler': self._leader is not None,
+                'watches': len(self._watches),
+                'running': len(self._running),
+                **self.counters,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(5)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._leader is not None:
+            self._leader.close()
+            self._leader = None
+
+    @staticmethod
+    def summary(watch, fields=False):
+        summary = {key: value for key, value in watch.items() if key != 'fingerprint'}
+        if fields:
+            summary['fields'] = (watch.get('fingerprint') or {}).get('fields')
+        return summary
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+            now = time.monotonic()
+            if now - self._last_rescan >= self.RESCAN_INTERVAL or self._leader is None:
+                self._last_rescan = now
+                try:
+                    if self._leader is None:
+                        self._try_lead()
+                    if self._leader is not None:
+                        self._rescan()
+                except Exception as e:
+                    logging.error(f"Watch scheduler rescan failed: {e}")
+            with self._lock:
+                now = time.monotonic()
+                while self._due and self._due[0][0] <= now:
+                    _, watch_id = heapq.heappop(self._due)
+                    if watch_id in self._watches and watch_id not in self._running:
+                        self._running.add(watch_id)
+                        self._executor.submit(self._check, watch_id)
+                wait = self.RESCAN_INTERVAL
+                if self._due:
+                    wait = min(wait, max(0.0, self._due[0][0] - now))
+                if not self._closed:
+                    self._wakeup.wait(wait)
+
+    def _try_lead(self):
+        lock = open(os.path.join(self.directory, 'scheduler.lock'), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return
+        self._leader = lock
+        logging.info(f"Watch scheduler running in process {os.getpid()}")
+
+    def _rescan(self):
+        names = os.listdir(self.directory)
+        ids = {name[:-5] for name in names if name.endswith('.json')}
+        triggered = {name[:-8] for name in names if name.endswith('.trigger')}
+        with self._lock:
+            for watch_id in set(self._watches) - ids:
+                del self._watches[watch_id]
+        for watch_id in ids:
+            with self._lock:
+                known = watch_id in self._watches
+            watch = None if known else self._read(watch_id)
+            with self._lock:
+                if watch is not None:
+                    self._watches[watch_id] = watch
+                    last = watch.get('lastCheckAt')
+                    elapsed = (datetime.utcnow() - datetime.fromisoformat(last)).total_seconds() if last else None
+                    self._schedule_locked(watch, 0 if elapsed is None else max(0.0, watch['interval'] - elapsed))
+                if watch_id in triggered and watch_id in self._watches:
+                    heapq.heappush(self._due, (time.monotonic(), watch_id))
+        for watch_id in triggered:
+            try:
+                os.remove(self._path(watch_id, '.trigger'))
+            except FileNotFoundError:
+                pass
+
+    def _schedule_locked(self, watch, delay=None):
+        if delay is None:
+            # Jitter spreads watches created together so they do not hit sites in lockstep
+            delay = watch['interval'] * (1 + random.uniform(-watch['jitter'], watch['jitter']))
+        self._watches[watch['id']] = watch
+        heapq.heappush(self._due, (time.monotonic() + delay, watch['id']))
+        self._wakeup.notify_all()
+
+    def _check(self, watch_id):
+        with self._lock:
+            watch = self._watches.get(watch_id)
+        if watch is None:
+            return
+        detector = ChangeDetector(watch.get('fingerprint'), self.max_distance)
+        event = None
+        try:
+            options = {'render_profile': watch.get('renderProfile'), 'user': watch.get('user')}
+            result, status = self.scrape_fn(watch['url'], detector, **options)
+            if status == UNCHANGED:
+                outcome = 'noise' if detector.fields is not None else 'unchanged'
+            elif status != 'MISS':
+                # The conditional request came back 304
+                outcome = 'not_modified'
+            elif watch.get('fingerprint') is None:
+                outcome = 'baseline'
+            else:
+                outcome = 'changed'
+                previous = watch['fingerprint'].get('fields') or {}
+                event = {
+                    'id': uuid.uuid4().hex,
+                    'watchId': watch_id,
+                    'url': watch['url'],
+                    'at': datetime.utcnow().isoformat(),
+                    'changes': diff_fields(previous, detector.fields),
+                    'textDistance': detector.distance,
+                    'historyId': result.get('id'),
+                }
+            if outcome in ('baseline', 'changed'):
+                watch['fingerprint'] = detector.fingerprint()
+            elif outcome == 'noise':
+                # Same fields, so the stored values stay; next time identical text skips extraction
+                watch['fingerprint']['contentHash'] = detector.content_hash
+            watch['lastError'] = None
+        except Exception as e:
+            message, _ = self.describe_error(e)
+            outcome = 'error'
+            watch['lastError'] = message
+            logging.warning(f"Watch check of {watch['url']} failed: {message}")
+        now = datetime.utcnow().isoformat()
+        watch['lastCheckAt'] = now
+        watch['lastOutcome'] = outcome
+        watch['counters'][outcome] = watch['counters'].get(outcome, 0) + 1
+        if event is not None:
+            watch['lastChangeAt'] = now
+            self._emit(watch, event)
+        with self._lock:
+            self.counters[outcome] += 1
+            self._running.discard(watch_id)
+            if watch_id in self._watches:
+                # Deleted meanwhile (maybe by another process): do not write it back
+                if os.path.exists(self._path(watch_id)):
+                    self._write(watch)
+                    self._schedule_locked(watch)
+                else:
+                    del self._watches[watch_id]
+
+    def _emit(self, watch, event):
+        logging.info(f"Change detected on {watch['url']}: {', '.join(c['field'] for c in event['changes']) or 'text'}")
+        with open(self._changes_path(watch['id']), 'a') as f:
+            f.write(json.dumps(event, default=str) + '\n')
+        if watch.get('webhook'):
+            try:
+                import requests
+                requests.post(watch['webhook'], json=event, timeout=10)
+            except Exception as e:
+                logging.warning(f"Change webhook for {watch['url']} failed: {e}")
+
+    def _path(self, watch_id, suffix='.json'):
+        if not re.fullmatch(r'[0-9a-f]{32}', watch_id):
+            raise ValueError('Invalid watch id')
+        return os.path.join(self.directory, watch_id + suffix)
+
+    def _changes_path(self, watch_id):
+        return self._path(watch_id, '.changes.ndjson')
+
+    def _read(self, watch_id):
+        try:
+            with open(self._path(watch_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, watch):
+        path = self._path(watch['id'])
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(watch, f, default=str)
+        os.replace(tmp_path, path)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_watch_manager(scrape_fn, describe_error):
+    """Return the process-wide watch manager; its scheduler starts with it"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            basedir = os.path.abspath(os.path.dirname(__file__))
+            _manager = WatchManager(
+                os.getenv('WATCH_DIR', os.path.join(basedir, '.scrape_state', 'watches')),
+                scrape_fn,
+                describe_error,
+                workers=int(os.getenv('WATCH_WORKERS', '4')),
+                max_distance=int(os.getenv('WATCH_SIMHASH_DISTANCE', '3')),
+                min_interval=float(os.getenv('WATCH_MIN_INTERVAL', '60')),
+                scheduler=os.getenv('WATCH_SCHEDULER', 'True').lower() in ('true', '1', 't'),
+            )
+        return _manager
+
+
+def watch_manager_stats():
+    if _manager is None:
+        return {'started': False}
+    return dict(_manager.stats(), started=True)
+
+
+def shutdown_watch_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.shutdown()
+        _manager = None
@@ -0,0 +1,206 @@
+import re
+
+# Thresholds of the low-content heuristic: fewer links or images than this means render
+MIN_ANCHORS = 5
+MIN_IMAGES = 2
+
+BLOCKING_KEYWORDS = (
+    'captcha', 'robot check', 'security check', 'access denied',
+    'automated access', 'please verify you are a human', 'shield square',
+    'before you continue', 'accept all', 'reject all', 'cookie policy',
+)
+# Containers client-side frameworks mount into
+MOUNT_IDS = ('root', 'app', '__next', '__nuxt', 'svelte', 'main-app')
+# State serialized for the client to render from
+HYDRATION_MARKERS = (
+    '__NEXT_DATA__', '__NUXT__', '__INITIAL_STATE__', '__PRELOADED_STATE__', '__APOLLO_STATE__',
+    '__remixContext', 'ng-state',
+)
+
+STATIC, RENDER, BLOCKED = 'static', 'render', 'blocked'
+
+_KEYWORDS = tuple(keyword.encode() for keyword in BLOCKING_KEYWORDS)
+_KEYWORD_OVERLAP = max(len(keyword) for keyword in _KEYWORDS) - 1
+
+# Every tag the classifier cares about in one alternation behind a literal '<',
+# so the regex engine skips ahead to the next tag in C and the page is tokenized
+# in a single pass. Script, style and comment bodies are consumed whole so markup
+# inside them is not counted, matching what the HTML parser would see.
+_TAGS = re.compile(
+    rb'<(?:(?P<comment>!--.*?(?:-->|\Z))'
+    rb'|(?P<raw>(?P<rawtag>script|style)\b[^>]*>.*?(?:</(?P=rawtag)\s*>|\Z))'
+    rb'|(?P<anchor>a\s[^>]*?(?<![\w-])href(?![\w-]))'
+    rb'|(?P<image>img\b)'
+    rb'|(?P<mount>div\s[^>]*?(?<![\w-])id\s*=\s*["\']?(?:' + b'|'.join(re.escape(i.encode()) for i in MOUNT_IDS) +
+    rb')["\']?(?=[\s/>])[^>]*>\s*</div\s*>))',
+    re.IGNORECASE | re.DOTALL,
+)
+_HYDRATION = re.compile(b'|'.join(re.escape(marker.encode()) for marker in HYDRATION_MARKERS))
+_HYDRATION_OVERLAP = max(len(marker) for marker in HYDRATION_MARKERS) - 1
+# How a script, style or comment block left open at the end of the data so far ends
+_CLOSERS = {
+    'comment': re.compile(rb'-->'),
+    'script': re.compile(rb'</script\s*>', re.IGNORECASE),
+    'style': re.compile(rb'</style\s*>', re.IGNORECASE),
+}
+
+# Bytes held back from an incremental scan so a token cut by a chunk boundary
+# is seen whole on the next feed
+_TAIL = 1024
+
+
+class PageClass:
+    """Verdict of the pre-parse classifier for one page body.
+
+    verdict is 'static' (worth parsing), 'render' (needs a browser) or
+    'blocked' (a low-content page with blocking keywords, also rendered);
+    blocked is set whenever a blocking keyword appears at all.
+    """
+
+    def __init__(self, verdict, reason, anchors, images, keywords, spa_markers, scanned, complete):
+        self.verdict = verdict
+        self.reason = reason
+        self.anchors = anchors
+        self.images = images
+        self.keywords = keywords
+        self.spa_markers = spa_markers
+        self.scanned = scanned
+        self.complete = complete
+
+    @property
+    def blocked(self):
+        return bool(self.keywords)
+
+    def to_dict(self):
+        return {
+            'verdict': self.verdict,
+            'reason': self.reason,
+            'anchors': self.anchors,
+            'images': self.images,
+            'blocked': self.blocked,
+            'keywords': self.keywords,
+            'spaMarkers': self.spa_markers,
+            'scannedBytes': self.scanned,
+            'complete': self.complete,
+        }
+
+
+class PageClassifier:
+    """Decides static / render / blocked from the raw bytes of a page, before any parse.
+
+    Tags are counted with a regex tokenizer rather than a tree, so a page
+    that needs a browser never pays for BeautifulSoup. Use inspect() as the
+    streaming callback of fetch_page: it scans each new chunk once and
+    returns True as soon as the page is known to be a client-rendered shell,
+    which stops the download. classify() finishes the scan and gives the verdict.
+    """
+
+    def __init__(self):
+        self.anchors = 0
+        self.images = 0
+        self.keywords = set()
+        self.mount = False
+        self.hydration = False
+        self._pos = 0
+        self._keyword_pos = 0
+        self._stopped = False
+        # (kind, start, scanned up to) of a raw block still open at the end of the data so far
+        self._open = None
+
+    @property
+    def spa_shell(self):
+        # An empty mount point alone can be a widget on a server-rendered page;
+        # together with shipped client state it is a page the browser builds
+        return self.mount and self.hydration
+
+    def inspect(self, buffer):
+        """Scan what arrived since the last call; True means stop reading"""
+        self._scan(buffer, final=False)
+        self._stopped = self.spa_shell
+        return self._stopped
+
+    def classify(self, body):
+        self._scan(body, final=True)
+        markers = []
+        if self.mount:
+            markers.append('empty-mount')
+        if self.hydration:
+            markers.append('hydration-state')
+        if self.spa_shell:
+            verdict, reason = RENDER, 'client-rendered shell'
+        elif self.anchors < MIN_ANCHORS or self.images < MIN_IMAGES:
+            verdict = BLOCKED if self.keywords else RENDER
+            reason = f'low content ({self.anchors} links, {self.images} images)'
+        else:
+            verdict, reason = STATIC, 'server-rendered content'
+        keywords = sorted(keyword.decode() for keyword in self.keywords)
+        return PageClass(verdict, reason, self.anchors, self.images, keywords, markers, len(body),
+                         not self._stopped)
+
+    def _scan(self, buffer, final):
+        self._scan_keywords(buffer)
+        end = len(buffer)
+        if self._open is not None and not self._close_open_block(buffer, final):
+            return
+        limit = end if final else end - _TAIL
+        if limit <= self._pos:
+            return
+        for match in _TAGS.finditer(buffer, self._pos):
+            if match.start() >= limit:
+                self._pos = match.start()
+                return
+            kind = match.lastgroup
+            if not final and match.end() == end and kind in ('comment', 'raw'):
+                # A large inline script or comment that has not ended yet: remember where
+                # it started and look only for its end in the bytes still to come, rather
+                # than rescanning the whole block on every chunk
+                block = 'comment' if kind == 'comment' else match.group('rawtag').decode().lower()
+                self._open = (block, match.start(), match.start())
+                self._close_open_block(buffer, final)
+                return
+            if not final and match.end() > limit:
+                # Possibly cut short by the end of the data so far; rescan it with more
+                self._pos = match.start()
+                return
+            if kind == 'anchor':
+                self.anchors += 1
+            elif kind == 'image':
+                self.images += 1
+            elif kind == 'mount':
+                self.mount = True
+            elif kind == 'raw' and not self.hydration:
+                self.hydration = _HYDRATION.search(buffer, *match.span()) is not None
+        self._pos = limit
+
+    def _close_open_block(self, buffer, final):
+        """Look for the end of the open block in the new bytes; True once it is closed"""
+        block, start, scanned = self._open
+        closing = _CLOSERS[block].search(buffer, max(start, scanned - _TAIL))
+        block_end = closing.end() if closing is not None else len(buffer)
+        if block != 'comment' and not self.hydration:
+            self.hydration = _HYDRATION.search(buffer, max(start, scanned - _HYDRATION_OVERLAP), block_end) is not None
+        if closing is None and not final:
+            self._open = (block, start, len(buffer))
+            return False
+        # Unclosed at the very end, the parser would swallow the rest of the page too
+        self._open = None
+        self._pos = block_end
+        return True
+
+    def _scan_keywords(self, buffer):
+        # Keywords count anywhere in the page, scripts and comments included.
+        # Lowercasing the new bytes once and letting bytes.find() look for each
+        # keyword beats both a case-insensitive alternation and a Python-level
+        # automaton by an order of magnitude on large pages.
+        if len(self.keywords) == len(_KEYWORDS) or len(buffer) <= self._keyword_pos:
+            return
+        window = bytes(buffer[max(0, self._keyword_pos - _KEYWORD_OVERLAP):]).lower()
+        for keyword in _KEYWORDS:
+            if keyword not in self.keywords and window.find(keyword) != -1:
+                self.keywords.add(keyword)
+        self._keyword_pos = len(buffer)
+
+
+def classify_page(body):
+    """Classify a complete page body in one call"""
+    return PageClassifier().classify(body)
@@ -0,0 +1,163 @@
+import logging
+import os
+import time
+
+# Resolves once the DOM has had no mutations for quietMs, or after maxMs at the latest
+_DOM_QUIET_JS = """
+([quietMs, maxMs]) => new Promise(resolve => {
+    let quietTimer;
+    const finish = reason => {
+        observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(capTimer);
+        resolve(reason);
+    };
+    const observer = new MutationObserver(() => {
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(() => finish('quiet'), quietMs);
+    });
+    observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    quietTimer = setTimeout(() => finish('quiet'), quietMs);
+    const capTimer = setTimeout(() => finish('timeout'), maxMs);
+})
+"""
+
+_HEIGHT_EXPR = "Math.max(document.body ? document.body.scrollHeight : 0, document.documentElement.scrollHeight)"
+_HEIGHT_JS = "() => " + _HEIGHT_EXPR
+
+# Scrolls to the bottom and resolves with the page height as soon as it grows, or after waitMs
+_SCROLL_JS = """
+([waitMs]) => new Promise(resolve => {
+    const height = () => """ + _HEIGHT_EXPR + """;
+    const before = height();
+    window.scrollTo(0, before);
+    const started = performance.now();
+    const check = () => {
+        const now = height();
+        if (now > before || performance.now() - started >= waitMs) {
+            resolve(now);
+        } else {
+            setTimeout(check, 50);
+        }
+    };
+    setTimeout(check, 50);
+})
+"""
+
+# Selenium flavours of the same scripts: the async callback is the last argument
+_SELENIUM_DOM_QUIET_JS = "const done = arguments[arguments.length - 1];\n(" + _DOM_QUIET_JS.strip() + ")([arguments[0], arguments[1]]).then(done);"
+_SELENIUM_SCROLL_JS = "const done = arguments[arguments.length - 1];\n(" + _SCROLL_JS.strip() + ")([arguments[0]]).then(done);"
+
+COOKIE_BUTTON_SELECTOR = 'button[aria-label*="Accept"], span:has-text("Accept all")'
+
+
+class Deadline:
+    """Remaining share of a fixed time budget"""
+
+    def __init__(self, budget_ms):
+        self.budget_ms = budget_ms
+        self.started = time.monotonic()
+
+    @property
+    def elapsed_ms(self):
+        return (time.monotonic() - self.started) * 1000
+
+    @property
+    def remaining_ms(self):
+        return max(0, self.budget_ms - self.elapsed_ms)
+
+    def slice(self, cap_ms):
+        """Time to spend on the next step: cap_ms or what is left, whichever is smaller"""
+        return int(min(cap_ms, self.remaining_ms))
+
+
+class ReadinessSettings:
+    """Tunables for deciding a rendered page is ready, read from the environment"""
+
+    def __init__(self, budget_ms=None, quiet_ms=None, network_idle_ms=None, scroll_wait_ms=None, max_scrolls=None,
+                 dom_share=None):
+        self.budget_ms = budget_ms or int(os.getenv('READINESS_BUDGET_MS', '8000'))
+        self.quiet_ms = quiet_ms or int(os.getenv('READINESS_QUIET_MS', '300'))
+        # Pages that never stop mutating (carousels, tickers) must leave time for scrolling
+        self.dom_share = dom_share or float(os.getenv('READINESS_DOM_SHARE', '0.35'))
+        self.network_idle_ms = network_idle_ms or int(os.getenv('READINESS_NETWORK_IDLE_MS', '3000'))
+        self.scroll_wait_ms = scroll_wait_ms or int(os.getenv('READINESS_SCROLL_WAIT_MS', '600'))
+        self.max_scrolls = max_scrolls or int(os.getenv('READINESS_MAX_SCROLLS', '8'))
+
+    @property
+    def dom_max_ms(self):
+        return int(self.budget_ms * self.dom_share)
+
+
+def wait_for_page_ready(page, settings=None):
+    """Wait until a Playwright page is hydrated and its lazy content has loaded.
+
+    Steps, all sharing one time budget: network idle, DOM mutation
+    quiescence (at most dom_share of the budget), then scrolling until a
+    scroll no longer grows the page, then a non-blocking attempt to dismiss
+    a cookie banner. Returns a report dict.
+    """
+    settings = settings or ReadinessSettings()
+    deadline = Deadline(settings.budget_ms)
+    report = {'networkIdle': False, 'dom': None, 'scrolls': 0, 'cookieBanner': False}
+
+    try:
+        page.wait_for_load_state('networkidle', timeout=max(1, deadline.slice(settings.network_idle_ms)))
+        report['networkIdle'] = True
+    except Exception:
+        # Long-polling and analytics beacons keep some pages busy forever
+        pass
+
+    if deadline.remaining_ms:
+        report['dom'] = page.evaluate(_DOM_QUIET_JS, [settings.quiet_ms, deadline.slice(settings.dom_max_ms)])
+
+    height = page.evaluate(_HEIGHT_JS) if deadline.remaining_ms else 0
+    while report['scrolls'] < settings.max_scrolls and deadline.remaining_ms:
+        new_height = page.evaluate(_SCROLL_JS, [deadline.slice(settings.scroll_wait_ms)])
+        report['scrolls'] += 1
+        if new_height <= height:
+            break
+        height = new_height
+
+    try:
+        button = page.locator(COOKIE_BUTTON_SELECTOR).first
+        if button.is_visible():
+            button.click(timeout=max(1, deadline.slice(1000)))
+            report['cookieBanner'] = True
+    except Exception:
+        pass
+
+    report['elapsedMs'] = round(deadline.elapsed_ms)
+    report['budgetExhausted'] = deadline.remaining_ms == 0
+    logging.debug(f"Page ready: {report}")
+    return report
+
+
+def wait_for_driver_ready(driver, settings=None):
+    """Selenium counterpart of wait_for_page_ready (no network idle signal available)"""
+    settings = settings or ReadinessSettings()
+    deadline = Deadline(settings.budget_ms)
+    report = {'documentComplete': False, 'dom': None, 'scrolls': 0}
+    driver.set_script_timeout(max(1, settings.budget_ms / 1000) + 1)
+
+    while deadline.remaining_ms:
+        if driver.execute_script('return document.readyState') == 'complete':
+            report['documentComplete'] = True
+            break
+        time.sleep(0.05)
+
+    if deadline.remaining_ms:
+        report['dom'] = driver.execute_async_script(_SELENIUM_DOM_QUIET_JS, settings.quiet_ms, deadline.slice(settings.dom_max_ms))
+
+    height = driver.execute_script('return ' + _HEIGHT_EXPR) if deadline.remaining_ms else 0
+    while report['scrolls'] < settings.max_scrolls and deadline.remaining_ms:
+        new_height = driver.execute_async_script(_SELENIUM_SCROLL_JS, deadline.slice(settings.scroll_wait_ms))
+        report['scrolls'] += 1
+        if new_height <= height:
+            break
+        height = new_height
+
+    report['elapsedMs'] = round(deadline.elapsed_ms)
+    report['budgetExhausted'] = deadline.remaining_ms == 0
+    logging.debug(f"Driver ready: {report}")
+    return report
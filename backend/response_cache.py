@@ -0,0 +1,297 @@
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+# Values for the X-Cache response header
+HIT = 'HIT'
+MISS = 'MISS'
+REVALIDATED = 'REVALIDATED'
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+_MAX_AGE = re.compile(r'(?:^|,)\s*(s-maxage|max-age)\s*=\s*"?(\d+)"?', re.IGNORECASE)
+
+
+def normalize_url(url):
+    """Canonical form of a URL for cache keys and de-duplication.
+
+    Lowercases scheme and host, drops default ports and fragments, sorts the
+    query string and gives an empty path a trailing slash.
+    """
+    parsed = urllib.parse.urlsplit(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    if parsed.port and parsed.port != _DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parsed.port}'
+    if parsed.username or parsed.password:
+        host = f'{parsed.username or ""}{":" + parsed.password if parsed.password else ""}@{host}'
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit((scheme, host, parsed.path or '/', query, ''))
+
+
+def freshness_from_headers(headers, default_ttl):
+    """Seconds a response may be reused without revalidation, or None for no-store"""
+    cache_control = headers.get('Cache-Control', '') if headers else ''
+    directives = cache_control.lower()
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0
+    ages = dict((name.lower(), int(value)) for name, value in _MAX_AGE.findall(cache_control))
+    if 's-maxage' in ages:
+        return ages['s-maxage']
+    if 'max-age' in ages:
+        return ages['max-age']
+    expires = headers.get('Expires') if headers else None
+    if expires:
+        try:
+            expires_at = email.utils.parsedate_to_datetime(expires).timestamp()
+            return max(0, int(expires_at - time.time()))
+        except (TypeError, ValueError):
+            return 0
+    return default_ttl
+
+
+class CacheEntry:
+    """A stored scrape result together with the validators needed to revalidate it"""
+
+    def __init__(self, key, result, ttl, etag=None, last_modified=None, stored_at=None):
+        self.key = key
+        self.result = result
+        self.ttl = ttl
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at or time.time()
+        self._encoded = None
+
+    @property
+    def age(self):
+        return time.time() - self.stored_at
+
+    def is_fresh(self, max_age=None):
+        limit = self.ttl if max_age is None else min(self.ttl, max_age)
+        return self.age < limit
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def encode(self):
+        if self._encoded is None:
+            self._encoded = json.dumps({
+                'key': self.key,
+                'result': self.result,
+                'ttl': self.ttl,
+                'etag': self.etag,
+                'lastModified': self.last_modified,
+                'storedAt': self.stored_at,
+            }, default=str).encode('utf-8')
+        return self._encoded
+
+    @property
+    def size(self):
+        return len(self.encode())
+
+    @classmethod
+    def decode(cls, payload):
+        data = json.loads(payload)
+        return cls(data['key'], data['result'], data['ttl'], data.get('etag'), data.get('lastModified'), data['storedAt'])
+
+
+class ResponseCache:
+    """Two-tier LRU cache of scrape results keyed by normalized URL.
+
+    The memory tier holds hot entries up to memory_bytes; evicted entries
+    stay in the disk tier (one JSON file per key) until it exceeds disk_bytes.
+    Stale entries are kept so they can be revalidated with a conditional GET.
+    """
+
+    def __init__(self, memory_bytes=64 * 1024 * 1024, disk_dir=None, disk_bytes=512 * 1024 * 1024, default_ttl=300):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir if disk_bytes > 0 else None
+        self.disk_bytes = disk_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._disk = OrderedDict()
+        self._disk_used = 0
+        self._counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stores': 0, 'evictions': 0}
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def get(self, url):
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+            digest = self._digest(key)
+            if digest not in self._disk:
+                return None
+            path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                entry = CacheEntry.decode(f.read())
+            os.utime(path)
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Dropping unreadable cache entry for {key}: {e}")
+            self._forget_disk(digest)
+            return None
+        with self._lock:
+            if digest in self._disk:
+                self._disk.move_to_end(digest)
+            self._store_memory(entry)
+        return entry
+
+    def put(self, url, result, headers=None):
+        """Store a result; returns the entry, or None when the response forbids caching"""
+        ttl = freshness_from_headers(headers, self.default_ttl)
+        if ttl is None:
+            return None
+        entry = CacheEntry(
+            normalize_url(url),
+            result,
+            ttl,
+            etag=headers.get('ETag') if headers else None,
+            last_modified=headers.get('Last-Modified') if headers else None,
+        )
+        self._store(entry)
+        self._bump('stores')
+        return entry
+
+    def refresh(self, entry, headers=None):
+        """Restart an entry's freshness after a 304, picking up any new cache headers"""
+        ttl = freshness_from_headers(headers, self.default_ttl)
+        entry = CacheEntry(
+            entry.key,
+            entry.result,
+            entry.ttl if ttl is None else ttl,
+            etag=(headers.get('ETag') if headers else None) or entry.etag,
+            last_modified=(headers.get('Last-Modified') if headers else None) or entry.last_modified,
+        )
+        self._store(entry)
+        return entry
+
+    def record(self, status):
+        self._bump({HIT: 'hits', MISS: 'misses', REVALIDATED: 'revalidated'}[status])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memoryEntries': len(self._memory),
+                'memoryBytes': self._memory_used,
+                'memoryLimitBytes': self.memory_bytes,
+                'diskEntries': len(self._disk),
+                'diskBytes': self._disk_used,
+                'diskLimitBytes': self.disk_bytes if self.disk_dir else 0,
+                **self._counters,
+            }
+
+    def _bump(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.disk_dir, digest + '.json')
+
+    def _store(self, entry):
+        with self._lock:
+            self._store_memory(entry)
+        if self.disk_dir:
+            self._store_disk(entry)
+
+    def _store_memory(self, entry):
+        # Caller holds the lock
+        old = self._memory.pop(entry.key, None)
+        if old is not None:
+            self._memory_used -= old.size
+        if entry.size > self.memory_bytes:
+            return
+        self._memory[entry.key] = entry
+        self._memory_used += entry.size
+        while self._memory_used > self.memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= evicted.size
+            self._counters['evictions'] += 1
+
+    def _store_disk(self, entry):
+        digest = self._digest(entry.key)
+        path = self._path(digest)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(entry.encode())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write cache entry for {entry.key}: {e}")
+            return
+        victims = []
+        with self._lock:
+            self._disk_used -= self._disk.pop(digest, 0)
+            self._disk[digest] = entry.size
+            self._disk_used += entry.size
+            while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+                victim, size = self._disk.popitem(last=False)
+                self._disk_used -= size
+                victims.append(victim)
+                self._counters['evictions'] += 1
+        for victim in victims:
+            try:
+                os.remove(self._path(victim))
+            except OSError:
+                pass
+
+    def _forget_disk(self, digest):
+        with self._lock:
+            self._disk_used -= self._disk.pop(digest, 0)
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def _load_disk_index(self):
+        # Files are named by key digest, so LRU order can be rebuilt from mtimes alone
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-len('.json')], stat.st_size))
+        for _, digest, size in sorted(files):
+            self._disk[digest] = size
+            self._disk_used += size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, configured from the environment"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            basedir = os.path.abspath(os.path.dirname(__file__))
+            _cache = ResponseCache(
+                memory_bytes=int(os.getenv('CACHE_MEMORY_BYTES', str(64 * 1024 * 1024))),
+                disk_dir=os.getenv('CACHE_DIR', os.path.join(basedir, '.scrape_cache')),
+                disk_bytes=int(os.getenv('CACHE_DISK_BYTES', str(512 * 1024 * 1024))),
+                default_ttl=int(os.getenv('CACHE_DEFAULT_TTL', '300')),
+            )
+        return _cache
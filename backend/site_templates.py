@@ -0,0 +1,388 @@
+import fnmatch
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+import soupsieve
+
+from extraction import PRODUCT_SELECTORS, FEATURE_SELECTORS, REVIEW_SELECTORS, CompiledSelector, PageExtractor
+from strategy import domain_of
+
+# Fields holding a list of strings; every other field holds one string
+LIST_FIELDS = ('features', 'reviews')
+FIELD_NAME = re.compile(r'^[A-Za-z][A-Za-z0-9_]{0,63}$')
+TEMPLATE_ID = re.compile(r'^[\w.-]{1,64}$')
+MAX_RULES_PER_FIELD = 20
+MAX_URL_PATTERN = 200
+
+
+class XPathRule:
+    """XPath expression evaluated on an lxml tree of the page"""
+
+    def __init__(self, expression):
+        from lxml import etree
+        self.expression = expression
+        try:
+            self._xpath = etree.XPath(expression)
+        except etree.XPathSyntaxError as e:
+            raise ValueError(f'Invalid XPath {expression!r}: {e}')
+
+    def values(self, page):
+        from lxml import etree
+        tree = page.tree
+        if tree is None:
+            return []
+        try:
+            found = self._xpath(tree)
+        except etree.XPathEvalError:
+            return []
+        if not isinstance(found, list):
+            # string(), count() and friends return a single value
+            found = [found]
+        values = []
+        for item in found:
+            text = item.text_content() if hasattr(item, 'text_content') else str(item)
+            text = ' '.join(text.split())
+            if text:
+                values.append(text)
+        return values
+
+    def value(self, page):
+        values = self.values(page)
+        return values[0] if values else None
+
+
+class JsonLdRule:
+    """Dotted path into the page's JSON-LD objects, optionally only those of one @type"""
+
+    def __init__(self, path, schema_type=None):
+        if not isinstance(path, str) or not path.strip('.'):
+            raise ValueError('jsonld rules need a dotted path such as "offers.price"')
+        if schema_type is not None and not isinstance(schema_type, str):
+            raise ValueError('type of a jsonld rule must be a string')
+        self.path = path
+        self.keys = tuple(key for key in path.split('.') if key)
+        self.schema_type = schema_type
+
+    def values(self, page):
+        values = []
+        for node in _jsonld_nodes(page.schema_data):
+            if self.schema_type is not None and self.schema_type not in _jsonld_types(node):
+                continue
+            for value in _walk(node, self.keys):
+                if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+                    text = str(value).strip()
+                    if text:
+                        values.append(text)
+        return values
+
+    def value(self, page):
+        values = self.values(page)
+        return values[0] if values else None
+
+
+def _jsonld_nodes(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from _jsonld_nodes(item)
+    elif isinstance(data, dict):
+        yield data
+        if '@graph' in data:
+            yield from _jsonld_nodes(data['@graph'])
+
+
+def _jsonld_types(node):
+    types = node.get('@type')
+    return types if isinstance(types, list) else [types]
+
+
+def _walk(value, keys):
+    if isinstance(value, list):
+        for item in value:
+            yield from _walk(item, keys)
+    elif not keys:
+        yield value
+    elif isinstance(value, dict) and keys[0] in value:
+        yield from _walk(value[keys[0]], keys[1:])
+
+
+def compile_rule(rule):
+    """Rule spec -> CompiledSelector, XPathRule or JsonLdRule; raises ValueError when invalid.
+
+    A plain string is a CSS selector. Objects name the kind of rule:
+    {"css": ".price", "attr": "content"}, {"xpath": "//span[@itemprop='sku']"}
+    or {"jsonld": "offers.price", "type": "Product"}.
+    """
+    if isinstance(rule, str):
+        rule = {'css': rule}
+    if not isinstance(rule, dict):
+        raise ValueError(f'Rules must be selector strings or objects, got {rule!r}')
+    if 'css' in rule:
+        attr = rule.get('attr')
+        if attr is not None and not isinstance(attr, str):
+            raise ValueError('attr must be an attribute name')
+        try:
+            return CompiledSelector(rule['css'], attr)
+        except (soupsieve.SelectorSyntaxError, TypeError) as e:
+            raise ValueError(f"Invalid CSS selector {rule['css']!r}: {e}")
+    if 'xpath' in rule:
+        return XPathRule(rule['xpath'])
+    if 'jsonld' in rule:
+        return JsonLdRule(rule['jsonld'], rule.get('type'))
+    raise ValueError(f'Rules need one of css, xpath or jsonld, got {rule!r}')
+
+
+class SiteTemplate:
+    """Extraction rules for one site, compiled once into a PageExtractor.
+
+    urlPattern is a glob (fnmatch: *, ?, [...]) matched against the path and
+    query of the URL, e.g. "/p/*". It is not a regular expression, since
+    templates come from API callers and a regex can backtrack for as long
+    as the caller likes on every scraped URL.
+    Fields the template leaves out keep the generic selectors unless
+    fallback is false, so a template only has to describe what the generic
+    lists get wrong. Fields other than the standard productInfo ones,
+    features and reviews are added to productInfo.
+    """
+
+    def __init__(self, spec):
+        if not isinstance(spec, dict):
+            raise ValueError('A template must be a JSON object')
+        self.id = str(spec.get('id') or uuid.uuid4().hex[:12])
+        if not TEMPLATE_ID.match(self.id):
+            raise ValueError('id may only contain letters, digits, ".", "_" and "-"')
+
+        domains = spec.get('domains') or []
+        if isinstance(domains, str):
+            domains = [domains]
+        self.domains = sorted({str(domain).strip().lower().lstrip('.') for domain in domains if str(domain).strip()})
+        self.url_pattern = spec.get('urlPattern')
+        self._pattern = None
+        if self.url_pattern is not None:
+            if not isinstance(self.url_pattern, str) or not 0 < len(self.url_pattern) <= MAX_URL_PATTERN:
+                raise ValueError(f'urlPattern must be a glob of 1 to {MAX_URL_PATTERN} characters')
+            # translate() keeps runs of * from backtracking into each other
+            self._pattern = re.compile(fnmatch.translate(self.url_pattern))
+        if not self.domains and self._pattern is None:
+            raise ValueError('A template needs domains, a urlPattern or both')
+
+        fields = spec.get('fields')
+        if not isinstance(fields, dict) or not fields:
+            raise ValueError('fields must map field names to rules')
+        self.fields = {}
+        compiled = {}
+        for field, rules in fields.items():
+            if not FIELD_NAME.match(field):
+                raise ValueError(f'Invalid field name {field!r}')
+            rules = rules if isinstance(rules, list) else [rules]
+            if not rules or len(rules) > MAX_RULES_PER_FIELD:
+                raise ValueError(f'{field} needs between 1 and {MAX_RULES_PER_FIELD} rules')
+            compiled[field] = [compile_rule(rule) for rule in rules]
+            self.fields[field] = rules
+        self.fallback = bool(spec.get('fallback', True))
+
+        product = {field: compiled.get(field, selectors if self.fallback else [])
+                   for field, selectors in PRODUCT_SELECTORS.items()}
+        product.update({field: rules for field, rules in compiled.items()
+                        if field not in product and field not in LIST_FIELDS})
+        self.extractor = PageExtractor(
+            product,
+            compiled.get('features', FEATURE_SELECTORS if self.fallback else []),
+            compiled.get('reviews', REVIEW_SELECTORS if self.fallback else []),
+            template=self.id,
+        )
+
+    def matches(self, url):
+        if self._pattern is None:
+            return True
+        parts = urllib.parse.urlsplit(url)
+        target = f'{parts.path or "/"}?{parts.query}' if parts.query else parts.path or '/'
+        return self._pattern.match(target) is not None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'domains': self.domains,
+            'urlPattern': self.url_pattern,
+            'fields': self.fields,
+            'fallback': self.fallback,
+        }
+
+
+class TemplateRegistry:
+    """Site templates indexed by host, persisted as JSON.
+
+    A URL is matched by walking its host up through the parent domains
+    (www.shop.example.com, shop.example.com, example.com); on each level
+    templates with a urlPattern are tried before catch-all ones. Templates
+    with only a urlPattern are tried last. The file is re-read when another
+    process changes it, at most every reload_interval seconds, so job
+    workers pick up new templates without a restart.
+    """
+
+    def __init__(self, path=None, reload_interval=2.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._by_host = {}
+        self._pattern_only = []
+        self._mtime = None
+        self._checked = 0.0
+        self._counters = {'matched': 0, 'generic': 0}
+        self._hits = {}
+        if path:
+            self._load()
+
+    def match(self, url):
+        self._maybe_reload()
+        host = domain_of(url)
+        labels = host.split('.')
+        with self._lock:
+            template = None
+            for start in range(len(labels)):
+                for candidate in self._by_host.get('.'.join(labels[start:]), ()):
+                    if candidate.matches(url):
+                        template = candidate
+                        break
+                if template is not None:
+                    break
+            if template is None:
+                template = next((t for t in self._pattern_only if t.matches(url)), None)
+            if template is None:
+                self._counters['generic'] += 1
+            else:
+                self._counters['matched'] += 1
+                self._hits[template.id] = self._hits.get(template.id, 0) + 1
+            return template
+
+    def get(self, template_id):
+        self._maybe_reload()
+        with self._lock:
+            return self._templates.get(template_id)
+
+    def list(self):
+        self._maybe_reload()
+        with self._lock:
+            return [dict(template.to_dict(), matches=self._hits.get(template.id, 0))
+                    for template in self._templates.values()]
+
+    def put(self, spec):
+        """Compile and store a template, replacing one with the same id; raises ValueError"""
+        template = SiteTemplate(spec)
+        self._maybe_reload()
+        with self._lock:
+            self._templates[template.id] = template
+            self._reindex()
+        self.save()
+        return template
+
+    def delete(self, template_id):
+        self._maybe_reload()
+        with self._lock:
+            existed = self._templates.pop(template_id, None) is not None
+            if existed:
+                self._reindex()
+        if existed:
+            self.save()
+        return existed
+
+    def stats(self):
+        with self._lock:
+            return {'templates': len(self._templates), **self._counters}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            payload = [template.to_dict() for template in self._templates.values()]
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(payload, f, indent=2)
+            os.replace(tmp_path, self.path)
+            with self._lock:
+                self._mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logging.warning(f"Could not save site templates: {e}")
+
+    def _reindex(self):
+        # Caller holds the lock
+        by_host = {}
+        pattern_only = []
+        for template in self._templates.values():
+            if not template.domains:
+                pattern_only.append(template)
+            for domain in template.domains:
+                by_host.setdefault(domain, []).append(template)
+        for templates in by_host.values():
+            templates.sort(key=lambda t: t.url_pattern is None)
+        self._by_host = by_host
+        self._pattern_only = pattern_only
+
+    def _maybe_reload(self):
+        if not self.path:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < self.reload_interval:
+                return
+            self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self._load()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path) as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable site templates {self.path}: {e}")
+            return
+        templates = {}
+        for spec in payload:
+            try:
+                template = SiteTemplate(spec)
+            except ValueError as e:
+                logging.warning(f"Skipping invalid site template {spec.get('id') if isinstance(spec, dict) else spec!r}: {e}")
+                continue
+            templates[template.id] = template
+        with self._lock:
+            self._templates = templates
+            self._mtime = mtime
+            self._reindex()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_template_registry():
+    """Return the process-wide template registry, configured from the environment"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            basedir = os.path.abspath(os.path.dirname(__file__))
+            _registry = TemplateRegistry(
+                path=os.getenv('TEMPLATES_FILE', os.path.join(basedir, '.scrape_state', 'templates.json')),
+                reload_interval=float(os.getenv('TEMPLATES_RELOAD_INTERVAL', '2')),
+            )
+        return _registry
+
+
+def extractor_for(url):
+    """Compiled extractor of the template matching url, or None for the generic one"""
+    template = get_template_registry().match(url)
+    return template.extractor if template is not None else None
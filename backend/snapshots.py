@@ -0,0 +1,614 @@
+"""Content-addressed store for the raw HTML and extraction output of scrapes.
+
+Usage (from backend/):
+    python snapshots.py reextract [--domain example.com] [--limit N] [--dry-run] [--update-history]
+    python snapshots.py train example.com [--samples 200] [--dict-size 112640]
+    python snapshots.py stats
+
+Blobs are keyed by the sha256 of their uncompressed bytes, so a page body or
+result seen again (same URL on a later run, or mirrored on another URL) is
+stored once. Each scrape adds a small record pointing at its HTML and result
+blobs. Blobs are compressed with zstd, using a dictionary trained on that
+domain's pages when one exists; without the zstandard package zlib is used.
+Dictionaries are content-addressed too and never overwritten: each blob
+names the dictionary it was compressed with, and retraining a domain only
+moves its pointer to the new one.
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# First byte of every stored blob says how the rest is encoded
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+# The header holds the sha256 digest of the dictionary
+CODEC_ZSTD_DICT_ID = 3
+
+# How long a domain's current dictionary (or the lack of one) is trusted before rechecking
+_DICT_TTL = 300
+
+# Result keys that differ on every scrape of the same page; they live on the
+# record so identical extractions share one result blob
+VOLATILE_RESULT_KEYS = ('id', 'scrapedAt', 'renderStats')
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _dict_key(dict_id):
+    return f'dict-{dict_id}'
+
+
+class FileSnapshotBackend:
+    """Blobs as files under root/blobs, records as lines of root/records.ndjson.
+
+    The records file is guarded by an advisory lock so the server appending
+    and the re-extract command rewriting it can run at the same time.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._records_path = os.path.join(root, 'records.ndjson')
+        self._lock_path = os.path.join(root, 'records.lock')
+        self._dictionaries_path = os.path.join(root, 'dictionaries.json')
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+
+    def _blob_path(self, key):
+        return os.path.join(self.root, 'blobs', key[:2], key)
+
+    def has_blob(self, key):
+        return os.path.exists(self._blob_path(key))
+
+    def put_blob(self, key, data):
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get_blob(self, key):
+        try:
+            with open(self._blob_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def blob_usage(self):
+        count = size = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, 'blobs')):
+            for name in filenames:
+                count += 1
+                size += os.path.getsize(os.path.join(dirpath, name))
+        return count, size
+
+    def _locked(self):
+        lock = open(self._lock_path, 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def add_record(self, record):
+        line = json.dumps(record) + '\n'
+        with self._locked():
+            with open(self._records_path, 'a') as f:
+                f.write(line)
+
+    def iter_records(self, domain=None):
+        try:
+            with open(self._records_path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if domain is None or record['domain'] == domain:
+                        yield record
+        except FileNotFoundError:
+            return
+
+    def get_dictionary_id(self, domain):
+        try:
+            with open(self._dictionaries_path) as f:
+                return json.load(f).get(domain)
+        except FileNotFoundError:
+            return None
+
+    def set_dictionary_id(self, domain, dict_id):
+        with self._locked():
+            try:
+                with open(self._dictionaries_path) as f:
+                    current = json.load(f)
+            except FileNotFoundError:
+                current = {}
+            current[domain] = dict_id
+            tmp_path = f'{self._dictionaries_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(current, f)
+            os.replace(tmp_path, self._dictionaries_path)
+
+    def update_records(self, updates):
+        """Apply {record id: fields} in one rewrite of the records file"""
+        if not updates:
+            return
+        with self._locked():
+            tmp_path = f'{self._records_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as out:
+                for record in self.iter_records():
+                    record.update(updates.get(record['id'], {}))
+                    out.write(json.dumps(record) + '\n')
+            os.replace(tmp_path, self._records_path)
+
+
+class GridFSSnapshotBackend:
+    """Blobs in a GridFS bucket, records in a regular collection"""
+
+    def __init__(self, db, bucket='snapshots'):
+        import gridfs
+        self.fs = gridfs.GridFS(db, collection=bucket)
+        self.files = db[f'{bucket}.files']
+        self.records = db[f'{bucket}.records']
+        self.dictionaries = db[f'{bucket}.dictionaries']
+        self.records.create_index([('domain', 1), ('scrapedAt', -1)])
+        self.records.create_index('url')
+
+    def has_blob(self, key):
+        return self.fs.exists(key)
+
+    def put_blob(self, key, data):
+        import gridfs
+        try:
+            self.fs.put(data, _id=key)
+        except gridfs.errors.FileExists:
+            pass
+
+    def get_blob(self, key):
+        import gridfs
+        try:
+            return self.fs.get(key).read()
+        except gridfs.errors.NoFile:
+            return None
+
+    def blob_usage(self):
+        totals = list(self.files.aggregate([
+            {'$group': {'_id': None, 'count': {'$sum': 1}, 'size': {'$sum': '$length'}}}]))
+        return (totals[0]['count'], totals[0]['size']) if totals else (0, 0)
+
+    def add_record(self, record):
+        self.records.insert_one(dict(record, _id=record['id']))
+
+    def iter_records(self, domain=None):
+        query = {'domain': domain} if domain else {}
+        for doc in self.records.find(query).sort('scrapedAt', 1):
+            doc.pop('_id', None)
+            yield doc
+
+    def get_dictionary_id(self, domain):
+        doc = self.dictionaries.find_one({'_id': domain})
+        return doc['dictId'] if doc else None
+
+    def set_dictionary_id(self, domain, dict_id):
+        self.dictionaries.update_one({'_id': domain}, {'$set': {'dictId': dict_id, 'trainedAt': datetime.utcnow()}},
+                                     upsert=True)
+
+    def update_records(self, updates):
+        from pymongo import UpdateOne
+        if updates:
+            self.records.bulk_write([UpdateOne({'_id': record_id}, {'$set': fields})
+                                     for record_id, fields in updates.items()], ordered=False)
+
+
+class SnapshotStore:
+    """Deduplicating, compressing front end over a snapshot backend"""
+
+    def __init__(self, backend, level=6):
+        self.backend = backend
+        self.level = level
+        # Dictionaries by blob key (immutable, kept), and each domain's current one (rechecked)
+        self._dicts = {}
+        self._current = {}
+        self._lock = threading.Lock()
+        self._counters = {'snapshots': 0, 'blobsWritten': 0, 'blobsDeduplicated': 0,
+                          'bytesIn': 0, 'bytesStored': 0}
+        if zstandard is None:
+            logging.warning("zstandard is not installed, snapshots fall back to zlib")
+
+    def save(self, url, domain, html, result, title=None, engine=None):
+        """Store one scrape and return its record"""
+        html_key = self._put(html.encode('utf-8'), domain)
+        result_key = self.store_result(domain, result)
+        record = {
+            'id': uuid.uuid4().hex,
+            'url': url,
+            'domain': domain,
+            'title': title,
+            'engine': engine,
+            'htmlKey': html_key,
+            'resultKey': result_key,
+            'historyId': result.get('id'),
+            'scrapedAt': result.get('scrapedAt') or datetime.utcnow().isoformat(),
+        }
+        if result.get('renderStats') is not None:
+            record['renderStats'] = result['renderStats']
+        self.backend.add_record(record)
+        self._bump('snapshots')
+        return record
+
+    def load_html(self, record):
+        data = self._get(record['htmlKey'])
+        return data.decode('utf-8') if data is not None else None
+
+    def load_result(self, record):
+        """The stored result with the per-scrape keys from its record put back"""
+        data = self._get(record['resultKey'])
+        if data is None:
+            return None
+        result = json.loads(data)
+        if record.get('historyId') is not None:
+            result.setdefault('id', record['historyId'])
+        result.setdefault('scrapedAt', record.get('scrapedAt'))
+        if record.get('renderStats') is not None:
+            result.setdefault('renderStats', record['renderStats'])
+        return result
+
+    def store_result(self, domain, result):
+        """Store a result blob without its per-scrape keys and return its key"""
+        stable = {key: value for key, value in result.items() if key not in VOLATILE_RESULT_KEYS}
+        return self._put(json.dumps(stable, sort_keys=True, default=str).encode('utf-8'), domain)
+
+    def train_dictionary(self, domain, samples=200, dict_size=112640):
+        """Train a zstd dictionary from the domain's stored pages; returns its size or 0"""
+        if zstandard is None:
+            raise RuntimeError('Training dictionaries needs the zstandard package')
+        pages = []
+        seen = set()
+        for record in self.backend.iter_records(domain):
+            if record['htmlKey'] in seen:
+                continue
+            seen.add(record['htmlKey'])
+            html = self._get(record['htmlKey'])
+            if html:
+                pages.append(html)
+            if len(pages) >= samples:
+                break
+        if len(pages) < 8:
+            return 0
+        trained = zstandard.train_dictionary(dict_size, pages)
+        raw = trained.as_bytes()
+        dict_id = content_key(raw)
+        # Blobs compressed with the previous dictionary keep naming it, so it stays stored
+        self.backend.put_blob(_dict_key(dict_id), raw)
+        self.backend.set_dictionary_id(domain, dict_id)
+        with self._lock:
+            self._dicts[_dict_key(dict_id)] = trained
+            self._current[domain] = ((dict_id, trained), time.monotonic())
+        return len(raw)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters['codec'] = 'zstd' if zstandard is not None else 'zlib'
+        counters['dictionaries'] = sorted(domain for domain, (current, _) in self._current.items() if current is not None)
+        return counters
+
+    def _put(self, data, domain):
+        key = content_key(data)
+        self._bump('bytesIn', len(data))
+        if self.backend.has_blob(key):
+            self._bump('blobsDeduplicated')
+            return key
+        encoded = self._encode(data, domain)
+        self.backend.put_blob(key, encoded)
+        self._bump('blobsWritten')
+        self._bump('bytesStored', len(encoded))
+        return key
+
+    def _get(self, key):
+        blob = self.backend.get_blob(key)
+        return self._decode(blob) if blob is not None else None
+
+    def _load_dictionary(self, blob_key):
+        with self._lock:
+            dictionary = self._dicts.get(blob_key)
+        if dictionary is None:
+            raw = self.backend.get_blob(blob_key)
+            if raw is None:
+                return None
+            dictionary = zstandard.ZstdCompressionDict(raw)
+            with self._lock:
+                self._dicts[blob_key] = dictionary
+        return dictionary
+
+    def _current_dictionary(self, domain):
+        """(dictionary id, dictionary) to compress the domain's blobs with, or None.
+
+        Rechecked every _DICT_TTL seconds so a dictionary trained by another
+        process is picked up.
+        """
+        with self._lock:
+            cached = self._current.get(domain)
+        if cached is not None and time.monotonic() - cached[1] < _DICT_TTL:
+            return cached[0]
+        dict_id = self.backend.get_dictionary_id(domain) if domain else None
+        dictionary = self._load_dictionary(_dict_key(dict_id)) if dict_id else None
+        current = (dict_id, dictionary) if dictionary is not None else None
+        with self._lock:
+            self._current[domain] = (current, time.monotonic())
+        return current
+
+    def _encode(self, data, domain):
+        if zstandard is None:
+            return bytes([CODEC_ZLIB]) + zlib.compress(data, self.level)
+        current = self._current_dictionary(domain)
+        if current is None:
+            return bytes([CODEC_ZSTD]) + zstandard.ZstdCompressor(level=self.level).compress(data)
+        dict_id, dictionary = current
+        compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+        return bytes([CODEC_ZSTD_DICT_ID]) + bytes.fromhex(dict_id) + compressor.compress(data)
+
+    def _decode(self, blob):
+        codec = blob[0]
+        if codec not in (CODEC_ZLIB, CODEC_ZSTD, CODEC_ZSTD_DICT_ID):
+            raise RuntimeError(f'Unknown snapshot codec {codec}; the blob is corrupt or from a newer version')
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(blob[1:])
+        if zstandard is None:
+            raise RuntimeError('This snapshot was written with zstd; install the zstandard package to read it')
+        if codec == CODEC_ZSTD:
+            return zstandard.ZstdDecompressor().decompress(blob[1:])
+        dict_id, payload = blob[1:33].hex(), blob[33:]
+        dictionary = self._load_dictionary(_dict_key(dict_id))
+        if dictionary is None:
+            raise RuntimeError(f'Missing zstd dictionary {dict_id}')
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(payload)
+
+    def _bump(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+
+class SnapshotWriter:
+    """Write-behind queue in front of a SnapshotStore.
+
+    Hashing, compressing and writing a page body costs milliseconds to
+    seconds, so scrapes only enqueue; a background thread saves. The queue
+    is bounded by count and by bytes of HTML held, and snapshots beyond
+    either limit are dropped (and counted) rather than growing memory.
+    """
+
+    def __init__(self, store, max_queued=200, max_queued_bytes=64 << 20):
+        self.store = store
+        self.max_queued = max_queued
+        self.max_queued_bytes = max_queued_bytes
+        self._queue = deque()
+        self._queued_bytes = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._counters = {'saved': 0, 'dropped': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='snapshot-writer', daemon=True)
+        self._thread.start()
+
+    def add(self, url, domain, html, result, title=None, engine=None):
+        size = len(html)
+        with self._cond:
+            if (self._closed or len(self._queue) >= self.max_queued
+                    or (self._queue and self._queued_bytes + size > self.max_queued_bytes)):
+                self._counters['dropped'] += 1
+                return False
+            # The caller keeps using its result dict; store what it was at this point
+            self._queue.append((url, domain, html, dict(result), title, engine))
+            self._queued_bytes += size
+            self._cond.notify()
+            return True
+
+    def close(self, timeout=30):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters, queued=len(self._queue), queuedBytes=self._queued_bytes)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                item = self._queue.popleft()
+                self._queued_bytes -= len(item[2])
+            try:
+                self.store.save(*item)
+                outcome = 'saved'
+            except Exception as e:
+                logging.error(f"Could not save snapshot of {item[0]}: {e}")
+                outcome = 'errors'
+            with self._cond:
+                self._counters[outcome] += 1
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store(db=None):
+    """Return this process's snapshot store, or None when SNAPSHOT_STORE=off.
+
+    SNAPSHOT_STORE picks the backend: fs (default, under SNAPSHOT_DIR) or
+    gridfs (needs a database).
+    """
+    global _store, _store_pid
+    kind = os.getenv('SNAPSHOT_STORE', 'fs').lower()
+    if kind == 'off':
+        return None
+    with _store_lock:
+        if _store is None or _store_pid != os.getpid():
+            if kind == 'gridfs':
+                if db is None:
+                    return None
+                backend = GridFSSnapshotBackend(db)
+            else:
+                basedir = os.path.abspath(os.path.dirname(__file__))
+                backend = FileSnapshotBackend(os.getenv('SNAPSHOT_DIR', os.path.join(basedir, '.scrape_snapshots')))
+            _store = SnapshotStore(backend, level=int(os.getenv('SNAPSHOT_LEVEL', '6')))
+            _store_pid = os.getpid()
+        return _store
+
+
+def snapshot_store_stats():
+    if _store is None or _store_pid != os.getpid():
+        return {'started': False}
+    stats = dict(_store.stats(), started=True)
+    if _writer is not None and _writer_pid == os.getpid():
+        stats['writer'] = _writer.stats()
+    return stats
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_snapshot_writer(db=None):
+    """Return this process's snapshot writer, or None when the store is off"""
+    global _writer, _writer_pid
+    store = get_snapshot_store(db)
+    if store is None:
+        return None
+    with _writer_lock:
+        if _writer is None or _writer_pid != os.getpid() or _writer.store is not store:
+            _writer = SnapshotWriter(
+                store,
+                max_queued=int(os.getenv('SNAPSHOT_MAX_QUEUED', '200')),
+                max_queued_bytes=int(os.getenv('SNAPSHOT_MAX_QUEUED_MB', '64')) << 20,
+            )
+            _writer_pid = os.getpid()
+            if multiprocessing.parent_process() is not None:
+                # Pool workers leave through os._exit, which skips atexit
+                multiprocessing.util.Finalize(None, _writer.close, exitpriority=10)
+        return _writer
+
+
+def close_snapshot_writer():
+    """Save what is still queued and stop the writer thread"""
+    global _writer
+    with _writer_lock:
+        if _writer is not None and _writer_pid == os.getpid():
+            _writer.close()
+        _writer = None
+
+
+def reextract(store, domain=None, limit=None, dry_run=False, history=None):
+    """Run the current extraction over stored pages without refetching them.
+
+    Records whose result changes get the new result blob; with a history
+    collection the stored history entry is updated as well.
+    Returns counters for the run.
+    """
+    from bson import ObjectId
+    from extraction import extract_page, make_soup
+
+    totals = {'records': 0, 'changed': 0, 'missing': 0, 'failed': 0}
+    updates = {}
+    started = time.monotonic()
+    for record in store.backend.iter_records(domain):
+        if limit is not None and totals['records'] >= limit:
+            break
+        totals['records'] += 1
+        html = store.load_html(record)
+        previous = store.load_result(record)
+        if html is None or previous is None:
+            totals['missing'] += 1
+            continue
+        try:
+            extraction = extract_page(make_soup(html), record['url'], record.get('title'), html)
+        except Exception as e:
+            logging.warning(f"Re-extracting {record['url']} failed: {e}")
+            totals['failed'] += 1
+            continue
+        # Keep the identity and provenance of the original scrape
+        result = dict(previous, **extraction.fields)
+        if result == previous:
+            continue
+        totals['changed'] += 1
+        if dry_run:
+            continue
+        updates[record['id']] = {'resultKey': store.store_result(record['domain'], result),
+                                 'reextractedAt': datetime.utcnow().isoformat()}
+        history_id = record.get('historyId')
+        if history is not None and history_id and ObjectId.is_valid(history_id):
+            history.update_one({'_id': ObjectId(history_id)}, {'$set': {'result': result, 'title': result.get('title')}})
+    store.backend.update_records(updates)
+    totals['elapsedMs'] = round((time.monotonic() - started) * 1000)
+    return totals
+
+
+def main():
+    from dotenv import load_dotenv
+
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    load_dotenv(os.path.join(basedir, '.env'))
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    reextract_parser = commands.add_parser('reextract', help='re-run extraction over stored pages')
+    reextract_parser.add_argument('--domain')
+    reextract_parser.add_argument('--limit', type=int)
+    reextract_parser.add_argument('--dry-run', action='store_true', help='only count results that would change')
+    reextract_parser.add_argument('--update-history', action='store_true', help='also rewrite the MongoDB history entries')
+    train_parser = commands.add_parser('train', help='train a zstd dictionary for a domain')
+    train_parser.add_argument('domain')
+    train_parser.add_argument('--samples', type=int, default=200)
+    train_parser.add_argument('--dict-size', type=int, default=112640)
+    commands.add_parser('stats', help='show how much the store holds')
+    args = parser.parse_args()
+
+    db = None
+    if os.getenv('SNAPSHOT_STORE', 'fs').lower() == 'gridfs' or getattr(args, 'update_history', False):
+        import certifi
+        from pymongo import MongoClient
+        client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/'), tlsCAFile=certifi.where())
+        db = client['scrapeflow_db']
+    store = get_snapshot_store(db)
+    if store is None:
+        sys.exit('Snapshot store is disabled (SNAPSHOT_STORE=off)')
+
+    if args.command == 'reextract':
+        history = db['scraping_jobs'] if args.update_history else None
+        print(json.dumps(reextract(store, args.domain, args.limit, args.dry_run, history)))
+    elif args.command == 'train':
+        size = store.train_dictionary(args.domain, args.samples, args.dict_size)
+        if not size:
+            sys.exit(f'Not enough stored pages for {args.domain} to train a dictionary')
+        print(f'Trained a {size} byte dictionary for {args.domain}')
+    else:
+        count, size = store.backend.blob_usage()
+        records = sum(1 for _ in store.backend.iter_records())
+        print(json.dumps({'records': records, 'blobs': count, 'bytesStored': size}))
+
+
+if __name__ == '__main__':
+    main()
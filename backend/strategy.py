@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.parse
+
+# Scrape engines in their default, cheapest-first order
+ENGINES = ('static', 'playwright', 'selenium')
+
+
+def domain_of(url):
+    return (urllib.parse.urlparse(url).hostname or '').lower()
+
+
+class EngineStats:
+    """Outcome history of one engine on one domain"""
+
+    # Weight of the newest outcome in the moving averages
+    ALPHA = 0.3
+
+    def __init__(self, attempts=0, successes=0, failures=0, failure_rate=0.0, latency_ms=None,
+                 last_attempt=None, last_success=None):
+        self.attempts = attempts
+        self.successes = successes
+        self.failures = failures
+        self.failure_rate = failure_rate
+        self.latency_ms = latency_ms
+        self.last_attempt = last_attempt
+        self.last_success = last_success
+
+    def record(self, ok, latency_ms):
+        now = time.time()
+        self.attempts += 1
+        self.last_attempt = now
+        if ok:
+            self.successes += 1
+            self.last_success = now
+            self.latency_ms = latency_ms if self.latency_ms is None else (
+                self.ALPHA * latency_ms + (1 - self.ALPHA) * self.latency_ms)
+        else:
+            self.failures += 1
+        # Decayed failure rate so a site that changes its frontend is relearned quickly
+        outcome = 0.0 if ok else 1.0
+        if self.attempts == 1:
+            self.failure_rate = outcome
+        else:
+            self.failure_rate = self.ALPHA * outcome + (1 - self.ALPHA) * self.failure_rate
+
+    def to_dict(self):
+        return {
+            'attempts': self.attempts,
+            'successes': self.successes,
+            'failures': self.failures,
+            'failureRate': round(self.failure_rate, 3),
+            'latencyMs': round(self.latency_ms) if self.latency_ms is not None else None,
+            'lastAttempt': self.last_attempt,
+            'lastSuccess': self.last_success,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('attempts', 0), data.get('successes', 0), data.get('failures', 0),
+                   data.get('failureRate', 0.0), data.get('latencyMs'), data.get('lastAttempt'),
+                   data.get('lastSuccess'))
+
+
+class StrategyTable:
+    """Remembers which scrape engine works for each domain.
+
+    An engine that keeps failing on a domain is skipped once a later engine
+    has succeeded there, so SPA sites go straight to the browser. Skipped
+    engines are re-probed now and then (randomly, and always after
+    reprobe_after seconds) so the table follows sites that change.
+    The table is persisted as JSON and reloaded on startup.
+    """
+
+    def __init__(self, path=None, min_samples=2, skip_threshold=0.7, reprobe_probability=0.05,
+                 reprobe_after=6 * 3600, save_interval=5):
+        self.path = path
+        self.min_samples = min_samples
+        self.skip_threshold = skip_threshold
+        self.reprobe_probability = reprobe_probability
+        self.reprobe_after = reprobe_after
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._domains = {}
+        self._counters = {'default': 0, 'learned': 0, 'reprobe': 0}
+        self._dirty = False
+        self._last_save = 0.0
+        if path:
+            self._load()
+
+    def plan(self, domain, allow_reprobe=True):
+        """Return {'order': [engine, ...], 'reason': 'default' | 'learned' | 'reprobe'}"""
+        with self._lock:
+            stats = self._domains.get(domain)
+            order, skipped = self._learned_order(stats)
+            if not skipped:
+                reason = 'default'
+            elif allow_reprobe and self._should_reprobe(stats, skipped):
+                order, reason = list(ENGINES), 'reprobe'
+            else:
+                reason = 'learned'
+            if allow_reprobe:
+                self._counters[reason] += 1
+            return {'order': order, 'reason': reason}
+
+    def record(self, domain, engine, ok, latency_ms):
+        with self._lock:
+            engines = self._domains.setdefault(domain, {})
+            engines.setdefault(engine, EngineStats()).record(ok, latency_ms)
+            self._dirty = True
+            due = time.monotonic() - self._last_save >= self.save_interval
+        if due:
+            self.save()
+
+    def reset(self, domain):
+        with self._lock:
+            existed = self._domains.pop(domain, None) is not None
+            self._dirty = self._dirty or existed
+        return existed
+
+    def snapshot(self):
+        with self._lock:
+            domains = {
+                domain: {
+                    'engines': {engine: stats.to_dict() for engine, stats in engines.items()},
+                    'plan': self._learned_order(engines)[0],
+                }
+                for domain, engines in sorted(self._domains.items())
+            }
+            return {'decisions': dict(self._counters), 'domains': domains}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {domain: {engine: stats.to_dict() for engine, stats in engines.items()}
+                       for domain, engines in self._domains.items()}
+            self._dirty = False
+            self._last_save = time.monotonic()
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save strategy table: {e}")
+
+    def _learned_order(self, stats):
+        # Caller holds the lock
+        if not stats:
+            return list(ENGINES), []
+        order = []
+        skipped = []
+        for position, engine in enumerate(ENGINES):
+            engine_stats = stats.get(engine)
+            later_success = any(stats.get(later) and stats[later].successes for later in ENGINES[position + 1:])
+            if (engine_stats and later_success and engine_stats.attempts >= self.min_samples
+                    and engine_stats.failure_rate >= self.skip_threshold):
+                skipped.append(engine)
+            else:
+                order.append(engine)
+        return order, skipped
+
+    def _should_reprobe(self, stats, skipped):
+        now = time.time()
+        for engine in skipped:
+            last_attempt = stats[engine].last_attempt or 0
+            if now - last_attempt >= self.reprobe_after:
+                return True
+        return random.random() < self.reprobe_probability
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable strategy table {self.path}: {e}")
+            return
+        for domain, engines in payload.items():
+            self._domains[domain] = {engine: EngineStats.from_dict(data) for engine, data in engines.items()}
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_strategy_table():
+    """Return the process-wide strategy table, configured from the environment"""
+    global _table
+    with _table_lock:
+        if _table is None:
+            basedir = os.path.abspath(os.path.dirname(__file__))
+            _table = StrategyTable(
+                path=os.getenv('STRATEGY_FILE', os.path.join(basedir, '.scrape_state', 'strategies.json')),
+                min_samples=int(os.getenv('STRATEGY_MIN_SAMPLES', '2')),
+                skip_threshold=float(os.getenv('STRATEGY_SKIP_THRESHOLD', '0.7')),
+                reprobe_probability=float(os.getenv('STRATEGY_REPROBE_PROBABILITY', '0.05')),
+                reprobe_after=float(os.getenv('STRATEGY_REPROBE_AFTER', str(6 * 3600))),
+            )
+        return _table
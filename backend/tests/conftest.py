@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# Modules in backend/ import each other by bare name, as app.py does
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The Flask app module, importable without MongoDB and with its state files in a temp dir"""
+    state = tmp_path_factory.mktemp('state')
+    os.environ.update({
+        'MONGO_URI': 'mongodb://127.0.0.1:9/',
+        'MONGO_TIMEOUT_MS': '200',
+        'CACHE_DIR': str(state / 'cache'),
+        'SNAPSHOT_DIR': str(state / 'snapshots'),
+        'STRATEGY_FILE': str(state / 'strategies.json'),
+        'TEMPLATES_FILE': str(state / 'templates.json'),
+        'EXTRACT_WORKERS': '0',
+    })
+    import app
+    return app
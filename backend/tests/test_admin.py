@@ -0,0 +1,23 @@
+import pytest
+
+
+@pytest.fixture
+def client(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'secret')
+    return app_module.app.test_client()
+
+
+def test_admin_api_is_off_without_a_token_configured(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', None)
+    client = app_module.app.test_client()
+    assert client.get('/api/admin/strategies', headers={'X-Admin-Token': ''}).status_code == 403
+
+
+@pytest.mark.parametrize('method, path', [
+    ('get', '/api/admin/strategies'),
+    ('delete', '/api/admin/strategies/example.com'),
+])
+def test_strategy_endpoints_need_the_admin_token(client, method, path):
+    assert getattr(client, method)(path).status_code == 401
+    assert getattr(client, method)(path, headers={'X-Admin-Token': 'wrong'}).status_code == 401
+    assert getattr(client, method)(path, headers={'X-Admin-Token': 'secret'}).status_code in (200, 404)
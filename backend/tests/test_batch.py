@@ -0,0 +1,48 @@
+import pytest
+
+from batch import BatchEngine, TokenBucket
+
+
+@pytest.fixture
+def engine():
+    calls = []
+
+    def scrape(url, user=None):
+        calls.append((url, user))
+        if 'fail' in url:
+            raise ValueError('boom')
+        return {'url': url, 'user': user}
+
+    engine = BatchEngine(scrape, per_host_concurrency=4, per_host_rate=1000, per_host_burst=100)
+    engine.calls = calls
+    yield engine
+    engine.shutdown()
+
+
+def test_run_yields_every_url_once(engine):
+    items = [(i, f'http://host{i % 3}.test/{i}') for i in range(12)]
+    results = list(engine.run(items))
+    assert sorted(item['index'] for item in results) == list(range(12))
+    assert all(item['status'] == 'ok' for item in results)
+
+
+def test_errors_are_reported_per_url(engine):
+    results = {item['index']: item for item in engine.run([(0, 'http://a.test/ok'), (1, 'http://a.test/fail')])}
+    assert results[0]['status'] == 'ok'
+    assert results[1]['status'] == 'error'
+    assert results[1]['error'] == 'boom'
+
+
+def test_scrape_kwargs_belong_to_their_batch(engine):
+    # The engine is shared by every request, so one batch's user must not leak into the next
+    list(engine.run([(0, 'http://a.test/1')], scrape_kwargs={'user': 'alice'}))
+    list(engine.run([(0, 'http://a.test/2')], scrape_kwargs={'user': 'bob'}))
+    list(engine.run([(0, 'http://a.test/3')]))
+    assert engine.calls == [('http://a.test/1', 'alice'), ('http://a.test/2', 'bob'), ('http://a.test/3', None)]
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=1.0, burst=2)
+    assert bucket.try_take() == 0.0
+    assert bucket.try_take() == 0.0
+    assert bucket.try_take() > 0
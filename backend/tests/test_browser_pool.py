@@ -0,0 +1,172 @@
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from browser_pool import BrowserPool, PoolExhausted
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+        self.contexts = []
+
+    def is_connected(self):
+        return self.connected
+
+    def new_context(self, **options):
+        self.contexts.append(FakeContext(self))
+        return self.contexts[-1]
+
+    def close(self):
+        self.closed = True
+
+
+def fake_playwright(monkeypatch, launch, start=None):
+    playwright = types.SimpleNamespace(firefox=types.SimpleNamespace(launch=launch), stop=lambda: None)
+    module = types.ModuleType('playwright.sync_api')
+    module.sync_playwright = lambda: types.SimpleNamespace(start=start or (lambda: playwright))
+    monkeypatch.setitem(sys.modules, 'playwright.sync_api', module)
+
+
+@pytest.fixture
+def browsers(monkeypatch):
+    """Stand in for Playwright: every launch returns a new FakeBrowser, recorded here"""
+    launched = []
+
+    def launch(**options):
+        launched.append(FakeBrowser())
+        return launched[-1]
+
+    fake_playwright(monkeypatch, launch)
+    return launched
+
+
+@pytest.fixture
+def make_pool(browsers):
+    pools = []
+
+    def make(**options):
+        pools.append(BrowserPool(**options).start())
+        return pools[-1]
+
+    yield make
+    for pool in pools:
+        pool.shutdown()
+
+
+def test_tasks_get_a_fresh_context_on_a_warm_browser(make_pool, browsers):
+    pool = make_pool(size=1)
+    first = pool.run(lambda context: context)
+    second = pool.run(lambda context: context)
+    assert first is not second and first.closed and second.closed
+    assert first.browser is second.browser and len(browsers) == 1
+    assert pool.stats()['tasksCompleted'] == 2
+
+
+def test_task_errors_reach_the_caller(make_pool):
+    def render(context):
+        raise ValueError('render failed')
+
+    pool = make_pool(size=1)
+    with pytest.raises(ValueError):
+        pool.run(render)
+    assert pool.stats()['tasksFailed'] == 1
+    assert pool.run(lambda context: 'ok') == 'ok'
+
+
+def test_browsers_are_recycled_after_max_pages(make_pool, browsers):
+    pool = make_pool(size=1, max_pages_per_browser=2)
+    for _ in range(3):
+        pool.run(lambda context: None)
+    assert len(browsers) == 2 and browsers[0].closed
+    assert pool.stats()['recycles'] == 1
+
+
+def test_disconnected_browsers_are_relaunched(make_pool, browsers):
+    pool = make_pool(size=1)
+    pool.run(lambda context: None)
+    browsers[0].connected = False
+    pool.run(lambda context: None)
+    assert len(browsers) == 2 and pool.stats()['unhealthyRestarts'] == 1
+
+
+def test_tasks_waiting_too_long_for_a_browser_raise_pool_exhausted(make_pool):
+    pool = make_pool(size=1, queue_size=1, queue_timeout=0.2)
+    release = threading.Event()
+    started = threading.Event()
+    blocker = threading.Thread(target=pool.run, args=(lambda context: started.set() or release.wait(5),))
+    blocker.start()
+    started.wait(5)
+    try:
+        # The only browser is busy: the next task waits in the queue and gives up
+        with pytest.raises(PoolExhausted):
+            pool.run(lambda context: None)
+        assert pool.stats()['queueTimeouts'] == 1
+    finally:
+        release.set()
+        blocker.join(5)
+
+
+def test_renders_fail_fast_when_playwright_cannot_start(monkeypatch):
+    def start():
+        raise RuntimeError('playwright driver missing')
+
+    fake_playwright(monkeypatch, launch=None, start=start)
+    pool = BrowserPool(size=2, queue_timeout=30).start()
+    try:
+        for thread in pool._threads:
+            thread.join(5)
+        started = time.monotonic()
+        with pytest.raises(PoolExhausted):
+            pool.run(lambda context: None)
+        assert time.monotonic() - started < 1
+        assert pool.stats()['threads'] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_queued_renders_fail_when_the_last_slot_dies(monkeypatch):
+    release = threading.Event()
+
+    def start():
+        # The slot thread dies only once a render is already waiting
+        release.wait(5)
+        raise RuntimeError('playwright driver crashed')
+
+    fake_playwright(monkeypatch, launch=None, start=start)
+    pool = BrowserPool(size=1, queue_timeout=30).start()
+    try:
+        threading.Timer(0.2, release.set).start()
+        started = time.monotonic()
+        with pytest.raises(PoolExhausted):
+            pool.run(lambda context: None)
+        assert time.monotonic() - started < 5
+    finally:
+        pool.shutdown()
+
+
+def test_failed_launches_fail_each_render_without_waiting(monkeypatch):
+    def launch(**options):
+        raise RuntimeError('browser binary missing')
+
+    fake_playwright(monkeypatch, launch)
+    pool = BrowserPool(size=1, queue_timeout=30).start()
+    try:
+        with pytest.raises(RuntimeError):
+            pool.run(lambda context: None)
+        assert pool.stats()['launchFailures'] >= 2
+    finally:
+        pool.shutdown()
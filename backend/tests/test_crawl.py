@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+from crawl import BloomFilter, Crawl, CrawlManager, Frontier, host_in_scope, make_settings
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    seen = BloomFilter(capacity=10_000, error_rate=0.01)
+    urls = [f'http://a.test/{i}' for i in range(10_000)]
+    for url in urls:
+        seen.add(url)
+    assert all(url in seen for url in urls)
+    assert not seen.add(urls[0])
+    false_positives = sum(f'http://b.test/{i}' in seen for i in range(10_000))
+    assert false_positives < 300
+
+
+def test_bloom_filter_round_trips_through_bytes():
+    seen = BloomFilter(capacity=1000)
+    seen.add('http://a.test/')
+    restored = BloomFilter.from_bytes(seen.to_bytes())
+    assert 'http://a.test/' in restored
+    assert (restored.size, restored.hashes, restored.count) == (seen.size, seen.hashes, seen.count)
+
+
+def test_frontier_takes_hosts_in_turn_and_waits_for_their_delay():
+    frontier = Frontier(default_delay=60)
+    for url in ('http://a.test/1', 'http://a.test/2', 'http://b.test/1'):
+        frontier.push(url, 0)
+    first, _ = frontier.pop()
+    second, _ = frontier.pop()
+    assert {first[0], second[0]} == {'http://a.test/1', 'http://b.test/1'}
+    # Both hosts are busy, then cooling down
+    assert frontier.pop() == (None, None)
+    frontier.done('a.test')
+    item, wait = frontier.pop()
+    assert item is None and 0 < wait <= 60
+
+
+def test_frontier_drops_pushes_beyond_max_size():
+    frontier = Frontier(max_size=1)
+    assert frontier.push('http://a.test/1', 0)
+    assert not frontier.push('http://a.test/2', 0)
+    assert frontier.dropped == 1 and len(frontier) == 1
+
+
+def test_host_in_scope():
+    seeds = {'www.example.com'}
+    assert host_in_scope('shop.example.com', 'domain', seeds)
+    assert not host_in_scope('shop.example.com', 'host', seeds)
+    assert not host_in_scope('example.org', 'domain', seeds)
+    assert host_in_scope('example.org', 'any', seeds)
+
+
+class NoRobots:
+    def allowed(self, url):
+        return True
+
+    def crawl_delay(self, url):
+        return None
+
+
+def test_crawl_visits_links_and_resumes_from_its_saved_state(tmp_path):
+    site = {
+        'http://a.test/': ['/one', '/two', 'http://other.test/'],
+        'http://a.test/one': ['/two'],
+        'http://a.test/two': [],
+    }
+
+    def scrape(url, found, **options):
+        found.extend(site[url])
+        return {'title': url}, 'MISS'
+
+    settings = make_settings(['http://a.test/'], delay=0, respect_robots=False)
+    crawl = Crawl('c1', str(tmp_path), settings, scrape, lambda e: (str(e), 500), NoRobots())
+    saves = []
+    write = crawl._write
+
+    def checked_write(path, data):
+        # State is written outside the crawl lock, so workers are never held up by disk I/O
+        saves.append(crawl._lock.acquire(blocking=False))
+        if saves[-1]:
+            crawl._lock.release()
+        write(path, data)
+
+    crawl._write = checked_write
+    crawl.seed()
+    crawl.start()
+    crawl._thread.join(10)
+    assert crawl.status == 'completed'
+    assert crawl.counters['succeeded'] == 3 and crawl.counters['outOfScope'] == 1
+    assert saves and all(saves)
+
+    restored = Crawl.load(str(tmp_path), scrape, lambda e: (str(e), 500), NoRobots())
+    assert restored.status == 'completed'
+    assert restored.counters == crawl.counters
+    assert 'http://a.test/two' in restored.seen
+
+
+def test_an_older_snapshot_never_overwrites_a_newer_save(tmp_path):
+    settings = make_settings(['http://a.test/'], delay=0)
+    crawl = Crawl('c2', str(tmp_path), settings, None, None, NoRobots())
+    with crawl._lock:
+        older = crawl._snapshot_locked()
+        crawl.status = 'cancelled'
+        newer = crawl._snapshot_locked()
+    crawl._save(newer)
+    crawl._save(older)
+    assert Crawl.load(str(tmp_path), None, None, NoRobots()).status == 'cancelled'
+
+
+def test_deleting_a_running_crawl_does_not_wait_for_its_pages(tmp_path):
+    release = threading.Event()
+
+    def scrape(url, found, **options):
+        release.wait(10)
+        return {'title': url}, 'MISS'
+
+    settings = make_settings(['http://a.test/'], delay=0, respect_robots=False)
+    manager = CrawlManager(str(tmp_path), scrape, lambda e: (str(e), 500), NoRobots())
+    crawl = manager.create(settings)
+    while not crawl._in_flight:
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    assert manager.delete(crawl.id)
+    assert time.monotonic() - started < 1
+    assert manager.get(crawl.id) is None and os.path.isdir(crawl.directory)
+
+    release.set()
+    crawl._thread.join(10)
+    assert crawl.status == 'cancelled'
+    assert not os.path.exists(crawl.directory)
@@ -0,0 +1,78 @@
+import os
+import stat
+import subprocess
+import sys
+import types
+
+import pytest
+
+import drivers
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    monkeypatch.setenv('CHROMEDRIVER_CACHE_FILE', str(tmp_path / 'chromedriver.json'))
+    monkeypatch.delenv('CHROMEDRIVER_PATH', raising=False)
+    monkeypatch.setattr(drivers.shutil, 'which', lambda name: None)
+    drivers.reset_chromedriver()
+    yield
+    drivers.reset_chromedriver()
+
+
+def executable(path):
+    path.write_text('#!/bin/sh\n')
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def fake_manager(monkeypatch, install):
+    """Stand in for webdriver_manager, which would download a driver"""
+    module = types.ModuleType('webdriver_manager.chrome')
+    module.ChromeDriverManager = type('ChromeDriverManager', (), {'install': lambda self: install()})
+    monkeypatch.setitem(sys.modules, 'webdriver_manager.chrome', module)
+
+
+def test_env_path_wins_and_is_remembered(tmp_path, monkeypatch):
+    path = executable(tmp_path / 'chromedriver')
+    monkeypatch.setenv('CHROMEDRIVER_PATH', path)
+    assert drivers.resolve_chromedriver() == path
+    monkeypatch.delenv('CHROMEDRIVER_PATH')
+    assert drivers.resolve_chromedriver() == path
+
+
+def test_downloaded_driver_is_cached_on_disk(tmp_path, monkeypatch):
+    path = executable(tmp_path / 'downloaded')
+    installs = []
+    fake_manager(monkeypatch, lambda: installs.append(1) or path)
+    assert drivers.resolve_chromedriver() == path
+    # A new process finds the cached path without asking webdriver-manager again
+    drivers._driver_path = None
+    assert drivers.resolve_chromedriver() == path
+    assert installs == [1]
+    drivers.reset_chromedriver()
+    assert not os.path.exists(os.environ['CHROMEDRIVER_CACHE_FILE'])
+
+
+def test_failed_download_is_not_retried_right_away(monkeypatch):
+    attempts = []
+
+    def install():
+        attempts.append(1)
+        raise OSError('offline')
+
+    fake_manager(monkeypatch, install)
+    with pytest.raises(OSError):
+        drivers.resolve_chromedriver()
+    with pytest.raises(RuntimeError):
+        drivers.resolve_chromedriver()
+    assert attempts == [1]
+
+
+def test_app_import_does_not_load_browser_engines():
+    # Checked in a fresh interpreter: other tests may have imported them already
+    code = ('import sys, app; '
+            'print(any(name.split(".")[0] in ("selenium", "playwright") for name in sys.modules))')
+    env = dict(os.environ, MONGO_URI='mongodb://127.0.0.1:9/', MONGO_TIMEOUT_MS='200')
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(drivers.__file__), env=env,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == 'False'
@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from export import DEFAULT_FIELDS, export_stream, parquet_available, parse_date, parse_fields
+
+DOC = {
+    '_id': ObjectId('65a000000000000000000001'),
+    'url': 'https://shop.test/p/1',
+    'title': 'Lamp',
+    'user': None,
+    'createdAt': datetime(2024, 1, 2, 3, 4, 5),
+    'result': {
+        'productInfo': {'name': 'Lamp', 'price': '$19.99'},
+        'links': [{'text': 'Cart', 'url': 'https://shop.test/cart'}, {'text': 'Home', 'url': 'https://shop.test/'}],
+        'features': ['LED', 'Dimmable'],
+        'wordCount': 42,
+    },
+}
+
+
+def test_parse_fields():
+    assert parse_fields(None) == list(DEFAULT_FIELDS)
+    assert parse_fields('url, title,url') == ['url', 'title']
+    with pytest.raises(ValueError):
+        parse_fields('url,password')
+
+
+def test_parse_date_converts_to_naive_utc():
+    assert parse_date('2024-01-02T05:00:00+02:00', 'since') == datetime(2024, 1, 2, 3, 0)
+    assert parse_date('2024-01-02T03:00:00Z', 'since') == datetime(2024, 1, 2, 3, 0)
+    assert parse_date('', 'since') is None
+    with pytest.raises(ValueError):
+        parse_date('yesterday', 'since')
+
+
+def test_ndjson_rows():
+    [line] = list(export_stream('ndjson', [DOC], ['id', 'createdAt', 'productInfo', 'wordCount']))
+    assert json.loads(line) == {'id': '65a000000000000000000001', 'createdAt': '2024-01-02T03:04:05',
+                                'productInfo': {'name': 'Lamp', 'price': '$19.99'}, 'wordCount': 42}
+
+
+def test_csv_spreads_objects_over_columns():
+    text = ''.join(export_stream('csv', [DOC, DOC], ['url', 'productInfo', 'links', 'features']))
+    header, *rows = list(csv.reader(io.StringIO(text)))
+    assert header == ['url', 'productInfo.name', 'productInfo.price', 'productInfo.description',
+                      'productInfo.category', 'links.text', 'links.url', 'features']
+    assert len(rows) == 2
+    assert rows[0] == ['https://shop.test/p/1', 'Lamp', '$19.99', '', '', 'Cart | Home',
+                       'https://shop.test/cart | https://shop.test/', 'LED | Dimmable']
+
+
+@pytest.mark.skipif(not parquet_available(), reason='pyarrow is not installed')
+def test_parquet_round_trip():
+    import pyarrow.parquet as pq
+    data = b''.join(export_stream('parquet', [DOC] * 3, ['id', 'url', 'productInfo', 'features']))
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 3
+    assert table.column('productInfo').to_pylist()[0]['price'] == '$19.99'
@@ -0,0 +1,64 @@
+import pytest
+
+from extraction import MAX_LINKS, TEXT_LIMIT, CompiledSelector, extract_page, make_soup
+
+PAGE = '''<html><head><title>Desk Lamp | Shop</title>
+<meta name="description" content="A bright lamp">
+<meta property="og:image" content="/og.png">
+<script type="application/ld+json">{"@type": "Product", "name": "Desk Lamp"}</script>
+<script>var ignored = "script text";</script>
+</head><body>
+<h1 class="product-title">Desk Lamp</h1>
+<span class="money">$12</span><span class="price">$19.99</span>
+<div class="product-description">Lights up a desk.</div>
+<ul class="features"><li>LED</li><li>Dimmable</li></ul>
+<div class="review">Great lamp</div><div class="review">Too bright</div>
+<a href="/cart">Cart</a><a href="https://other.test/x">Other</a>
+<img src="/lamp.jpg" alt="Lamp">
+</body></html>'''
+
+
+@pytest.fixture(scope='module')
+def fields():
+    return extract_page(make_soup(PAGE), 'https://shop.test/p/1').fields
+
+
+def test_product_fields_follow_selector_priority(fields):
+    info = fields['productInfo']
+    assert info['name'] == 'Desk Lamp'
+    # .price comes before .money in the selector list, whatever the document order
+    assert info['price'] == '$19.99'
+    assert info['description'] == 'Lights up a desk.'
+
+
+def test_page_level_fields(fields):
+    assert fields['title'] == 'Desk Lamp | Shop'
+    assert fields['metaTags']['description'] == 'A bright lamp'
+    assert fields['schemaData'] == [{'@type': 'Product', 'name': 'Desk Lamp'}]
+    assert fields['features'] == ['LED', 'Dimmable']
+    assert fields['reviews'] == ['Great lamp', 'Too bright']
+    assert fields['headers'] == [{'tag': 'h1', 'text': 'Desk Lamp'}]
+    assert [link['url'] for link in fields['links']] == ['https://shop.test/cart', 'https://other.test/x']
+    assert 'script text' not in fields['textContent']
+
+
+def test_output_limits():
+    links = ''.join(f'<a href="/{i}">{i}</a>' for i in range(MAX_LINKS + 10))
+    extraction = extract_page(make_soup(f'<html><body>{"word " * 1000}{links}</body></html>'), 'https://a.test/')
+    assert len(extraction.fields['links']) == MAX_LINKS
+    assert len(extraction.hrefs) == MAX_LINKS + 10
+    assert extraction.fields['textContent'].endswith('...')
+    assert len(extraction.fields['textContent']) == TEXT_LIMIT + 3
+
+
+@pytest.mark.parametrize('selector, markup, expected', [
+    ('.price', '<span class="a price">x</span>', True),
+    ('h1.title', '<h2 class="title">x</h2>', False),
+    ('[data-price]', '<b data-price="1">x</b>', True),
+    ('meta[name="description"]', '<meta name="keywords">', False),
+    ('div > .price', '<div><span class="price">x</span></div>', True),
+])
+def test_compiled_selector_matches_like_css(selector, markup, expected):
+    # The innermost element of the snippet
+    element = make_soup(markup).find_all(True)[-1]
+    assert CompiledSelector(selector).matches(element) is expected
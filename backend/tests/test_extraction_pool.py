@@ -0,0 +1,41 @@
+import pytest
+
+from extraction_pool import ExtractionError, ExtractionPool, ExtractionTimeout
+
+PAGE = '<html><head><title>Lamp</title></head><body><h1 class="product-title">Desk Lamp</h1></body></html>'
+
+
+@pytest.fixture
+def pool():
+    pool = ExtractionPool(workers=1, task_timeout=30, max_tasks=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_pages_are_extracted_on_a_worker(pool):
+    extraction, parse_seconds, extract_seconds = pool.extract(PAGE, 'https://shop.test/p/1')
+    assert extraction.fields['productInfo']['name'] == 'Desk Lamp'
+    assert parse_seconds >= 0 and extract_seconds >= 0
+    assert pool.stats()['alive'] == 1 and pool.stats()['busy'] == 0
+
+
+def test_workers_are_replaced_after_max_tasks(pool):
+    for _ in range(3):
+        pool.extract(PAGE, 'https://shop.test/p/1')
+    stats = pool.stats()
+    assert stats['recycled'] == 1 and stats['launches'] == 2 and stats['tasks'] == 3
+
+
+def test_slow_tasks_kill_the_worker(pool):
+    pool.task_timeout = 0.01
+    with pytest.raises(ExtractionTimeout):
+        pool.extract('<html><body>' + '<div><p>x</p></div>' * 200_000 + '</body></html>', 'https://shop.test/')
+    assert pool.stats()['alive'] == 0
+    pool.task_timeout = 30
+    assert pool.extract(PAGE, 'https://shop.test/p/1')[0].fields['title'] == 'Lamp'
+
+
+def test_shut_down_pool_refuses_work(pool):
+    pool.shutdown()
+    with pytest.raises(ExtractionError):
+        pool.extract(PAGE, 'https://shop.test/')
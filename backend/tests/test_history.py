@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from export import build_query
+from history import decode_cursor, encode_cursor, query_history
+
+
+class FakeCursor(list):
+    def sort(self, keys):
+        return self
+
+    def limit(self, count):
+        return FakeCursor(self[:count])
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return FakeCursor(doc for doc in self.docs if doc.get('user') == query['user'])
+
+
+def test_anonymous_callers_only_see_anonymous_history():
+    collection = FakeCollection([{'_id': ObjectId(), 'user': 'alice', 'createdAt': datetime(2024, 1, 1)},
+                                 {'_id': ObjectId(), 'user': None, 'createdAt': datetime(2024, 1, 2)}])
+    items, _ = query_history(collection, user=None)
+    assert collection.queries[-1]['user'] is None
+    assert [item['user'] for item in items] == [None]
+    items, _ = query_history(collection, user='alice')
+    assert [item['user'] for item in items] == ['alice']
+
+
+def test_next_cursor_only_when_more_pages():
+    docs = [{'_id': ObjectId(), 'user': None, 'createdAt': datetime(2024, 1, day)} for day in range(3, 0, -1)]
+    items, next_cursor = query_history(FakeCollection(docs), limit=2)
+    assert len(items) == 2
+    assert decode_cursor(next_cursor) == (docs[1]['createdAt'], docs[1]['_id'])
+    assert query_history(FakeCollection(docs), limit=3)[1] is None
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    doc = {'_id': ObjectId(), 'createdAt': datetime(2024, 5, 6, 7, 8, 9)}
+    assert decode_cursor(encode_cursor(doc)) == (doc['createdAt'], doc['_id'])
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+
+
+def test_export_query_always_filters_by_user():
+    assert build_query() == {'user': None}
+    assert build_query(url='http://a.test/', user='alice') == {'user': 'alice', 'url': 'http://a.test/'}
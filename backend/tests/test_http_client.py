@@ -0,0 +1,132 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_client import ContentTypeRejected, FetchClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    routes = {}
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        self.server.cookies[self.path] = self.headers.get('Cookie')
+        status, content_type, body, *extra = self.routes[self.path](self.server.hits[self.path])
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (extra[0] if extra else {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.connections = set()
+    httpd.hits = {}
+    httpd.cookies = {}
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    httpd.base = f'http://127.0.0.1:{httpd.server_address[1]}'
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client():
+    client = FetchClient(retries=2, backoff_factor=0, backoff_jitter=0, timeout=5)
+    yield client
+    client.close()
+
+
+Handler.routes.update({
+    '/page': lambda hit: (200, 'text/html', b'<html>ok</html>'),
+    '/flaky': lambda hit: (503 if hit < 3 else 200, 'text/html', b'<html>finally</html>'),
+    '/down': lambda hit: (503, 'text/html', b'busy'),
+})
+
+
+def test_repeat_fetches_reuse_one_connection(server, client):
+    for _ in range(5):
+        assert client.get(server.base + '/page').status_code == 200
+    assert len(server.connections) == 1
+
+
+def test_transient_statuses_are_retried(server, client):
+    response = client.get(server.base + '/flaky')
+    assert response.status_code == 200
+    assert server.hits['/flaky'] == 3
+    assert client.stats()['retries'] == 2
+
+
+def test_retries_are_bounded(server, client):
+    assert client.get(server.base + '/down').status_code == 503
+    assert server.hits['/down'] == 3
+
+
+Handler.routes.update({
+    '/big': lambda hit: (200, 'text/html', b'<html>' + b'x' * 100_000 + b'</html>'),
+    '/pdf': lambda hit: (200, 'application/pdf', b'%PDF-1.4'),
+    '/latin1': lambda hit: (200, 'text/html; charset=iso-8859-1', 'café'.encode('latin-1')),
+    '/meta': lambda hit: (200, 'text/html', b'<meta charset="windows-1252"><p>\x93quoted\x94</p>'),
+})
+
+
+def test_downloads_stop_at_max_bytes(server, client):
+    page = client.fetch_page(server.base + '/big', max_bytes=1000)
+    assert page.truncated and len(page.body) == 1000
+
+
+def test_inspect_can_stop_a_download(server, client):
+    page = client.fetch_page(server.base + '/page', inspect=lambda body: b'<html>' in body)
+    assert page.stopped and not page.truncated
+
+
+def test_non_pages_are_rejected_before_the_body_is_read(server, client):
+    with pytest.raises(ContentTypeRejected) as error:
+        client.fetch_page(server.base + '/pdf')
+    assert error.value.content_type == 'application/pdf'
+
+
+@pytest.mark.parametrize('path, text', [('/latin1', 'café'), ('/meta', '“quoted”')])
+def test_body_is_decoded_with_the_declared_charset(server, client, path, text):
+    assert text in client.fetch_page(server.base + path).text
+
+
+Handler.routes.update({
+    '/login': lambda hit: (302, 'text/html', b'', {'Set-Cookie': 'sid=1; Path=/', 'Location': '/home'}),
+    '/home': lambda hit: (200, 'text/html', b'<html>home</html>'),
+    '/slow': lambda hit: (time.sleep(0.5), (200, 'text/html', b'late'))[1],
+})
+
+
+def test_cookies_follow_redirects_within_one_call_only(server, client):
+    assert client.get(server.base + '/login').status_code == 200
+    assert server.cookies['/home'] == 'sid=1'
+
+    client.get(server.base + '/home')
+    assert server.cookies['/home'] is None
+
+
+def test_read_timeouts_are_not_retried(server, client):
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.get(server.base + '/slow', timeout=0.1)
+    assert server.hits['/slow'] == 1
+    assert client.stats()['retries'] == 0
+
+
+def test_connect_failures_are_retried(client):
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get('http://127.0.0.1:9/')
+    assert client.stats()['retries'] == 2
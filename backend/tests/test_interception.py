@@ -0,0 +1,90 @@
+import pytest
+
+from interception import get_profile, host_is_blocked, install_interception, selenium_blocked_patterns
+
+DOMAINS = frozenset({'doubleclick.net', 'tracker.test'})
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type):
+        self.url = url
+        self.resource_type = resource_type
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type):
+        self.request = FakeRequest(url, resource_type)
+        self.outcome = None
+
+    def abort(self):
+        self.outcome = 'aborted'
+
+    def continue_(self):
+        self.outcome = 'continued'
+
+
+class FakeContext:
+    def __init__(self):
+        self.handlers = {}
+        self.routes = []
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    def route(self, pattern, handler):
+        self.routes.append(handler)
+
+
+def route_through(profile_name, requests, page_url='https://shop.test/p/1'):
+    context = FakeContext()
+    stats = install_interception(context, page_url, get_profile(profile_name), DOMAINS)
+    outcomes = []
+    for url, resource_type in requests:
+        route = FakeRoute(url, resource_type)
+        for handler in context.routes:
+            handler(route)
+        outcomes.append(route.outcome)
+    return outcomes, stats
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        get_profile('nope')
+
+
+def test_host_is_blocked_matches_parent_domains_only():
+    assert host_is_blocked('ad.g.doubleclick.net', DOMAINS)
+    assert host_is_blocked('DoubleClick.net', DOMAINS)
+    assert not host_is_blocked('notdoubleclick.net', DOMAINS)
+    assert not host_is_blocked('net', DOMAINS)
+
+
+def test_dom_only_blocks_resource_types_and_trackers():
+    outcomes, stats = route_through('dom-only', [
+        ('https://shop.test/app.js', 'script'),
+        ('https://shop.test/lamp.jpg', 'image'),
+        ('https://cdn.tracker.test/t.js', 'script'),
+        ('https://shop.test/site.css', 'stylesheet'),
+    ])
+    assert outcomes == ['continued', 'aborted', 'aborted', 'aborted']
+    assert stats.to_dict()['blockedByType'] == {'image': 1, 'stylesheet': 1}
+    assert stats.blocked_by_domain == 1 and stats.requests_allowed == 1
+
+
+def test_the_page_host_itself_is_never_blocked_by_domain():
+    outcomes, _ = route_through('dom+css', [('https://tracker.test/page-data.json', 'xhr')],
+                                page_url='https://tracker.test/')
+    assert outcomes == ['continued']
+
+
+def test_full_profile_does_not_route():
+    context = FakeContext()
+    install_interception(context, 'https://shop.test/', get_profile('full'), DOMAINS)
+    assert context.routes == [] and 'response' in context.handlers
+
+
+def test_selenium_patterns():
+    patterns = selenium_blocked_patterns(get_profile('dom+css'), DOMAINS)
+    assert '*.png' in patterns and '*.css' not in patterns
+    assert '*://*.tracker.test/*' in patterns and '*://tracker.test/*' in patterns
+    assert selenium_blocked_patterns(get_profile('full'), DOMAINS) == []
@@ -0,0 +1,84 @@
+import os
+import time
+
+from jobs import JobManager, MemoryJobStore, new_job
+
+
+def scrape(url, progress=None, **options):
+    if 'crash' in url:
+        # Takes the worker process down the way a segfaulting parser or the OOM killer would
+        os._exit(1)
+    progress('fetching')
+    return {'url': url, 'options': options}, 'miss'
+
+
+def describe_error(error):
+    return str(error), 500
+
+
+def wait_for(store, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_fail_interrupted_only_touches_running_jobs():
+    store = MemoryJobStore()
+    running, queued = new_job('http://a.test/'), new_job('http://b.test/')
+    store.insert(running)
+    store.insert(queued)
+    store.claim_next()  # both have priority 0; the older one (running) is claimed
+    assert store.fail_interrupted('Interrupted') == 1
+    job = store.get(running['id'])
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Interrupted'
+    assert job['events'][-1]['stage'] == 'failed'
+    assert store.get(queued['id'])['status'] == 'queued'
+
+
+def test_start_fails_jobs_left_running():
+    store = MemoryJobStore()
+    stale = new_job('http://a.test/')
+    store.insert(stale)
+    store.claim_next()
+    manager = JobManager(store, scrape, describe_error, workers=1)
+    manager.start()
+    try:
+        assert store.get(stale['id'])['status'] == 'failed'
+    finally:
+        manager.shutdown()
+
+
+def test_jobs_run_on_forkserver_workers():
+    store = MemoryJobStore()
+    manager = JobManager(store, scrape, describe_error, workers=1)
+    manager.start()
+    try:
+        job = manager.submit('http://a.test/', {'max_age': 60})
+        done = wait_for(store, job['id'])
+        assert done['status'] == 'succeeded'
+        assert done['result'] == {'url': 'http://a.test/', 'options': {'max_age': 60}}
+        assert manager._executor._mp_context.get_start_method() == 'forkserver'
+    finally:
+        manager.shutdown()
+
+
+def test_a_dead_worker_fails_its_job_and_the_queue_keeps_moving(caplog):
+    store = MemoryJobStore()
+    manager = JobManager(store, scrape, describe_error, workers=1)
+    manager.start()
+    try:
+        crashed = wait_for(store, manager.submit('http://crash.test/')['id'])
+        assert crashed['status'] == 'failed'
+        assert 'crashed' in crashed['error']
+        # The next submit finds the pool broken, requeues the job and runs it on a new pool
+        later = [manager.submit(f'http://a.test/{i}') for i in range(2)]
+        assert [wait_for(store, job['id'])['status'] for job in later] == ['succeeded', 'succeeded']
+        assert manager.stats()['running'] == 0
+        assert 'starting a new one' in caplog.text
+    finally:
+        manager.shutdown()
@@ -0,0 +1,60 @@
+import re
+
+import pytest
+
+from metrics import Registry, StageTimings
+
+
+def test_counter_and_histogram_render_in_prometheus_format():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests', ('outcome',))
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+    requests.inc(outcome='ok')
+    requests.inc(2, outcome='ok')
+    requests.inc(outcome='say "hi"\n')
+    for value in (0.05, 0.5, 5):
+        latency.observe(value)
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{outcome="ok"} 3' in text
+    assert 'requests_total{outcome="say \\"hi\\"\\n"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_count 3' in text
+    assert 'latency_seconds_sum 5.55' in text
+
+
+def test_failing_collectors_are_skipped():
+    registry = Registry()
+
+    @registry.collector
+    def broken():
+        raise RuntimeError('down')
+
+    @registry.collector
+    def pool():
+        return [('pool_size', 'gauge', 'Pool size', [({'pool': 'browser'}, 4)])]
+
+    assert registry.render() == '# HELP pool_size Pool size\n# TYPE pool_size gauge\npool_size{pool="browser"} 4\n'
+
+
+def test_stage_timings_server_timing_header():
+    timings = StageTimings()
+    timings.add('download', 0.0123, 'static')
+    with timings.stage('cache'):
+        pass
+    with pytest.raises(ValueError):
+        with timings.stage('extract', 'static'):
+            raise ValueError('boom')
+    header = timings.server_timing()
+    assert header.startswith('download;desc="static";dur=12.3, cache;dur=')
+    assert re.search(r'extract;desc="static";dur=[\d.]+, total;dur=[\d.]+$', header)
+    assert [stage for stage, _, _ in timings.entries] == ['download', 'cache', 'extract']
+
+
+def test_metrics_endpoint(app_module):
+    response = app_module.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE scrape_stage_duration_seconds histogram' in response.get_data(as_text=True)
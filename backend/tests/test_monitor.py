@@ -0,0 +1,133 @@
+import jwt
+import pytest
+
+from monitor import (UNCHANGED, ChangeDetector, WatchManager, diff_fields, hamming, make_settings, normalized_words,
+                     simhash)
+
+PAGE = ('<html><head><title>Lamp</title><script>var t = 1;</script>'
+        '<script type="application/ld+json">{"price": "19.99"}</script></head>'
+        '<body><h1>Desk lamp</h1><p>{}</p></body></html>')
+TEXT = ' '.join(f'word{i}' for i in range(300))
+
+
+def page(text=TEXT):
+    return PAGE.replace('{}', text)
+
+
+def test_normalized_words_skip_scripts_but_keep_json_ld():
+    words = normalized_words(page('Hello &amp; <b>World</b>'))
+    assert 'hello' in words and 'world' in words and '19' in words
+    assert 'var' not in words
+
+
+def test_simhash_is_stable_and_close_for_small_edits():
+    words = normalized_words(page())
+    assert simhash(words) == simhash(list(words))
+    edited = normalized_words(page(TEXT.replace('word150', 'changed')))
+    unrelated = normalized_words(page(' '.join(f'other{i}' for i in range(300))))
+    assert hamming(simhash(words), simhash(edited)) < hamming(simhash(words), simhash(unrelated))
+    assert simhash([]) == 0
+
+
+def test_hamming():
+    assert hamming(0b1011, 0b0001) == 2
+    assert hamming(5, 5) == 0
+
+
+def test_diff_fields_reports_only_changed_fields():
+    old = {'title': 'Lamp', 'productInfo.price': '19.99', 'features': ['a']}
+    new = {'title': 'Lamp', 'productInfo.price': '17.99', 'features': ['a'], 'reviews': ['great']}
+    assert diff_fields(old, new) == [
+        {'field': 'productInfo.price', 'old': '19.99', 'new': '17.99'},
+        {'field': 'reviews', 'old': None, 'new': ['great']},
+    ]
+    assert diff_fields(old, dict(old)) == []
+
+
+def result(price='19.99'):
+    return {'title': 'Lamp', 'productInfo': {'price': price}, 'features': [], 'reviews': []}
+
+
+def detector_after(baseline, html, extracted, max_distance=3):
+    detector = ChangeDetector(baseline, max_distance)
+    if detector.body_unchanged(html):
+        return detector, 'body'
+    return detector, 'result' if detector.result_unchanged(extracted) else None
+
+
+def test_change_detector_without_baseline_reports_a_change():
+    detector, unchanged = detector_after(None, page(), result())
+    assert unchanged is None
+    assert detector.fingerprint()['fields']['productInfo.price'] == '19.99'
+
+
+def test_change_detector_skips_identical_text_before_parsing():
+    baseline = detector_after(None, page(), result())[0].fingerprint()
+    assert detector_after(baseline, page(), result())[1] == 'body'
+
+
+def test_change_detector_ignores_small_text_noise_when_fields_match():
+    baseline = detector_after(None, page(), result())[0].fingerprint()
+    detector, unchanged = detector_after(baseline, page(TEXT + ' updated'), result())
+    assert unchanged == 'result'
+    assert detector.distance <= 3
+
+
+def test_change_detector_reports_field_changes():
+    baseline = detector_after(None, page(), result())[0].fingerprint()
+    assert detector_after(baseline, page(TEXT + ' updated'), result('17.99'))[1] is None
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'interval': 10},
+    {'interval': True},
+    {'jitter': 0.9},
+    {'webhook': 'ftp://example.com/hook'},
+])
+def test_make_settings_rejects_bad_values(kwargs):
+    with pytest.raises(ValueError):
+        make_settings('http://a.test/', **kwargs)
+
+
+def test_watch_check_records_baseline_then_changes(tmp_path):
+    pages = iter([(page(), result()), (page(), result()), (page(TEXT + ' new'), result('17.99'))])
+
+    def scrape(url, detector, **options):
+        html, extracted = next(pages)
+        if detector.body_unchanged(html) or detector.result_unchanged(extracted):
+            return None, UNCHANGED
+        return dict(extracted, id='h1'), 'MISS'
+
+    manager = WatchManager(str(tmp_path), scrape, lambda e: (str(e), 500), scheduler=False)
+    try:
+        watch = manager.create(make_settings('http://a.test/'))
+        manager._watches[watch['id']] = manager._read(watch['id'])
+        outcomes = []
+        for _ in range(3):
+            manager._check(watch['id'])
+            outcomes.append(manager._read(watch['id'])['lastOutcome'])
+        assert outcomes == ['baseline', 'unchanged', 'changed']
+        [event] = manager.changes(watch['id'])
+        assert event['changes'] == [{'field': 'productInfo.price', 'old': '19.99', 'new': '17.99'}]
+        assert event['historyId'] == 'h1'
+    finally:
+        manager.shutdown()
+
+
+def test_watches_are_only_visible_to_their_owner(app_module, monkeypatch, tmp_path):
+    manager = WatchManager(str(tmp_path), None, None, scheduler=False)
+    monkeypatch.setattr(app_module, 'watch_manager', lambda: manager)
+    try:
+        alice = {'Authorization': 'Bearer ' + jwt.encode({'user_id': 'alice'}, app_module.SECRET_KEY, algorithm='HS256')}
+        client = app_module.app.test_client()
+        created = client.post('/api/watches', headers=alice,
+                              json={'url': 'http://a.test/', 'webhook': 'https://hooks.test/secret'}).get_json()
+
+        assert client.get('/api/watches').get_json()['watches'] == []
+        assert [w['id'] for w in client.get('/api/watches', headers=alice).get_json()['watches']] == [created['id']]
+        for method, path in [('get', ''), ('get', '/changes'), ('post', '/check'), ('delete', '')]:
+            assert getattr(client, method)(f"/api/watches/{created['id']}{path}").status_code == 404
+        assert client.get(f"/api/watches/{created['id']}", headers=alice).status_code == 200
+        assert client.delete(f"/api/watches/{created['id']}", headers=alice).status_code == 200
+    finally:
+        manager.shutdown()
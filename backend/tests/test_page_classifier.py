@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from page_classifier import PageClassifier, classify_page, STATIC, RENDER, BLOCKED
+
+LINKS = b''.join(b'<a href="/item/%d">Item %d</a><img src="/img/%d.png">' % (i, i, i) for i in range(10))
+
+
+def page(body):
+    return b'<!doctype html><html><head><title>t</title></head><body>' + body + b'</body></html>'
+
+
+def feed(body, chunk=4096):
+    """Classify body as fetch_page would, streaming it in chunks"""
+    classifier = PageClassifier()
+    buffer = bytearray()
+    for start in range(0, len(body), chunk):
+        buffer += body[start:start + chunk]
+        if classifier.inspect(buffer):
+            break
+    return classifier.classify(bytes(buffer))
+
+
+def test_server_rendered_page_is_static():
+    result = classify_page(page(LINKS))
+    assert result.verdict == STATIC
+    assert (result.anchors, result.images) == (10, 10)
+    assert not result.blocked
+
+
+def test_low_content_page_needs_rendering():
+    assert classify_page(page(b'<p>Loading...</p>')).verdict == RENDER
+
+
+def test_low_content_page_with_blocking_keywords_is_blocked():
+    result = classify_page(page(b'<h1>Access Denied</h1><p>Please complete the CAPTCHA</p>'))
+    assert result.verdict == BLOCKED
+    assert result.keywords == ['access denied', 'captcha']
+
+
+def test_spa_shell_stops_the_download_early():
+    shell = page(b'<div id="__next"></div><script id="__NEXT_DATA__">{"props": {}}</script>' + b' ' * 200000)
+    result = feed(shell)
+    assert result.verdict == RENDER
+    assert result.spa_markers == ['empty-mount', 'hydration-state']
+    assert not result.complete
+    assert result.scanned < len(shell)
+
+
+def test_mount_with_content_is_not_an_empty_mount():
+    result = classify_page(page(b'<div id="root"><p>hi</p></div><script>window.__NUXT__={}</script>' + LINKS))
+    assert result.verdict == STATIC
+    assert result.spa_markers == ['hydration-state']
+
+
+@pytest.mark.parametrize('markup', [
+    b'<script>document.write("<a href=x>")</script>',
+    b'<style>a[href] { color: red }</style>',
+    b'<!-- <a href="/hidden"> <img src=x> -->',
+])
+def test_markup_inside_scripts_styles_and_comments_is_not_counted(markup):
+    assert classify_page(page(markup + LINKS)).anchors == 10
+
+
+@pytest.mark.parametrize('chunk', [1, 7, 100, 1024, 5000])
+def test_chunked_scan_matches_single_pass(chunk):
+    body = page(LINKS[:200] + b'<script>var s = "</div>";</script><!-- x -->' + LINKS[200:]
+                + b'<style>.a{}</style><div id="app"></div>')
+    assert feed(body, chunk).to_dict() == classify_page(body).to_dict()
+
+
+@pytest.mark.parametrize('block', [
+    b'<script>var data = "' + b'x = 1; ' * 600000 + b'";</script>',
+    b'<!-- ' + b'<a href=1>' * 400000 + b' -->',
+])
+def test_large_open_block_is_scanned_once(block):
+    # A block spanning hundreds of chunks used to be rescanned from its start on every one
+    body = page(LINKS[:300] + block + LINKS[300:] + b'<script>window.__NEXT_DATA__ = {}</script>')
+    started = time.perf_counter()
+    result = feed(body, 65536)
+    assert time.perf_counter() - started < 2
+    assert result.to_dict() == classify_page(body).to_dict()
@@ -0,0 +1,70 @@
+import readiness
+from readiness import ReadinessSettings, wait_for_page_ready, wait_for_driver_ready
+
+
+class FakePage:
+    """Playwright page whose height grows by the given amounts on successive scrolls"""
+
+    def __init__(self, growth=()):
+        self.height = 1000
+        self.growth = list(growth)
+        self.dom_wait = None
+
+    def wait_for_load_state(self, state, timeout):
+        pass
+
+    def evaluate(self, script, args=None):
+        if script == readiness._DOM_QUIET_JS:
+            self.dom_wait = args[1]
+            return 'quiet'
+        if script == readiness._HEIGHT_JS:
+            return self.height
+        assert script == readiness._SCROLL_JS
+        self.height += self.growth.pop(0) if self.growth else 0
+        return self.height
+
+    def locator(self, selector):
+        raise RuntimeError('no cookie banner')
+
+
+class FakeDriver(FakePage):
+    def set_script_timeout(self, seconds):
+        pass
+
+    def execute_script(self, script):
+        if script == 'return document.readyState':
+            return 'complete'
+        return self.height
+
+    def execute_async_script(self, script, *args):
+        if script == readiness._SELENIUM_DOM_QUIET_JS:
+            self.dom_wait = args[1]
+            return 'quiet'
+        self.height += self.growth.pop(0) if self.growth else 0
+        return self.height
+
+
+SETTINGS = ReadinessSettings(budget_ms=8000, quiet_ms=300, network_idle_ms=100, scroll_wait_ms=100, max_scrolls=8)
+
+
+def test_page_without_lazy_content_scrolls_once():
+    assert wait_for_page_ready(FakePage(), SETTINGS)['scrolls'] == 1
+    assert wait_for_driver_ready(FakeDriver(), SETTINGS)['scrolls'] == 1
+
+
+def test_scrolling_stops_once_the_page_stops_growing():
+    assert wait_for_page_ready(FakePage([500, 500]), SETTINGS)['scrolls'] == 3
+    assert wait_for_driver_ready(FakeDriver([500, 500]), SETTINGS)['scrolls'] == 3
+
+
+def test_scrolling_is_capped():
+    assert wait_for_page_ready(FakePage([100] * 20), SETTINGS)['scrolls'] == SETTINGS.max_scrolls
+
+
+def test_dom_quiet_wait_gets_a_share_of_the_budget():
+    page = FakePage()
+    wait_for_page_ready(page, SETTINGS)
+    assert page.dom_wait <= SETTINGS.budget_ms * SETTINGS.dom_share
+    driver = FakeDriver()
+    wait_for_driver_ready(driver, SETTINGS)
+    assert driver.dom_wait <= SETTINGS.budget_ms * SETTINGS.dom_share
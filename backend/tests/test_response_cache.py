@@ -0,0 +1,113 @@
+import pytest
+
+import response_cache
+from response_cache import HIT, ResponseCache, freshness_from_headers, normalize_url
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_normalize_url():
+    assert normalize_url('HTTP://Example.COM:80?b=2&a=1#frag') == 'http://example.com/?a=1&b=2'
+    assert normalize_url('https://example.com:8443/x') == 'https://example.com:8443/x'
+
+
+@pytest.mark.parametrize('headers, ttl', [
+    (None, 300),
+    ({'Cache-Control': 'no-store'}, None),
+    ({'Cache-Control': 'no-cache'}, 0),
+    ({'Cache-Control': 'public, max-age=60'}, 60),
+    ({'Cache-Control': 'max-age=60, s-maxage=30'}, 30),
+    ({'Expires': 'not a date'}, 0),
+])
+def test_freshness_from_headers(headers, ttl):
+    assert freshness_from_headers(headers, 300) == ttl
+
+
+def test_entries_go_stale_after_their_ttl(clock):
+    cache = ResponseCache(default_ttl=60)
+    cache.put('http://a.test/', {'url': 'http://a.test/'})
+    assert cache.get('http://a.test/').is_fresh()
+    assert not cache.get('http://a.test/').is_fresh(max_age=0)
+    clock[0] += 61
+    entry = cache.get('http://a.test/')
+    assert entry is not None and not entry.is_fresh()
+
+
+def test_no_store_responses_are_not_cached():
+    cache = ResponseCache()
+    assert cache.put('http://a.test/', {}, {'Cache-Control': 'no-store'}) is None
+    assert cache.get('http://a.test/') is None
+
+
+def test_refresh_restarts_freshness_and_keeps_validators(clock):
+    cache = ResponseCache(default_ttl=60)
+    entry = cache.put('http://a.test/', {'title': 'A'}, {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+    clock[0] += 120
+    assert not cache.get('http://a.test/').is_fresh()
+    assert entry.conditional_headers() == {'If-None-Match': '"v1"',
+                                           'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'}
+    refreshed = cache.refresh(entry, {'Cache-Control': 'max-age=30'})
+    assert refreshed.etag == '"v1"' and refreshed.ttl == 30
+    assert cache.get('http://a.test/').is_fresh()
+
+
+def test_evicted_entries_survive_on_disk(tmp_path):
+    cache = ResponseCache(memory_bytes=1, disk_dir=str(tmp_path))
+    cache.put('http://a.test/', {'title': 'A'})
+    assert ResponseCache(disk_dir=str(tmp_path)).get('http://a.test/').result == {'title': 'A'}
+
+
+def test_cache_hits_get_a_fresh_id_and_history_entry(app_module, monkeypatch):
+    added = []
+
+    class Writer:
+        def add(self, doc):
+            added.append(doc)
+
+    monkeypatch.setattr(app_module, 'get_history_writer', lambda collection: Writer())
+    cache = ResponseCache()
+    monkeypatch.setattr(app_module, 'get_response_cache', lambda: cache)
+    cache.put('http://a.test/', {'url': 'http://a.test/', 'title': 'A', 'id': 'first'})
+
+    first, status = app_module.scrape_page('http://a.test/', user='alice')
+    second, _ = app_module.scrape_page('http://a.test/', user='bob')
+    assert status == HIT
+    assert len({first['id'], second['id'], 'first'}) == 3
+    assert [(doc['user'], str(doc['_id'])) for doc in added] == [('alice', first['id']), ('bob', second['id'])]
+    assert cache.get('http://a.test/').result['id'] == 'first'
+
+
+def test_revalidated_watch_checks_write_no_history(app_module, monkeypatch, clock):
+    from http_client import FetchedPage
+    from monitor import ChangeDetector
+    from response_cache import REVALIDATED
+
+    added = []
+    monkeypatch.setattr(app_module, 'get_history_writer',
+                        lambda collection: type('Writer', (), {'add': lambda self, doc: added.append(doc)})())
+    cache = ResponseCache(default_ttl=60)
+    monkeypatch.setattr(app_module, 'get_response_cache', lambda: cache)
+    fetches = []
+
+    class Client:
+        def fetch_page(self, url, headers=None, **options):
+            fetches.append(headers)
+            return FetchedPage(304, {}, url, b'')
+
+    monkeypatch.setattr(app_module, 'get_fetch_client', lambda: Client())
+    cache.put('http://watched.test/', {'url': 'http://watched.test/', 'title': 'A', 'id': 'first'}, {'ETag': '"v1"'})
+    clock[0] += 120
+
+    result, status = app_module.scrape_page('http://watched.test/', max_age=0, change_detector=ChangeDetector())
+    assert status == REVALIDATED
+    assert fetches[0]['If-None-Match'] == '"v1"'
+    assert result['title'] == 'A'
+    assert added == []
+    # An ordinary request for the same page is still recorded
+    app_module.scrape_page('http://watched.test/')
+    assert len(added) == 1
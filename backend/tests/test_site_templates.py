@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from site_templates import MAX_URL_PATTERN, SiteTemplate
+
+
+def template(url_pattern, domains=('shop.example.com',)):
+    return SiteTemplate({'domains': list(domains), 'urlPattern': url_pattern, 'fields': {'price': '.price'}})
+
+
+def test_url_pattern_is_a_glob_on_path_and_query():
+    products = template('/p/*')
+    assert products.matches('https://shop.example.com/p/123')
+    assert not products.matches('https://shop.example.com/cart')
+    assert not products.matches('https://shop.example.com/x/p/123')
+    assert template('/search?q=*').matches('https://shop.example.com/search?q=shoes')
+    assert template('/').matches('https://shop.example.com')
+    assert template(None).matches('https://shop.example.com/anything')
+
+
+@pytest.mark.parametrize('pattern', ['', 'x' * (MAX_URL_PATTERN + 1), 42])
+def test_url_pattern_is_validated(pattern):
+    with pytest.raises(ValueError):
+        template(pattern)
+
+
+def test_url_pattern_cannot_backtrack_for_long():
+    pathological = template('*a*a*a*a*a*a*a*a*a*a*b')
+    started = time.perf_counter()
+    assert not pathological.matches('https://shop.example.com/' + 'a' * 5000)
+    assert time.perf_counter() - started < 1
+
+
+@pytest.mark.parametrize('method, path', [
+    ('get', '/api/admin/templates'),
+    ('post', '/api/admin/templates'),
+    ('get', '/api/admin/templates/example'),
+    ('delete', '/api/admin/templates/example'),
+])
+def test_template_endpoints_need_the_admin_token(app_module, monkeypatch, method, path):
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'secret')
+    client = app_module.app.test_client()
+    assert getattr(client, method)(path).status_code == 401
+    assert getattr(client, method)(path, headers={'X-Admin-Token': 'secret'}).status_code != 401
+
+
+def test_admin_can_register_a_glob_template(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'secret')
+    client = app_module.app.test_client()
+    headers = {'X-Admin-Token': 'secret'}
+    spec = {'id': 'glob-shop', 'domains': ['shop.example.com'], 'urlPattern': '/p/*', 'fields': {'price': '.price'}}
+    assert client.post('/api/admin/templates', json=spec, headers=headers).status_code == 201
+    spec['urlPattern'] = '(a+)+' * 100
+    assert client.post('/api/admin/templates', json=spec, headers=headers).status_code == 400
+    assert client.delete('/api/admin/templates/glob-shop', headers=headers).status_code == 200
@@ -0,0 +1,117 @@
+import json
+import time
+
+import pytest
+
+import snapshots
+from snapshots import FileSnapshotBackend, SnapshotStore, SnapshotWriter, CODEC_ZLIB, CODEC_ZSTD_DICT_ID
+
+
+def page(i):
+    return f'<html><body><h1>Product {i}</h1>' + ''.join(
+        f'<div class="row"><span class="label">Spec {j}</span><span class="value">{i * j}</span></div>' for j in range(40)
+    ) + '</body></html>'
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(FileSnapshotBackend(str(tmp_path)))
+
+
+def result(i=1, **extra):
+    return dict({'url': f'https://shop.test/p/{i}', 'title': f'Product {i}', 'productInfo': {'price': '$10'}}, **extra)
+
+
+def test_html_and_result_round_trip(store):
+    record = store.save('https://shop.test/p/1', 'shop.test', page(1), result(id='h1', scrapedAt='2024-01-01T00:00:00'))
+    assert store.load_html(record) == page(1)
+    assert store.load_result(record) == result(id='h1', scrapedAt='2024-01-01T00:00:00')
+
+
+def test_identical_pages_and_results_are_stored_once(store):
+    first = store.save('https://shop.test/p/1', 'shop.test', page(1), result(id='a', scrapedAt='2024-01-01T00:00:00'))
+    second = store.save('https://shop.test/p/1', 'shop.test', page(1),
+                        result(id='b', scrapedAt='2024-01-02T00:00:00', renderStats={'blocked': 3}))
+    # Per-scrape keys live on the record, so the same extraction hashes the same
+    assert first['resultKey'] == second['resultKey']
+    assert first['htmlKey'] == second['htmlKey']
+    assert store.stats()['blobsDeduplicated'] == 2
+    assert store.load_result(second)['id'] == 'b'
+    assert store.load_result(second)['renderStats'] == {'blocked': 3}
+
+
+def test_zlib_blobs_decode_without_zstandard(store, monkeypatch):
+    monkeypatch.setattr(snapshots, 'zstandard', None)
+    record = store.save('https://shop.test/p/2', 'shop.test', page(2), result(2))
+    assert store.backend.get_blob(record['htmlKey'])[0] == CODEC_ZLIB
+    assert store.load_html(record) == page(2)
+
+
+def test_retraining_keeps_old_blobs_readable(store):
+    pytest.importorskip('zstandard')
+    for i in range(40):
+        store.save(f'https://shop.test/p/{i}', 'shop.test', page(i), result(i))
+    assert store.train_dictionary('shop.test', dict_size=4096)
+    first_dict = store.backend.get_dictionary_id('shop.test')
+    old = store.save('https://shop.test/p/100', 'shop.test', page(100), result(100))
+    assert store.backend.get_blob(old['htmlKey'])[0] == CODEC_ZSTD_DICT_ID
+
+    for i in range(200, 260):
+        store.save(f'https://shop.test/p/{i}', 'shop.test', page(i) * 2, result(i))
+    assert store.train_dictionary('shop.test', dict_size=2048)
+    assert store.backend.get_dictionary_id('shop.test') != first_dict
+    new = store.save('https://shop.test/p/300', 'shop.test', page(300), result(300))
+    assert store.backend.get_blob(new['htmlKey'])[1:33].hex() == store.backend.get_dictionary_id('shop.test')
+
+    # A fresh process (no cached dictionaries) still reads blobs written with either one
+    reader = SnapshotStore(FileSnapshotBackend(store.backend.root))
+    assert reader.load_html(old) == page(100)
+    assert reader.load_html(new) == page(300)
+
+
+def test_other_processes_pick_up_a_new_dictionary(store, monkeypatch):
+    pytest.importorskip('zstandard')
+    other = SnapshotStore(FileSnapshotBackend(store.backend.root))
+    assert other._current_dictionary('shop.test') is None
+    for i in range(40):
+        store.save(f'https://shop.test/p/{i}', 'shop.test', page(i), result(i))
+    store.train_dictionary('shop.test', dict_size=4096)
+    monkeypatch.setattr(snapshots, '_DICT_TTL', 0)
+    assert other._current_dictionary('shop.test')[0] == store.backend.get_dictionary_id('shop.test')
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_writer_saves_in_the_background(store):
+    writer = SnapshotWriter(store)
+    item = result(1, id='h1')
+    assert writer.add('https://shop.test/p/1', 'shop.test', page(1), item)
+    item['title'] = 'changed after enqueueing'
+    writer.close()
+    records = list(store.backend.iter_records())
+    assert len(records) == 1
+    assert store.load_result(records[0])['title'] == 'Product 1'
+    assert writer.stats()['saved'] == 1
+
+
+def test_writer_drops_beyond_its_bounds(store, monkeypatch):
+    writer = SnapshotWriter(store, max_queued=2)
+    release = []
+    monkeypatch.setattr(store, 'save', lambda *args: wait_for(lambda: release, 10))
+    for i in range(5):
+        writer.add(f'https://shop.test/p/{i}', 'shop.test', page(i), result(i))
+    assert writer.stats()['dropped'] >= 2
+    release.append(True)
+    writer.close()
+    assert writer.stats()['queued'] == 0
+
+
+def test_unknown_codecs_are_rejected(store):
+    store.backend.put_blob('legacy', bytes([2, 9]) + b'shop.test' + b'payload')
+    with pytest.raises(RuntimeError, match='Unknown snapshot codec 2'):
+        store._get('legacy')
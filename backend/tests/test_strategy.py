@@ -0,0 +1,57 @@
+import time
+
+from strategy import StrategyTable, domain_of
+
+
+def teach(table, domain='spa.test', failures=3):
+    for _ in range(failures):
+        table.record(domain, 'static', False, 100)
+    table.record(domain, 'playwright', True, 900)
+
+
+def test_domain_of():
+    assert domain_of('https://Shop.Example.com:8443/p?q=1') == 'shop.example.com'
+
+
+def test_unknown_domains_get_the_default_order():
+    table = StrategyTable(reprobe_probability=0)
+    assert table.plan('new.test') == {'order': ['static', 'playwright', 'selenium'], 'reason': 'default'}
+
+
+def test_engine_that_keeps_failing_is_skipped_once_a_later_one_works():
+    table = StrategyTable(reprobe_probability=0)
+    teach(table)
+    assert table.plan('spa.test') == {'order': ['playwright', 'selenium'], 'reason': 'learned'}
+
+
+def test_failures_alone_do_not_skip_an_engine():
+    table = StrategyTable(reprobe_probability=0)
+    for _ in range(5):
+        table.record('down.test', 'static', False, 100)
+    assert table.plan('down.test')['reason'] == 'default'
+
+
+def test_skipped_engines_are_reprobed_after_a_while():
+    table = StrategyTable(reprobe_probability=0, reprobe_after=60)
+    teach(table)
+    table._domains['spa.test']['static'].last_attempt = time.time() - 61
+    assert table.plan('spa.test')['reason'] == 'reprobe'
+    assert table.plan('spa.test', allow_reprobe=False)['reason'] == 'learned'
+
+
+def test_reset_forgets_a_domain():
+    table = StrategyTable(reprobe_probability=0)
+    teach(table)
+    assert table.reset('spa.test')
+    assert not table.reset('spa.test')
+    assert table.plan('spa.test')['reason'] == 'default'
+
+
+def test_table_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'strategies.json')
+    table = StrategyTable(path, reprobe_probability=0, save_interval=0)
+    teach(table)
+    table.save()
+    restored = StrategyTable(path, reprobe_probability=0)
+    assert restored.plan('spa.test')['order'] == ['playwright', 'selenium']
+    assert restored.snapshot()['domains']['spa.test']['engines']['static']['failures'] == 3
@@ -0,0 +1,13 @@
+"""WSGI entry point for production.
+
+Usage (from backend/):
+    gunicorn -c gunicorn.conf.py
+
+gunicorn.conf.py runs a single worker process (crawls, jobs, the strategy
+table and metrics are per-process state) with a thread per request, and
+parsing and extraction use all cores through the extraction pool. The app
+is imported once in the master (preload); the worker opens its own database
+connection and browser pool after the fork and closes them again on
+graceful shutdown.
+"""
+from app import app  # noqa: F401